@@ -0,0 +1,63 @@
+"""
+Figure captioning throughput (images/min) against a local stand-in for the vision endpoint.
+
+The fake endpoint takes ``--request-latency`` plus ``--per-image-latency`` for
+each image in a request, so packing images amortises the fixed per-request cost.
+
+Usage: python benchmarks/bench_captioning.py --images 64 --request-latency 2 --per-image-latency 0.3
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "rag"))
+
+from claude_llm import Claude  # noqa: E402
+from fake_anthropic import FakeAnthropicServer  # noqa: E402
+from image_captioner import ImageCaptioner  # noqa: E402
+from image_store import ImageStore  # noqa: E402
+from stubs import caption_responder  # noqa: E402
+from synthetic_pdf import _jpeg  # noqa: E402
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--images", type=int, default=64)
+    parser.add_argument("--request-latency", type=float, default=2.0)
+    parser.add_argument("--per-image-latency", type=float, default=0.3)
+    args = parser.parse_args()
+
+    configs = [(1, 1), (1, 4), (4, 1), (4, 4), (8, 4)]
+    with tempfile.TemporaryDirectory() as root:
+        image_store = ImageStore(root)
+        refs = [image_store.put(_jpeg(seed, 128), "jpeg") for seed in range(args.images)]
+
+        def responder(body):
+            images = sum(1 for block in body["messages"][-1]["content"] if block.get("type") == "image")
+            time.sleep(args.per_image_latency * images)
+            return caption_responder(body)
+
+        with FakeAnthropicServer(responder=responder, first_token_latency=args.request_latency, token_interval=0) as server:
+            claude = Claude("claude-3-5-sonnet-20240620", api_key="benchmark", base_url=server.base_url)
+            print(f"{args.images} images, {args.request_latency}s/request + {args.per_image_latency}s/image")
+            print(f"{'workers':>7} {'per request':>11} {'requests':>8} {'seconds':>8} {'images/min':>10}")
+            for workers, per_request in configs:
+                captioner = ImageCaptioner(claude, image_store, cache_path=os.path.join(root, f"cache-{workers}-{per_request}.sqlite3"),
+                                           max_workers=workers, images_per_request=per_request)
+                requests_before = len(server.requests)
+                start = time.perf_counter()
+                captions = captioner.caption(refs)
+                elapsed = time.perf_counter() - start
+                assert len(captions) == len(refs)
+                print(f"{workers:>7} {per_request:>11} {len(server.requests) - requests_before:>8} "
+                      f"{elapsed:>8.2f} {len(refs) / elapsed * 60:>10.0f}")
+
+            start = time.perf_counter()
+            captioner.caption(refs)
+            print(f"cached re-run: {time.perf_counter() - start:.3f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,104 @@
+"""
+Index build time and retrieval recall@k for page-per-Document vs structure-aware chunking.
+
+Questions come from a synthetic prescribing guideline with known answers; a
+question counts as recalled at k if one of the top k retrieved nodes contains
+its answer. Embeddings default to an offline hashing model so results are
+reproducible; pass --embed-model local:BAAI/bge-small-en-v1.5 for the real one.
+Also times adding one document to a CorpusIndex against rebuilding it.
+
+Usage: python benchmarks/bench_chunking.py --drugs 30 --documents 5 --chunk-tokens 128 256 512
+"""
+import argparse
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "rag"))
+
+from llama_index.core import Document, Settings, VectorStoreIndex  # noqa: E402
+from llama_index.core.embeddings import resolve_embed_model  # noqa: E402
+
+from chunker import make_chunker  # noqa: E402
+from context_packer import estimate_tokens  # noqa: E402
+from corpus import CorpusIndex  # noqa: E402
+from pdf_extraction import iter_pdf_pages  # noqa: E402
+from stubs import HashingEmbedding  # noqa: E402
+from synthetic_pdf import make_guideline_pdf  # noqa: E402
+
+KS = [1, 3, 5]
+
+
+def build(pdf_bytes: bytes, source: str, chunking: str, chunk_tokens: int) -> VectorStoreIndex:
+    """What iter_healthcare_document does for text (it is not imported here because it needs Streamlit)."""
+    pages = [(page, text) for page, text, _ in iter_pdf_pages(pdf_bytes, workers=1)]
+    chunker = make_chunker(chunking, chunk_tokens)
+    if chunker:
+        documents = list(chunker.iter_chunks(pages, source))
+    else:
+        documents = [Document(text=text, metadata={"source": source, "page": page}) for page, text in pages if text.strip()]
+    return VectorStoreIndex.from_documents(documents)
+
+
+def evaluate(index: VectorStoreIndex, qa) -> dict:
+    retriever = index.as_retriever(similarity_top_k=max(KS))
+    hits = {k: 0 for k in KS}
+    tokens = 0
+    for question, answer in qa:
+        nodes = retriever.retrieve(question)
+        for k in KS:
+            hits[k] += any(answer in n.node.get_content() for n in nodes[:k])
+        tokens += sum(estimate_tokens(n.node.get_content()) for n in nodes[:3])
+    return {"recall": {k: hits[k] / len(qa) for k in KS}, "tokens@3": tokens / len(qa)}
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--drugs", type=int, default=30, help="Sections (and 3x questions) per document")
+    parser.add_argument("--documents", type=int, default=5, help="Documents in the corpus")
+    parser.add_argument("--chunk-tokens", type=int, nargs="+", default=[128, 256, 512])
+    parser.add_argument("--embed-model", default=None)
+    args = parser.parse_args()
+
+    Settings.embed_model = resolve_embed_model(args.embed_model) if args.embed_model else HashingEmbedding()
+    pdf_bytes, qa = make_guideline_pdf(drugs=args.drugs)
+
+    print(f"{len(qa)} questions over {args.drugs} sections")
+    print(f"{'chunking':>15} {'nodes':>6} {'build s':>8} " + " ".join(f"{f'R@{k}':>6}" for k in KS) + f" {'tokens@3':>9}")
+    for chunking, chunk_tokens in [("page", 0)] + [("structure", tokens) for tokens in args.chunk_tokens]:
+        start = time.perf_counter()
+        index = build(pdf_bytes, "guideline.pdf", chunking, chunk_tokens)
+        elapsed = time.perf_counter() - start
+        result = evaluate(index, qa)
+        recalls = " ".join(f"{result['recall'][k]:>6.0%}" for k in KS)
+        label = f"{chunking}/{chunk_tokens}" if chunk_tokens else chunking
+        print(f"{label:>15} {len(index.index_struct.nodes_dict):>6} {elapsed:>8.2f} {recalls} {result['tokens@3']:>9.0f}")
+
+    # Each corpus document is a guideline with different doses; indexes are built once, as the IndexStore would
+    indexes = {f"doc{i}": build(make_guideline_pdf(drugs=args.drugs, seed=i)[0], f"doc{i}.pdf", "structure",
+                                args.chunk_tokens[0]) for i in range(args.documents)}
+    corpus = CorpusIndex()
+    for key, index in list(indexes.items())[:-1]:
+        corpus.add(key, index, source=f"{key}.pdf")
+    last_key, last_index = list(indexes.items())[-1]
+    add_times, remove_times = [], []
+    for _ in range(5):
+        start = time.perf_counter()
+        corpus.add(last_key, last_index, source=f"{last_key}.pdf")
+        add_times.append(time.perf_counter() - start)
+        start = time.perf_counter()
+        corpus.remove(last_key)
+        remove_times.append(time.perf_counter() - start)
+    add_time, remove_time = statistics.median(add_times), statistics.median(remove_times)
+    start = time.perf_counter()
+    rebuilt = CorpusIndex()
+    for key, index in indexes.items():
+        rebuilt.add(key, index)
+    rebuild_time = time.perf_counter() - start
+    print(f"\ncorpus of {args.documents} documents: add one {add_time * 1000:.1f} ms, remove one {remove_time * 1000:.1f} ms, "
+          f"rebuild {rebuild_time * 1000:.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,78 @@
+"""
+Chunks/sec of embedding on CPU: llama-index's default HuggingFace embedding vs EmbeddingService
+(length-sorted batches, thread tuning, optional ONNX int8) and its persistent cache.
+
+Chunks are structure-aware chunks of synthetic guidelines, so lengths vary as
+in real documents. Cosine similarity to the baseline vectors is reported to
+show that batching and quantization keep the embeddings equivalent.
+Needs sentence-transformers (and optimum[onnxruntime] for --onnx).
+
+Usage: python benchmarks/bench_embedding.py --chunks 2000 --batch-size 32 --threads 4 --onnx
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "rag"))
+
+import numpy as np  # noqa: E402
+from llama_index.core.embeddings import resolve_embed_model  # noqa: E402
+
+from chunker import StructureChunker  # noqa: E402
+from embedding_service import DEFAULT_MODEL, EmbeddingService, make_backend  # noqa: E402
+from pdf_extraction import iter_pdf_pages  # noqa: E402
+from synthetic_pdf import make_guideline_pdf  # noqa: E402
+
+
+def chunk_texts(count: int) -> list:
+    texts = []
+    seed = 0
+    chunker = StructureChunker(chunk_tokens=256)
+    while len(texts) < count:
+        pdf_bytes, _ = make_guideline_pdf(seed=seed)
+        pages = [(page, text) for page, text, _ in iter_pdf_pages(pdf_bytes, workers=1)]
+        texts += [chunk.get_content(metadata_mode="embed") for chunk in chunker.iter_chunks(pages, f"doc{seed}.pdf")]
+        seed += 1
+    return texts[:count]
+
+
+def timed(label: str, embed, texts: list, baseline=None) -> np.ndarray:
+    start = time.perf_counter()
+    vectors = np.asarray(embed(texts), dtype=np.float32)
+    elapsed = time.perf_counter() - start
+    agreement = ""
+    if baseline is not None:
+        cosine = np.sum(vectors * baseline, axis=1) / (np.linalg.norm(vectors, axis=1) * np.linalg.norm(baseline, axis=1))
+        agreement = f"  min cosine vs baseline {cosine.min():.4f}"
+    print(f"{label:<34} {len(texts) / elapsed:8.1f} chunks/s{agreement}")
+    return vectors
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--chunks", type=int, default=1000)
+    parser.add_argument("--batch-size", type=int, default=32)
+    parser.add_argument("--threads", type=int, default=os.cpu_count())
+    parser.add_argument("--onnx", action="store_true", help="Also benchmark the ONNX Runtime int8 backend")
+    args = parser.parse_args()
+
+    texts = chunk_texts(args.chunks)
+    print(f"{len(texts)} chunks, mean {np.mean([len(t) for t in texts]):.0f} chars, {args.threads} threads\n")
+
+    baseline_model = resolve_embed_model(f"local:{DEFAULT_MODEL}")
+    baseline = timed("llama-index default", baseline_model.get_text_embedding_batch, texts)
+
+    with tempfile.TemporaryDirectory() as root:
+        service = EmbeddingService(make_backend("torch", threads=args.threads), embed_batch_size=args.batch_size,
+                                   cache_path=os.path.join(root, "embeddings.sqlite3"))
+        timed(f"service torch, batch {args.batch_size}", service.get_text_embedding_batch, texts, baseline)
+        timed("service, warm cache", service.get_text_embedding_batch, texts, baseline)
+        if args.onnx:
+            onnx = EmbeddingService(make_backend("onnx", threads=args.threads), embed_batch_size=args.batch_size)
+            timed(f"service onnx int8, batch {args.batch_size}", onnx.get_text_embedding_batch, texts, baseline)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,45 @@
+"""
+Wall-clock comparison of the serial and concurrent healthcare query pipelines.
+
+Usage: python benchmarks/bench_healthcare_query.py --latency 0.5 --runs 5
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "rag"))
+
+from healthcare_utils import process_healthcare_query, aprocess_healthcare_query  # noqa: E402
+from stubs import StubClaude  # noqa: E402
+
+QUERY = "What is the first-line treatment for type 2 diabetes?"
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--latency", type=float, default=0.5, help="Simulated seconds per Claude call")
+    parser.add_argument("--runs", type=int, default=5)
+    args = parser.parse_args()
+
+    claude = StubClaude(latency=args.latency)
+
+    start = time.perf_counter()
+    for _ in range(args.runs):
+        process_healthcare_query(QUERY, claude)
+    serial = (time.perf_counter() - start) / args.runs
+
+    start = time.perf_counter()
+    for _ in range(args.runs):
+        asyncio.run(aprocess_healthcare_query(QUERY, claude))
+    concurrent = (time.perf_counter() - start) / args.runs
+
+    print(f"model latency per call: {args.latency:.3f}s")
+    print(f"serial:     {serial:.3f}s/query ({serial / args.latency:.1f}x latency)")
+    print(f"concurrent: {concurrent:.3f}s/query ({concurrent / args.latency:.1f}x latency)")
+    print(f"speedup:    {serial / concurrent:.2f}x")
+
+
+if __name__ == "__main__":
+    main()
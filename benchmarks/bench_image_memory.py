@@ -0,0 +1,95 @@
+"""
+Memory held by image Documents: base64 PNGs in metadata (old) vs image store references (new).
+
+Usage: python benchmarks/bench_image_memory.py --pages 100 --images-per-page 4 --image-size 512
+"""
+import argparse
+import base64
+import io
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "rag"))
+
+import fitz  # noqa: E402
+from llama_index.core import Document  # noqa: E402
+from PIL import Image  # noqa: E402
+
+from image_store import ImageStore  # noqa: E402
+from pdf_extraction import iter_pdf_pages  # noqa: E402
+from synthetic_pdf import make_pdf  # noqa: E402
+
+
+def legacy_documents(pdf_bytes: bytes, source: str):
+    """Image Documents as the pre-image-store document processor built them."""
+    documents = []
+    pdf_document = fitz.open(stream=pdf_bytes, filetype="pdf")
+    images = []
+    for page in pdf_document:
+        for img in page.get_images(full=True):
+            image = Image.open(io.BytesIO(pdf_document.extract_image(img[0])["image"]))
+            buffered = io.BytesIO()
+            image.save(buffered, format="PNG")
+            images.append(base64.b64encode(buffered.getvalue()).decode())
+    for i, img in enumerate(images):
+        documents.append(Document(text=f"Image {i+1} from {source}",
+                                  metadata={"source": source, "type": "image", "image": img}))
+    return documents
+
+
+def store_documents(pdf_bytes: bytes, source: str, image_store: ImageStore):
+    documents = []
+    seen = set()
+    for page_number, _, refs in iter_pdf_pages(pdf_bytes, image_store=image_store, workers=1):
+        for ref in refs:
+            if ref not in seen:
+                seen.add(ref)
+                documents.append(Document(text=f"Image {len(seen)} from {source}",
+                                          metadata={"source": source, "page": page_number, "type": "image",
+                                                    "image_ref": ref, "media_type": ImageStore.media_type(ref)}))
+    return documents
+
+
+def measure(build):
+    tracemalloc.start()
+    start = time.perf_counter()
+    documents = build()
+    elapsed = time.perf_counter() - start
+    retained, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return documents, retained, peak, elapsed
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--pages", type=int, default=100)
+    parser.add_argument("--images-per-page", type=int, default=4)
+    parser.add_argument("--image-size", type=int, default=512)
+    parser.add_argument("--distinct-images", type=int, default=None, help="Repeat images across pages, like logos")
+    args = parser.parse_args()
+
+    pdf_bytes = make_pdf(args.pages, images_per_page=args.images_per_page, image_size=args.image_size,
+                         distinct_images=args.distinct_images)
+    print(f"synthetic PDF: {args.pages} pages x {args.images_per_page} images of {args.image_size}px, "
+          f"{len(pdf_bytes) / 1024 ** 2:.1f} MB")
+
+    with tempfile.TemporaryDirectory() as root:
+        image_store = ImageStore(root)
+        runs = [
+            ("base64 PNG in metadata", lambda: legacy_documents(pdf_bytes, "bench.pdf")),
+            ("image store references", lambda: store_documents(pdf_bytes, "bench.pdf", image_store)),
+        ]
+        for name, build in runs:
+            documents, retained, peak, elapsed = measure(build)
+            metadata_bytes = sum(len(str(doc.metadata)) for doc in documents)
+            print(f"{name:<24} {len(documents):5d} docs  metadata {metadata_bytes / 1024 ** 2:8.2f} MB  "
+                  f"retained {retained / 1024 ** 2:8.2f} MB  peak {peak / 1024 ** 2:8.2f} MB  {elapsed:6.2f}s")
+        stored = sum(f.stat().st_size for f in image_store.root.rglob("*") if f.is_file())
+        print(f"image store on disk: {stored / 1024 ** 2:.2f} MB")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,76 @@
+"""
+Pages/sec of PDF ingestion: the old two-pass PyPDF2 + PyMuPDF loop vs the sharded single-pass pipeline.
+
+Usage: python benchmarks/bench_ingestion.py --pages 500 --images-per-page 1 --workers 4
+"""
+import argparse
+import base64
+import io
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "rag"))
+
+import fitz  # noqa: E402
+from PIL import Image  # noqa: E402
+from PyPDF2 import PdfReader  # noqa: E402
+
+from image_store import ImageStore  # noqa: E402
+from pdf_extraction import iter_pdf_pages  # noqa: E402
+from synthetic_pdf import make_pdf  # noqa: E402
+
+
+def legacy_extract(pdf_bytes: bytes, include_vision: bool) -> int:
+    """The pre-sharding implementation of process_healthcare_document, minus the st.write calls."""
+    text_list = []
+    image_list = []
+    reader = PdfReader(io.BytesIO(pdf_bytes))
+    for page in reader.pages:
+        text_list.append(page.extract_text())
+    if include_vision:
+        pdf_document = fitz.open(stream=pdf_bytes, filetype="pdf")
+        for page in pdf_document:
+            for img in page.get_images(full=True):
+                image = Image.open(io.BytesIO(pdf_document.extract_image(img[0])["image"]))
+                buffered = io.BytesIO()
+                image.save(buffered, format="PNG")
+                image_list.append(base64.b64encode(buffered.getvalue()).decode())
+    return len(text_list)
+
+
+def sharded_extract(pdf_bytes: bytes, include_vision: bool, workers: int, pages_per_shard: int) -> int:
+    with tempfile.TemporaryDirectory() as root:
+        image_store = ImageStore(root) if include_vision else None
+        return sum(1 for _ in iter_pdf_pages(pdf_bytes, image_store=image_store, workers=workers,
+                                             pages_per_shard=pages_per_shard))
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--pages", type=int, default=500)
+    parser.add_argument("--images-per-page", type=int, default=1)
+    parser.add_argument("--workers", type=int, default=None, help="Default: cpu_count - 1, at most 8")
+    parser.add_argument("--pages-per-shard", type=int, default=32)
+    parser.add_argument("--no-vision", action="store_true")
+    args = parser.parse_args()
+    include_vision = not args.no_vision
+
+    pdf_bytes = make_pdf(args.pages, images_per_page=args.images_per_page)
+    print(f"synthetic PDF: {args.pages} pages, {args.images_per_page} image(s)/page, {len(pdf_bytes) / 1024 ** 2:.1f} MB")
+
+    runs = [
+        ("legacy (PyPDF2 + PyMuPDF)", lambda: legacy_extract(pdf_bytes, include_vision)),
+        ("single pass, 1 process", lambda: sharded_extract(pdf_bytes, include_vision, 1, args.pages_per_shard)),
+        ("single pass, sharded", lambda: sharded_extract(pdf_bytes, include_vision, args.workers, args.pages_per_shard)),
+    ]
+    for name, run in runs:
+        start = time.perf_counter()
+        pages = run()
+        elapsed = time.perf_counter() - start
+        print(f"{name:<28} {elapsed:7.2f}s  {pages / elapsed:8.1f} pages/s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,102 @@
+"""
+Time until an upload is searchable: inline indexing in every session vs the shared IngestionQueue.
+
+Several sessions upload the same PDF at once. Inline, each session parses
+and embeds the whole file on its own script thread (as vector_store() did)
+before it can query; with the queue the file is ingested once, and every
+session can query as soon as the first batch of pages is indexed.
+Embedding cost is simulated with a per-chunk delay on an offline embedding.
+
+Usage: python benchmarks/bench_ingestion_queue.py --pages 200 --sessions 4 --batch-size 64 --embed-ms 2
+"""
+import argparse
+import os
+import statistics
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "rag"))
+
+from llama_index.core import VectorStoreIndex  # noqa: E402
+from llama_index.core.bridge.pydantic import Field  # noqa: E402
+
+from corpus import CorpusIndex  # noqa: E402
+from document_processor import iter_healthcare_document  # noqa: E402
+from index_store import index_config  # noqa: E402
+from ingestion import IngestionQueue, follow  # noqa: E402
+from stubs import HashingEmbedding  # noqa: E402
+from synthetic_pdf import make_pdf  # noqa: E402
+
+
+class SlowEmbedding(HashingEmbedding):
+    """HashingEmbedding that takes ``delay`` seconds per text, like a model would."""
+
+    delay: float = Field(default=0.002)
+
+    def _get_text_embedding(self, text: str):
+        time.sleep(self.delay)
+        return super()._get_text_embedding(text)
+
+
+def run_sessions(label: str, session, sessions: int) -> None:
+    results = [None] * sessions
+
+    def target(i):
+        start = time.perf_counter()
+        results[i] = [t - start for t in session()]
+
+    threads = [threading.Thread(target=target, args=(i,)) for i in range(sessions)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    first = [r[0] for r in results]
+    complete = [r[1] for r in results]
+    print(f"{label:<16} first searchable: mean {statistics.mean(first):6.2f} s, max {max(first):6.2f} s   "
+          f"complete: mean {statistics.mean(complete):6.2f} s, max {max(complete):6.2f} s")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--pages", type=int, default=200)
+    parser.add_argument("--sessions", type=int, default=4)
+    parser.add_argument("--batch-size", type=int, default=64)
+    parser.add_argument("--workers", type=int, default=2)
+    parser.add_argument("--embed-ms", type=float, default=2.0, help="Simulated embedding time per chunk")
+    args = parser.parse_args()
+
+    embed_model = SlowEmbedding(delay=args.embed_ms / 1000)
+    pdf_bytes = make_pdf(args.pages)
+
+    def documents(progress=None):
+        return iter_healthcare_document(pdf_bytes, "guideline.pdf", include_vision=False, progress=progress)
+
+    def inline():
+        VectorStoreIndex.from_documents(list(documents()), embed_model=embed_model)
+        elapsed = time.perf_counter()
+        return [elapsed, elapsed]
+
+    queue = IngestionQueue(workers=args.workers, batch_size=args.batch_size, embed_model=embed_model)
+
+    def queued():
+        corpus, followed, first = CorpusIndex(embed_model=embed_model), {}, None
+        job = queue.submit(pdf_bytes, "guideline.pdf", documents, index_config(include_vision=False))
+        while True:
+            # Mirrors the app's polling rerun, at a finer interval
+            finished = job.wait(0.05)
+            follow(corpus, "guideline", job, followed)
+            if first is None and len(corpus):
+                first = time.perf_counter()
+            if finished:
+                return [first, time.perf_counter()]
+
+    print(f"{args.pages} pages, {args.sessions} concurrent sessions, {args.embed_ms} ms/chunk embedding, "
+          f"batches of {args.batch_size}\n")
+    run_sessions("Inline", inline, args.sessions)
+    run_sessions("IngestionQueue", queued, args.sessions)
+    queue.shutdown()
+
+
+if __name__ == "__main__":
+    main()
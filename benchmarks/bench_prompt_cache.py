@@ -0,0 +1,104 @@
+"""
+Prompt caching over a long document session: time-to-first-token and input cost per turn.
+
+One conversation asks ``--turns`` questions about a synthetic guideline
+through RAGService, once with ``prompt_cache`` off (all the context in the
+system prompt, re-sent and re-processed every turn) and once on (pinned
+context and earlier turns as a cached prefix, each turn's own context last).
+Claude is the local fake Anthropic server, which simulates the prompt cache
+and processes uncached prompt tokens at ``--input-tokens-per-second``.
+
+Input cost is in uncached-token equivalents at Anthropic's prices: cache
+writes cost 1.25x and cache reads 0.1x an uncached input token.
+
+Usage: python benchmarks/bench_prompt_cache.py --turns 8 --input-tokens-per-second 5000
+"""
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+import time
+from typing import Any, Dict, List
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "rag"))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from fake_anthropic import FakeAnthropicServer  # noqa: E402
+from image_store import ImageStore  # noqa: E402
+from service import RAGService, ServiceConfig  # noqa: E402
+from stubs import BASE_ANSWER, HashingEmbedding  # noqa: E402
+from synthetic_pdf import make_guideline_pdf  # noqa: E402
+
+CACHE_WRITE_PRICE = 1.25
+CACHE_READ_PRICE = 0.1
+
+
+def input_cost(usage: Dict[str, int]) -> float:
+    return (usage["input_tokens"] + CACHE_WRITE_PRICE * usage["cache_creation_input_tokens"]
+            + CACHE_READ_PRICE * usage["cache_read_input_tokens"])
+
+
+async def session(service: RAGService, questions: List[str]) -> List[Dict[str, Any]]:
+    """Per-turn first-token seconds and token usage of one conversation."""
+    usage = service.claude().usage
+    history: List[Dict[str, Any]] = []
+    turns = []
+    for question in questions:
+        before = usage.to_dict()
+        start = time.perf_counter()
+        first_token = None
+        chunks = []
+        async for delta in service.astream_chat(question, history):
+            if first_token is None:
+                first_token = time.perf_counter() - start
+            chunks.append(delta)
+        after = usage.to_dict()
+        turns.append({"ttft": first_token, **{key: after[key] - before[key] for key in
+                                               ("input_tokens", "cache_creation_input_tokens", "cache_read_input_tokens")}})
+        history += [{"role": "user", "content": question}, {"role": "assistant", "content": "".join(chunks)}]
+    return turns
+
+
+def run(prompt_cache: bool, args: argparse.Namespace, pdf_bytes: bytes, questions: List[str]) -> List[Dict[str, Any]]:
+    with FakeAnthropicServer(reply=BASE_ANSWER, first_token_latency=args.first_token_latency, token_interval=0,
+                             input_tokens_per_second=args.input_tokens_per_second) as server, \
+            tempfile.TemporaryDirectory() as tmp:
+        service = RAGService(ServiceConfig(prompt_cache=prompt_cache), HashingEmbedding(), image_store=ImageStore(tmp),
+                             api_key="bench", base_url=server.base_url)
+        service.ingest(pdf_bytes, "guideline.pdf").wait()
+        try:
+            return asyncio.run(session(service, questions))
+        finally:
+            service.shutdown()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--turns", type=int, default=8, help="Questions in the conversation")
+    parser.add_argument("--drugs", type=int, default=30, help="Sections of the synthetic guideline")
+    parser.add_argument("--first-token-latency", type=float, default=0.1)
+    parser.add_argument("--input-tokens-per-second", type=float, default=5000.0,
+                        help="Fake Claude's rate for uncached prompt tokens")
+    args = parser.parse_args()
+
+    pdf_bytes, qa = make_guideline_pdf(drugs=args.drugs)
+    questions = [question for question, _ in qa[:args.turns]]
+    totals = {}
+    for label, prompt_cache in [("no cache", False), ("prompt cache", True)]:
+        turns = run(prompt_cache, args, pdf_bytes, questions)
+        print(f"\n{label}")
+        print(f"{'turn':>4} {'ttft ms':>8} {'uncached':>9} {'written':>8} {'read':>7} {'input cost':>11}")
+        for number, turn in enumerate(turns, 1):
+            print(f"{number:>4} {turn['ttft'] * 1000:8.0f} {turn['input_tokens']:9} "
+                  f"{turn['cache_creation_input_tokens']:8} {turn['cache_read_input_tokens']:7} {input_cost(turn):11.0f}")
+        totals[label] = (sum(turn["ttft"] for turn in turns[1:]) / max(1, len(turns) - 1),
+                         sum(input_cost(turn) for turn in turns))
+
+    print(f"\n{'':<14} {'mean ttft ms after turn 1':>26} {'total input cost':>17}")
+    for label, (ttft, cost) in totals.items():
+        print(f"{label:<14} {ttft * 1000:26.0f} {cost:17.0f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,102 @@
+"""
+Per-query CPU time of reranking: SentenceTransformerRerank as the app used it vs AdaptiveRerank.
+
+Candidates come from hybrid retrieval over a synthetic guideline with a known
+Q&A set, and a share of the questions is asked again (as users re-ask or
+regenerate), so the score cache is exercised. Recall@k after reranking shows
+that skipping and dynamic top_n do not cost answers. Uses the real
+cross-encoder when sentence-transformers is installed; --stub swaps in an
+offline scorer whose CPU cost grows with the padded batch like a transformer's.
+
+Usage: python benchmarks/bench_rerank.py --top-k 10 --repeat 0.3 --chunking page
+"""
+import argparse
+import copy
+import os
+import random
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "rag"))
+
+from llama_index.core import Document, QueryBundle, Settings, VectorStoreIndex  # noqa: E402
+from llama_index.core.schema import MetadataMode  # noqa: E402
+
+from chunker import make_chunker  # noqa: E402
+from corpus import CorpusIndex  # noqa: E402
+from hybrid_retriever import HybridRetriever  # noqa: E402
+from pdf_extraction import iter_pdf_pages  # noqa: E402
+from reranker import DEFAULT_RERANK_MODEL, MAX_LENGTH, AdaptiveRerank  # noqa: E402
+from stubs import HashingEmbedding, StubCrossEncoder  # noqa: E402
+from synthetic_pdf import make_guideline_pdf  # noqa: E402
+
+KS = [1, 3]
+
+
+def rerank_before(model, nodes, query: str, top_n: int):
+    """What SentenceTransformerRerank does: score every node on every turn and sort."""
+    scores = model.predict([(query, n.node.get_content(metadata_mode=MetadataMode.EMBED)) for n in nodes])
+    for node, score in zip(nodes, scores):
+        node.score = float(score)
+    return sorted(nodes, key=lambda n: -n.score)[:top_n]
+
+
+def run(label: str, rerank, workload) -> None:
+    cpu_times, hits = [], {k: 0 for k in KS}
+    for question, answer, candidates in workload:
+        nodes = copy.deepcopy(candidates)
+        start = time.process_time()
+        result = rerank(nodes, question)
+        cpu_times.append(time.process_time() - start)
+        for k in KS:
+            hits[k] += any(answer in n.node.get_content() for n in result[:k])
+    cpu_times.sort()
+    p95 = cpu_times[min(len(cpu_times) - 1, int(len(cpu_times) * 0.95))]
+    recalls = " ".join(f"R@{k} {hits[k] / len(workload):>4.0%}" for k in KS)
+    print(f"{label:<28} mean {statistics.mean(cpu_times) * 1000:7.2f} ms  p95 {p95 * 1000:7.2f} ms CPU/query  {recalls}")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--drugs", type=int, default=30)
+    parser.add_argument("--chunking", choices=["structure", "page"], default="structure")
+    parser.add_argument("--top-k", type=int, default=10)
+    parser.add_argument("--repeat", type=float, default=0.3, help="Share of questions asked a second time")
+    parser.add_argument("--stub", action="store_true", help="Use the offline stub cross-encoder")
+    args = parser.parse_args()
+
+    if args.stub:
+        model = StubCrossEncoder(max_length=MAX_LENGTH)
+    else:
+        from sentence_transformers import CrossEncoder
+        model = CrossEncoder(DEFAULT_RERANK_MODEL, max_length=MAX_LENGTH, device="cpu")
+
+    Settings.embed_model = HashingEmbedding()
+    pdf_bytes, qa = make_guideline_pdf(drugs=args.drugs)
+    pages = [(page, text) for page, text, _ in iter_pdf_pages(pdf_bytes, workers=1)]
+    chunker = make_chunker(args.chunking)
+    documents = list(chunker.iter_chunks(pages, "guideline.pdf")) if chunker else [
+        Document(text=text, metadata={"source": "guideline.pdf", "page": page}) for page, text in pages]
+    corpus = CorpusIndex()
+    corpus.add("guideline", VectorStoreIndex.from_documents(documents), source="guideline.pdf")
+    retriever = HybridRetriever(corpus, similarity_top_k=args.top_k)
+
+    rng = random.Random(0)
+    questions = qa + rng.sample(qa, int(len(qa) * args.repeat))
+    rng.shuffle(questions)
+    workload = [(question, answer, retriever.retrieve(question)) for question, answer in questions]
+    print(f"{len(workload)} queries ({len(qa)} distinct), {args.top_k} candidates each, {args.chunking} chunks, "
+          f"{'stub' if args.stub else DEFAULT_RERANK_MODEL}\n")
+
+    run("SentenceTransformerRerank", lambda nodes, q: rerank_before(model, nodes, q, args.top_k), workload)
+    scorer = model if args.stub else (lambda pairs: model.predict(pairs, batch_size=len(pairs), show_progress_bar=False))
+    adaptive = AdaptiveRerank(scorer, top_n=args.top_k)
+    run("AdaptiveRerank", lambda nodes, q: adaptive.postprocess_nodes(nodes, QueryBundle(q)), workload)
+    stats = adaptive.stats()
+    print(f"\nAdaptiveRerank: {stats['reranks']} reranked, {stats['skipped']} skipped, {stats['pairs_scored']} pairs scored, "
+          f"{stats['cache_hits']} cache hits")
+
+
+if __name__ == "__main__":
+    main()
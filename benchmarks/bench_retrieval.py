@@ -0,0 +1,137 @@
+"""
+Offline retrieval eval: recall@k and latency of vector, BM25 and hybrid (RRF) retrieval.
+
+Recall is measured on a synthetic prescribing guideline with a known Q&A set
+(a question counts as recalled at k if one of the top k nodes contains its
+answer), with the default in-memory vector store as the baseline. Embeddings
+default to an offline hashing model; pass --embed-model
+local:BAAI/bge-small-en-v1.5 to evaluate the real one. Latency at scale is
+measured on --chunks synthetic chunks split over --documents segments, with
+random unit vectors and the query embedding precomputed, so it times retrieval
+alone.
+
+Usage: python benchmarks/bench_retrieval.py --chunks 50000 --documents 20 --top-k 10
+"""
+import argparse
+import os
+import random
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "rag"))
+
+import numpy as np  # noqa: E402
+from llama_index.core import Settings, VectorStoreIndex  # noqa: E402
+from llama_index.core.embeddings import resolve_embed_model  # noqa: E402
+from llama_index.core.indices.query.embedding_utils import get_top_k_embeddings  # noqa: E402
+
+from chunker import StructureChunker  # noqa: E402
+from corpus import CorpusIndex  # noqa: E402
+from hybrid_retriever import RETRIEVAL_MODES, HybridRetriever, SearchSegment, hybrid_search  # noqa: E402
+from lexical_index import LexicalIndex  # noqa: E402
+from pdf_extraction import iter_pdf_pages  # noqa: E402
+from stubs import HashingEmbedding  # noqa: E402
+from synthetic_pdf import DRUGS, FILLER, MONITORING, SIDE_EFFECTS, make_guideline_pdf  # noqa: E402
+
+KS = [1, 3, 5, 10]
+
+
+def percentiles(times: list) -> str:
+    times = sorted(times)
+    p95 = times[min(len(times) - 1, int(len(times) * 0.95))]
+    return f"p50 {statistics.median(times) * 1000:7.2f} ms  p95 {p95 * 1000:7.2f} ms"
+
+
+def evaluate(retrieve, qa) -> tuple:
+    hits = {k: 0 for k in KS}
+    times = []
+    for question, answer in qa:
+        start = time.perf_counter()
+        nodes = retrieve(question)
+        times.append(time.perf_counter() - start)
+        for k in KS:
+            hits[k] += any(answer in n.node.get_content() for n in nodes[:k])
+    return {k: hits[k] / len(qa) for k in KS}, times
+
+
+def recall(args) -> None:
+    pdf_bytes, qa = make_guideline_pdf(drugs=args.drugs)
+    pages = [(page, text) for page, text, _ in iter_pdf_pages(pdf_bytes, workers=1)]
+    index = VectorStoreIndex.from_documents(list(StructureChunker(args.chunk_tokens).iter_chunks(pages, "guideline.pdf")))
+    corpus = CorpusIndex()
+    corpus.add("guideline", index, source="guideline.pdf")
+
+    print(f"Recall: {len(qa)} questions over {len(index.index_struct.nodes_dict)} chunks\n")
+    print(f"{'retriever':>22} " + " ".join(f"{f'R@{k}':>6}" for k in KS) + "  latency (incl. query embedding)")
+    retrievers = {"vector store (before)": corpus.index.as_retriever(similarity_top_k=max(KS))}
+    for mode in RETRIEVAL_MODES:
+        retrievers[mode] = HybridRetriever(corpus, similarity_top_k=max(KS), mode=mode)
+    for label, retriever in retrievers.items():
+        recalls, times = evaluate(retriever.retrieve, qa)
+        print(f"{label:>22} " + " ".join(f"{recalls[k]:>6.0%}" for k in KS) + f"  {percentiles(times)}")
+
+
+def synthetic_chunk(rng: random.Random) -> str:
+    drug = rng.choice(DRUGS)
+    sentences = rng.sample(FILLER, 3) + [
+        f"The maximum daily dose of {drug} is {rng.choice([5, 10, 20, 40, 80, 500])} mg.",
+        f"Patients taking {drug} should have their {rng.choice(MONITORING)} checked; report {rng.choice(SIDE_EFFECTS)}.",
+        f"Code as ICD-10 E{rng.randint(10, 14)}.{rng.randint(0, 9)}.",
+    ]
+    rng.shuffle(sentences)
+    return " ".join(sentences)
+
+
+def latency(args) -> None:
+    rng = random.Random(0)
+    vectors = np.random.default_rng(0).standard_normal((args.chunks, args.dim)).astype(np.float32)
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+    node_ids = [f"node-{i}" for i in range(args.chunks)]
+    start = time.perf_counter()
+    segments = []
+    for bounds in np.array_split(np.arange(args.chunks), args.documents):
+        ids = [node_ids[i] for i in bounds]
+        segments.append(SearchSegment(ids, vectors[bounds], LexicalIndex.build(ids, (synthetic_chunk(rng) for _ in ids))))
+    build_time = time.perf_counter() - start
+
+    queries = [question for question, _ in make_guideline_pdf(drugs=len(DRUGS))[1]] * 3
+    query_vectors = np.random.default_rng(1).standard_normal((len(queries), args.dim)).astype(np.float32)
+    print(f"\nLatency: {args.chunks} chunks in {args.documents} segments, top {args.top_k}, {len(queries)} queries "
+          f"(lexical indexes built in {build_time:.1f}s)\n")
+
+    # What SimpleVectorStore.query does over the corpus' embedding dict, on a few queries since it is slow
+    embeddings, ids = vectors.tolist(), node_ids
+    times = []
+    for query_vector in query_vectors[:5]:
+        start = time.perf_counter()
+        get_top_k_embeddings(query_vector.tolist(), embeddings, similarity_top_k=args.top_k, embedding_ids=ids)
+        times.append(time.perf_counter() - start)
+    print(f"{'vector store (before)':>22}  {percentiles(times)}")
+    for mode in RETRIEVAL_MODES:
+        times = []
+        for query, query_vector in zip(queries, query_vectors):
+            start = time.perf_counter()
+            hybrid_search(segments, query, query_vector, args.top_k, mode=mode)
+            times.append(time.perf_counter() - start)
+        print(f"{mode:>22}  {percentiles(times)}")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--drugs", type=int, default=30, help="Guideline sections (3 questions each) for the recall eval")
+    parser.add_argument("--chunk-tokens", type=int, default=256)
+    parser.add_argument("--embed-model", default=None)
+    parser.add_argument("--chunks", type=int, default=50000, help="Corpus size for the latency benchmark")
+    parser.add_argument("--documents", type=int, default=20)
+    parser.add_argument("--dim", type=int, default=384)
+    parser.add_argument("--top-k", type=int, default=10)
+    args = parser.parse_args()
+
+    Settings.embed_model = resolve_embed_model(args.embed_model) if args.embed_model else HashingEmbedding()
+    recall(args)
+    latency(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,116 @@
+"""
+Load test of the HTTP API: throughput and p50/p99 latency of streamed answers at rising concurrency.
+
+The service runs in-process on a local port over a synthetic guideline, with
+the offline embedding and stub cross-encoder, and Claude is the local fake
+Anthropic server, so only the service itself is measured. Each client sends
+its next question as soon as the previous answer has finished streaming;
+questions the service refuses (503) are counted, not retried.
+
+Usage: python benchmarks/bench_service_load.py --concurrency 1 8 32 64 --requests 200 --first-token-latency 0.3
+"""
+import argparse
+import asyncio
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "rag"))
+
+import aiohttp  # noqa: E402
+from aiohttp import web  # noqa: E402
+
+from fake_anthropic import FakeAnthropicServer  # noqa: E402
+from image_store import ImageStore  # noqa: E402
+from reranker import AdaptiveRerank  # noqa: E402
+from server import make_app  # noqa: E402
+from service import RAGService, ServiceConfig  # noqa: E402
+from stubs import BASE_ANSWER, HashingEmbedding, StubCrossEncoder  # noqa: E402
+from synthetic_pdf import make_guideline_pdf  # noqa: E402
+
+
+def quantile(values, q):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))] if ordered else float("nan")
+
+
+async def ask(session: aiohttp.ClientSession, url: str, question: str):
+    """(status, seconds to the first answer delta, seconds to the end of the answer)."""
+    start = time.perf_counter()
+    first = None
+    async with session.post(f"{url}/query/stream", json={"question": question}) as response:
+        if response.status != 200:
+            await response.read()
+            return response.status, None, time.perf_counter() - start
+        async for line in response.content:
+            if first is None and line.startswith(b"event: delta"):
+                first = time.perf_counter() - start
+    return 200, first, time.perf_counter() - start
+
+
+async def run_level(url: str, questions, concurrency: int, requests: int) -> None:
+    remaining = iter(range(requests))
+    results = []
+    rng = random.Random(concurrency)
+
+    async def client(session):
+        for _ in remaining:
+            results.append(await ask(session, url, rng.choice(questions)))
+
+    connector = aiohttp.TCPConnector(limit=concurrency)
+    async with aiohttp.ClientSession(connector=connector, timeout=aiohttp.ClientTimeout(total=300)) as session:
+        start = time.perf_counter()
+        await asyncio.gather(*(client(session) for _ in range(concurrency)))
+        elapsed = time.perf_counter() - start
+    ok = [r for r in results if r[0] == 200]
+    latencies = [r[2] for r in ok]
+    ttfts = [r[1] for r in ok if r[1] is not None]
+    print(f"{concurrency:>5} clients  {len(ok) / elapsed:6.1f} answers/s  "
+          f"latency p50 {quantile(latencies, 0.5) * 1000:7.0f} ms p99 {quantile(latencies, 0.99) * 1000:7.0f} ms  "
+          f"first token p50 {quantile(ttfts, 0.5) * 1000:6.0f} ms p99 {quantile(ttfts, 0.99) * 1000:6.0f} ms  "
+          f"refused {len(results) - len(ok)}")
+
+
+async def main_async(args) -> None:
+    pdf_bytes, qa = make_guideline_pdf(drugs=args.drugs)
+    # Distinct questions, so the response cache (not configured here) would not matter anyway
+    questions = [question for question, _ in qa]
+    with FakeAnthropicServer(reply=BASE_ANSWER, first_token_latency=args.first_token_latency,
+                             token_interval=args.token_interval) as anthropic, tempfile.TemporaryDirectory() as tmp:
+        config = ServiceConfig(max_concurrent_queries=args.query_threads, max_pending_queries=args.max_pending,
+                               max_connections=256)
+        service = RAGService(config, HashingEmbedding(), image_store=ImageStore(tmp),
+                             rerank=AdaptiveRerank(StubCrossEncoder(), top_n=config.top_k),
+                             api_key="bench", base_url=anthropic.base_url)
+        job = service.ingest(pdf_bytes, "guideline.pdf")
+        job.wait()
+        runner = web.AppRunner(make_app(service))
+        await runner.setup()
+        site = web.TCPSite(runner, "127.0.0.1", 0)
+        await site.start()
+        port = site._server.sockets[0].getsockname()[1]
+        url = f"http://127.0.0.1:{port}"
+        print(f"{len(questions)} questions, {job.nodes_indexed} chunks, {args.query_threads} query threads, "
+              f"{args.max_pending} pending at most, first token after {args.first_token_latency}s\n")
+        for concurrency in args.concurrency:
+            await run_level(url, questions, concurrency, args.requests)
+        await runner.cleanup()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 8, 32, 64])
+    parser.add_argument("--requests", type=int, default=200, help="Questions per concurrency level")
+    parser.add_argument("--drugs", type=int, default=30)
+    parser.add_argument("--query-threads", type=int, default=4, help="max_concurrent_queries")
+    parser.add_argument("--max-pending", type=int, default=32, help="max_pending_queries")
+    parser.add_argument("--first-token-latency", type=float, default=0.3)
+    parser.add_argument("--token-interval", type=float, default=0.002)
+    args = parser.parse_args()
+    asyncio.run(main_async(args))
+
+
+if __name__ == "__main__":
+    main()
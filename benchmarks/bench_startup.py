@@ -0,0 +1,132 @@
+"""
+Start-up cost of the service: import time, heavy modules imported, and time to the first answer.
+
+Import time is measured with ``python -X importtime`` in a fresh interpreter,
+along with which heavy modules (PyMuPDF, torch, sentence-transformers,
+Streamlit...) importing pulled in; none should be loaded before a path
+needs them. Then a fresh process starts the service with RAGService.from_env,
+stays idle for ``--idle`` seconds as a server does before its first request,
+and ingests a synthetic guideline and answers a question: with models loaded
+lazily by that first request, and with the model registry warmed up in the
+background at start-up. Claude is the local fake Anthropic server.
+
+The embedder and cross-encoder are offline stand-ins that take
+``--model-load`` seconds to load, about what BGE-small and the MiniLM
+cross-encoder take on CPU; ``--real-models`` loads the real ones instead
+(needs sentence-transformers and the model downloads).
+
+Usage: python benchmarks/bench_startup.py --model-load 3 --idle 5
+"""
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Any, Dict, Optional
+
+RAG_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "rag")
+sys.path.insert(0, RAG_DIR)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from fake_anthropic import FakeAnthropicServer  # noqa: E402
+from stubs import StubCrossEncoder, hashing_backend  # noqa: E402
+from synthetic_pdf import make_guideline_pdf  # noqa: E402
+
+HEAVY_MODULES = ["fitz", "PyPDF2", "PIL", "torch", "sentence_transformers", "transformers", "onnxruntime", "streamlit"]
+
+
+def import_profile(module: str) -> Dict[str, Any]:
+    """Seconds to import the rag ``module`` in a fresh interpreter, and the heavy modules it imported."""
+    code = f"import {module}; import json, sys; print(json.dumps([m for m in {HEAVY_MODULES!r} if m in sys.modules]))"
+    process = subprocess.run([sys.executable, "-X", "importtime", "-c", code], cwd=RAG_DIR,
+                             capture_output=True, text=True, check=True)
+    # "import time: <self us> | <cumulative us> | <module>", nested imports indented under their importer
+    seconds = None
+    for line in process.stderr.splitlines():
+        fields = line.split("|")
+        if line.startswith("import time:") and len(fields) == 3 and fields[2].rstrip() == f" {module}":
+            seconds = int(fields[1]) / 1e6
+    return {"seconds": seconds, "heavy": json.loads(process.stdout.strip().splitlines()[-1])}
+
+
+def slow_loader(factory: Any, seconds: float) -> Any:
+    def load() -> Any:
+        time.sleep(seconds)
+        return factory()
+    return load
+
+
+def _first_request(env: Dict[str, str], warm_up: bool, model_load: Optional[float], idle: float, results: Any) -> None:
+    os.environ.update(env)
+    from models import registry
+    from service import RAGService
+
+    start = time.perf_counter()
+    if model_load is not None:
+        # Registered first, so from_env's own registrations are no-ops
+        registry.register("embedder", slow_loader(hashing_backend, model_load))
+        registry.register("reranker", slow_loader(StubCrossEncoder, model_load))
+    service = RAGService.from_env(api_key="bench", warm_up=warm_up)
+    ready = time.perf_counter()
+    time.sleep(idle)
+    pdf_bytes, qa = make_guideline_pdf(seed=0)
+    request = time.perf_counter()
+    service.ingest(pdf_bytes, "guideline.pdf").wait()
+    asyncio.run(service.aquery(qa[0][0], analyze=False))
+    first = time.perf_counter() - request
+    request = time.perf_counter()
+    asyncio.run(service.aquery(qa[1][0], analyze=False))
+    service.shutdown()
+    results.put({"ready": ready - start, "first": first,
+                 "next": time.perf_counter() - request, "models": registry.stats()})
+
+
+def first_request(base_url: str, warm_up: bool, model_load: Optional[float], idle: float) -> Dict[str, Any]:
+    """
+    Timings of a fresh process that starts the service, idles, then ingests a document and asks two questions.
+
+    ``model_load`` is the load time of the stand-in models, or None for the real ones.
+    """
+    with tempfile.TemporaryDirectory() as tmp:
+        # Empty caches and stores, as on a fresh deployment
+        env = {"ANTHROPIC_BASE_URL": base_url, "HEALTHCARE_RAG_CACHE_DIR": tmp,
+               "HEALTHCARE_RAG_INDEX_DIR": os.path.join(tmp, "indexes"),
+               "HEALTHCARE_RAG_IMAGE_DIR": os.path.join(tmp, "images")}
+        context = multiprocessing.get_context("spawn")
+        results = context.Queue()
+        process = context.Process(target=_first_request, args=(env, warm_up, model_load, idle, results))
+        process.start()
+        result = results.get()
+        process.join()
+    return result
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--modules", nargs="+", default=["service", "server"], help="rag modules to time the import of")
+    parser.add_argument("--model-load", type=float, default=3.0, help="Seconds the stand-in models take to load")
+    parser.add_argument("--real-models", action="store_true", help="Load the real embedder and cross-encoder")
+    parser.add_argument("--idle", type=float, default=5.0, help="Seconds between start-up and the first request")
+    args = parser.parse_args()
+
+    print(f"{'module':<12} {'import s':>9}  heavy modules imported")
+    for module in args.modules:
+        profile = import_profile(module)
+        print(f"{module:<12} {profile['seconds']:9.2f}  {', '.join(profile['heavy']) or '-'}")
+
+    model_load = None if args.real_models else args.model_load
+    print(f"\n{'models':<10} {'from_env s':>11} {'first request s':>16} {'next request s':>15}")
+    with FakeAnthropicServer(first_token_latency=0.1, token_interval=0.002) as server:
+        for label, warm_up in [("lazy", False), ("warm-up", True)]:
+            result = first_request(server.base_url, warm_up, model_load, args.idle)
+            print(f"{label:<10} {result['ready']:11.2f} {result['first']:16.2f} {result['next']:15.2f}")
+            loads = ", ".join(f"{name} {seconds:.1f}s" for name, seconds in result["models"]["load_seconds"].items())
+            print(f"{'':<10} loaded: {loads}")
+
+
+if __name__ == "__main__":
+    main()
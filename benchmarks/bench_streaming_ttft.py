@@ -0,0 +1,70 @@
+"""
+Time-to-first-token of streamed vs blocking Claude calls against a local fake server.
+
+Usage: python benchmarks/bench_streaming_ttft.py --first-token-latency 0.3 --token-interval 0.02
+"""
+import argparse
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "rag"))
+
+from claude_llm import Claude, run_async  # noqa: E402
+from fake_anthropic import FakeAnthropicServer  # noqa: E402
+from stubs import BASE_ANSWER  # noqa: E402
+
+MODEL = "claude-3-5-sonnet-20240620"
+PROMPT = "What is the first-line treatment for type 2 diabetes?"
+
+
+def time_blocking(claude: Claude) -> float:
+    start = time.perf_counter()
+    claude.complete(PROMPT)
+    return time.perf_counter() - start
+
+
+def time_first_token(claude: Claude) -> float:
+    start = time.perf_counter()
+    stream = claude.stream_complete(PROMPT)
+    next(stream)
+    ttft = time.perf_counter() - start
+    for _ in stream:
+        pass
+    return ttft
+
+
+async def atime_first_token(claude: Claude) -> float:
+    start = time.perf_counter()
+    stream = claude.astream_complete(PROMPT)
+    await stream.__anext__()
+    ttft = time.perf_counter() - start
+    async for _ in stream:
+        pass
+    return ttft
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--first-token-latency", type=float, default=0.3)
+    parser.add_argument("--token-interval", type=float, default=0.02)
+    parser.add_argument("--runs", type=int, default=5)
+    args = parser.parse_args()
+
+    with FakeAnthropicServer(reply=BASE_ANSWER, first_token_latency=args.first_token_latency,
+                             token_interval=args.token_interval) as server:
+        claude = Claude(MODEL, api_key="benchmark", base_url=server.base_url)
+        # Warm up the connection pools so the first run isn't penalised
+        time_blocking(claude)
+        blocking = [time_blocking(claude) for _ in range(args.runs)]
+        streamed = [time_first_token(claude) for _ in range(args.runs)]
+        astreamed = [run_async(atime_first_token(claude)) for _ in range(args.runs)]
+
+    print(f"blocking complete, time to full answer: {statistics.median(blocking) * 1000:8.1f} ms")
+    print(f"stream_complete, time to first token:   {statistics.median(streamed) * 1000:8.1f} ms")
+    print(f"astream_complete, time to first token:  {statistics.median(astreamed) * 1000:8.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
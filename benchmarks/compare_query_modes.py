@@ -0,0 +1,41 @@
+"""
+Token and latency comparison of the "stepwise" and "fused" query modes.
+
+Token counts come from the stub's 4-characters-per-token estimate, which is
+enough to compare prompt strategies against each other.
+
+Usage: python benchmarks/compare_query_modes.py --latency 0.5 --runs 5
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "rag"))
+
+from healthcare_utils import QUERY_MODES, aprocess_healthcare_query  # noqa: E402
+from stubs import StubClaude  # noqa: E402
+
+QUERY = "What is the first-line treatment for type 2 diabetes?"
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--latency", type=float, default=0.5, help="Simulated seconds per Claude call")
+    parser.add_argument("--runs", type=int, default=5)
+    args = parser.parse_args()
+
+    print(f"{'mode':<10} {'calls':>6} {'input tok':>10} {'output tok':>11} {'s/query':>8}")
+    for mode in QUERY_MODES:
+        claude = StubClaude(latency=args.latency)
+        start = time.perf_counter()
+        for _ in range(args.runs):
+            asyncio.run(aprocess_healthcare_query(QUERY, claude, mode=mode))
+        elapsed = (time.perf_counter() - start) / args.runs
+        print(f"{mode:<10} {len(claude.calls) / args.runs:>6.1f} {claude.input_tokens // args.runs:>10} "
+              f"{claude.output_tokens // args.runs:>11} {elapsed:>8.3f}")
+
+
+if __name__ == "__main__":
+    main()
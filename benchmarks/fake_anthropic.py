@@ -0,0 +1,250 @@
+import hashlib
+import json
+import random
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Callable, Dict, Iterator, List, Optional, Sequence, Set, Tuple
+
+
+class FakeAnthropicServer:
+    """
+    Local stand-in for the Anthropic messages API (``POST /v1/messages``).
+
+    Replies with ``reply`` either as a single JSON message or, when the request
+    asks for ``stream: true``, as server-sent events split into word-sized
+    deltas. ``first_token_latency`` is the delay before the first byte of the
+    answer and ``token_interval`` the delay between streamed deltas, so a
+    non-streaming call takes roughly ``first_token_latency + n * token_interval``.
+    With ``input_tokens_per_second`` the prompt adds to the first-token latency
+    too, in proportion to its (approximate) token count.
+
+    Prompt caching is simulated as the API does it: a ``cache_control`` block
+    writes the prompt up to it to the cache, if that prefix is at least
+    ``min_cache_tokens`` long, and a later request with the same prefix reads
+    it back, checking the 20 blocks before each breakpoint. Usage reports the
+    cache reads and writes, and tokens read from the cache add no first-token
+    latency. ``prompt_cache=False`` turns the cache off.
+
+    ``responder`` computes the reply from the request body instead. Status codes
+    queued with ``fail_next`` are returned (with a ``retry-after`` header) by the
+    next requests before normal replies resume, and delays queued with
+    ``delay_next`` are added to the next requests' latency. ``error_rate`` fails
+    that fraction of requests at random with one of ``error_statuses``; the draws
+    come from a generator seeded with ``seed``, so the same sequence of requests
+    sees the same failures on every run.
+
+    Use as a context manager and point ``Claude(base_url=server.base_url)`` at it.
+    """
+
+    def __init__(self, reply: str = "This is a reply from the fake Anthropic server.",
+                 first_token_latency: float = 0.05, token_interval: float = 0.01,
+                 responder: Optional[Callable[[Dict[str, Any]], str]] = None, retry_after: float = 0,
+                 input_tokens_per_second: Optional[float] = None, error_rate: float = 0.0,
+                 error_statuses: Sequence[int] = (529,), seed: int = 0, prompt_cache: bool = True,
+                 min_cache_tokens: int = 1024) -> None:
+        self.reply = reply
+        self.first_token_latency = first_token_latency
+        self.token_interval = token_interval
+        self.responder = responder
+        self.retry_after = retry_after
+        self.input_tokens_per_second = input_tokens_per_second
+        self.error_rate = error_rate
+        self.error_statuses = list(error_statuses)
+        self.injected_errors = 0
+        self.prompt_cache = prompt_cache
+        self.min_cache_tokens = min_cache_tokens
+        self._cached_prefixes: Set[str] = set()
+        self._rng = random.Random(seed)
+        self.requests: List[Dict[str, Any]] = []
+        self._failures: List[int] = []
+        self._delays: List[float] = []
+        self._lock = threading.Lock()
+        self._httpd: Optional[ThreadingHTTPServer] = None
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def base_url(self) -> str:
+        host, port = self._httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self) -> "FakeAnthropicServer":
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, format: str, *args: Any) -> None:
+                pass
+
+            def do_POST(self) -> None:
+                length = int(self.headers.get("content-length", 0))
+                body = json.loads(self.rfile.read(length) or b"{}")
+                server.requests.append(body)
+                server._handle(self, body)
+
+        self._httpd = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self._httpd.daemon_threads = True
+        self._thread = threading.Thread(target=self._httpd.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        if self._httpd is not None:
+            self._httpd.shutdown()
+            self._httpd.server_close()
+            self._httpd = None
+
+    def __enter__(self) -> "FakeAnthropicServer":
+        return self.start()
+
+    def __exit__(self, *exc: Any) -> None:
+        self.stop()
+
+    def fail_next(self, *status_codes: int) -> None:
+        """Answer the next requests with these HTTP error statuses, in order."""
+        with self._lock:
+            self._failures.extend(status_codes)
+
+    def delay_next(self, *seconds: float) -> None:
+        """Hold the next requests for these extra delays, in order, before answering."""
+        with self._lock:
+            self._delays.extend(seconds)
+
+    def _reply_for(self, body: Dict[str, Any]) -> str:
+        return self.responder(body) if self.responder else self.reply
+
+    def _chunks(self, reply: str) -> List[str]:
+        words = reply.split(" ")
+        return [word if i == 0 else " " + word for i, word in enumerate(words)]
+
+    def _prompt_blocks(self, body: Dict[str, Any]) -> Iterator[Tuple[str, bool]]:
+        """The system prompt's then the messages' content blocks, serialized, each with whether it is a cache breakpoint."""
+        def blocks(role: str, content: Any) -> Iterator[Tuple[str, bool]]:
+            for block in [{"type": "text", "text": content}] if isinstance(content, str) else content:
+                block = dict(block)
+                breakpoint = block.pop("cache_control", None) is not None
+                yield json.dumps([role, block], sort_keys=True), breakpoint
+
+        if body.get("system"):
+            yield from blocks("system", body["system"])
+        for message in body.get("messages", []):
+            yield from blocks(message["role"], message["content"])
+
+    def _cache_usage(self, body: Dict[str, Any]) -> Tuple[int, int]:
+        """Tokens of ``body``'s prompt read from and written to the cache, updating the cache."""
+        digest = hashlib.sha256(body.get("model", "").encode())
+        prefixes: List[Tuple[str, int]] = []
+        breakpoints = []
+        length = 0
+        for i, (block, breakpoint) in enumerate(self._prompt_blocks(body)):
+            digest.update(block.encode())
+            length += len(block)
+            prefixes.append((digest.hexdigest(), length // 4))
+            if breakpoint:
+                breakpoints.append(i)
+        read = written = 0
+        with self._lock:
+            for end in breakpoints:
+                hit = next((prefixes[i][1] for i in range(end, max(-1, end - 20), -1)
+                            if prefixes[i][0] in self._cached_prefixes), 0)
+                read = max(read, hit)
+            for end in breakpoints:
+                prefix, tokens = prefixes[end]
+                if tokens >= self.min_cache_tokens and tokens > read:
+                    self._cached_prefixes.add(prefix)
+                    written = max(written, tokens - read)
+        return read, written
+
+    def _usage(self, body: Dict[str, Any], reply: str) -> Dict[str, int]:
+        total = len(json.dumps([body.get("system", ""), body.get("messages", [])])) // 4
+        read, written = self._cache_usage(body) if self.prompt_cache else (0, 0)
+        return {
+            "input_tokens": max(0, total - read - written),
+            "cache_creation_input_tokens": written,
+            "cache_read_input_tokens": read,
+            "output_tokens": len(self._chunks(reply)),
+        }
+
+    def _first_token_delay(self, usage: Dict[str, int]) -> float:
+        if not self.input_tokens_per_second:
+            return self.first_token_latency
+        processed = usage["input_tokens"] + usage["cache_creation_input_tokens"]
+        return self.first_token_latency + processed / self.input_tokens_per_second
+
+    def _send_error(self, handler: BaseHTTPRequestHandler, status: int) -> None:
+        error_type = {429: "rate_limit_error", 529: "overloaded_error"}.get(status, "api_error")
+        payload = json.dumps({"type": "error", "error": {"type": error_type, "message": f"Injected {status}"}}).encode()
+        handler.send_response(status)
+        handler.send_header("content-type", "application/json")
+        handler.send_header("content-length", str(len(payload)))
+        handler.send_header("retry-after", str(self.retry_after))
+        handler.end_headers()
+        handler.wfile.write(payload)
+
+    def _handle(self, handler: BaseHTTPRequestHandler, body: Dict[str, Any]) -> None:
+        with self._lock:
+            status = self._failures.pop(0) if self._failures else None
+            delay = self._delays.pop(0) if self._delays else 0
+            if status is None and self.error_rate and self._rng.random() < self.error_rate:
+                status = self._rng.choice(self.error_statuses)
+                self.injected_errors += 1
+        time.sleep(delay)
+        if status is not None:
+            self._send_error(handler, status)
+            return
+        reply = self._reply_for(body)
+        usage = self._usage(body, reply)
+        if body.get("stream"):
+            self._stream(handler, body, reply, usage)
+            return
+        time.sleep(self._first_token_delay(usage) + self.token_interval * (len(self._chunks(reply)) - 1))
+        message = {
+            "id": f"msg_{uuid.uuid4().hex[:24]}",
+            "type": "message",
+            "role": "assistant",
+            "model": body.get("model", ""),
+            "content": [{"type": "text", "text": reply}],
+            "stop_reason": "end_turn",
+            "stop_sequence": None,
+            "usage": usage,
+        }
+        payload = json.dumps(message).encode()
+        handler.send_response(200)
+        handler.send_header("content-type", "application/json")
+        handler.send_header("content-length", str(len(payload)))
+        handler.end_headers()
+        handler.wfile.write(payload)
+
+    def _stream(self, handler: BaseHTTPRequestHandler, body: Dict[str, Any], reply: str,
+                usage: Dict[str, int]) -> None:
+        handler.send_response(200)
+        handler.send_header("content-type", "text/event-stream")
+        handler.send_header("cache-control", "no-cache")
+        handler.send_header("connection", "close")
+        handler.end_headers()
+        handler.close_connection = True
+
+        def send(event: str, data: Dict[str, Any]) -> None:
+            handler.wfile.write(f"event: {event}\ndata: {json.dumps(data)}\n\n".encode())
+            handler.wfile.flush()
+
+        send("message_start", {"type": "message_start", "message": {
+            "id": f"msg_{uuid.uuid4().hex[:24]}", "type": "message", "role": "assistant",
+            "model": body.get("model", ""), "content": [], "stop_reason": None,
+            "stop_sequence": None, "usage": {**usage, "output_tokens": 0},
+        }})
+        send("content_block_start", {"type": "content_block_start", "index": 0,
+                                     "content_block": {"type": "text", "text": ""}})
+        time.sleep(self._first_token_delay(usage))
+        for i, chunk in enumerate(self._chunks(reply)):
+            if i:
+                time.sleep(self.token_interval)
+            send("content_block_delta", {"type": "content_block_delta", "index": 0,
+                                         "delta": {"type": "text_delta", "text": chunk}})
+        send("content_block_stop", {"type": "content_block_stop", "index": 0})
+        send("message_delta", {"type": "message_delta",
+                               "delta": {"stop_reason": "end_turn", "stop_sequence": None},
+                               "usage": {"output_tokens": usage["output_tokens"]}})
+        send("message_stop", {"type": "message_stop"})
@@ -0,0 +1,186 @@
+import asyncio
+import hashlib
+import json
+import re
+import threading
+import time
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+from llama_index.core.base.embeddings.base import BaseEmbedding
+from llama_index.core.bridge.pydantic import Field
+
+# A retrieval-grounded answer is typically a few hundred tokens long
+BASE_ANSWER = " ".join([
+    "Metformin is the usual first-line therapy for type 2 diabetes.",
+    "The guideline recommends starting at 500 mg once daily with meals and titrating weekly.",
+    "Renal function should be checked before initiation and at least annually thereafter.",
+    "Gastrointestinal side effects are common early on and usually settle with slow titration.",
+] * 6)
+
+
+def healthcare_reply(prompt: str, malformed_json: bool = False) -> str:
+    """A canned reply shaped like Claude's to each healthcare_utils prompt, BASE_ANSWER to anything else."""
+    if "Respond with only a JSON object" in prompt:
+        if malformed_json:
+            return "Category: treatment. Sorry, here is prose instead of JSON."
+        return json.dumps({
+            "category": "treatment",
+            "response": "Treatment Suggestion: Metformin is the usual first-line therapy.",
+            "key_points": ["Metformin is first-line", "Monitor renal function"],
+            "follow_up_questions": ["1. What dose should I start with?", "2. What are the side effects?", "3. When should I follow up?"],
+        })
+    if "Categorize the following healthcare query" in prompt:
+        return "treatment"
+    if "Format the healthcare response" in prompt:
+        return "Treatment Suggestion: Metformin is the usual first-line therapy."
+    if "Extract the key points" in prompt:
+        return "- Metformin is first-line\n- Monitor renal function"
+    if "follow-up questions" in prompt:
+        return "1. What dose should I start with?\n2. What are the side effects?\n3. When should I follow up?"
+    return BASE_ANSWER
+
+
+def block_text(content: Any) -> str:
+    """The text of message content or a system prompt given as a string or a list of content blocks."""
+    if isinstance(content, list):
+        return " ".join(block.get("text", "") for block in content if isinstance(block, dict))
+    return content or ""
+
+
+def healthcare_responder(body: Dict[str, Any]) -> str:
+    """FakeAnthropicServer responder answering like healthcare_reply to the system prompt and last user message."""
+    content = body["messages"][-1]["content"] if body.get("messages") else ""
+    return healthcare_reply(block_text(body.get("system")) + " " + block_text(content))
+
+
+class StubClaude:
+    """
+    Drop-in stand-in for rag.claude_llm.Claude that answers after a fixed latency.
+
+    Responses are picked from the prompt so the post-processing parsers see
+    realistic shapes. Every call is recorded in ``calls`` for assertions, and
+    approximate token usage (4 characters per token) is tallied so prompt
+    strategies can be compared without an API key.
+    """
+
+    def __init__(self, latency: float = 0.2, model: str = "claude-3-5-sonnet-20240620", malformed_json: bool = False) -> None:
+        self.latency = latency
+        self.model = model
+        self.malformed_json = malformed_json
+        self.context_window = 200000
+        self.max_tokens = 1000
+        self.calls: List[str] = []
+        self.input_tokens = 0
+        self.output_tokens = 0
+        self._lock = threading.Lock()
+
+    def _answer(self, prompt: str, system: Any = None) -> str:
+        system = block_text(system)
+        answer = self._pick_answer(system + " " + prompt if system else prompt)
+        with self._lock:
+            self.calls.append(prompt)
+            self.input_tokens += (len(system) + len(prompt)) // 4
+            self.output_tokens += len(answer) // 4
+        return answer
+
+    def _pick_answer(self, prompt: str) -> str:
+        return healthcare_reply(prompt, malformed_json=self.malformed_json)
+
+    def complete(self, prompt: str, **kwargs: Any) -> str:
+        time.sleep(self.latency)
+        return self._answer(prompt, kwargs.get("system"))
+
+    async def acomplete(self, prompt: str, **kwargs: Any) -> str:
+        await asyncio.sleep(self.latency)
+        return self._answer(prompt, kwargs.get("system"))
+
+    def chat(self, messages: List[Any], **kwargs: Any) -> str:
+        return self.complete(str(messages[-1]["content"]) if messages else "", **kwargs)
+
+    def get_model_name(self) -> str:
+        return self.model
+
+    def get_context_window(self) -> int:
+        return self.context_window
+
+    def get_max_tokens(self) -> Optional[int]:
+        return self.max_tokens
+
+
+def caption_responder(body: Dict[str, Any]) -> str:
+    """FakeAnthropicServer responder that captions every image in the last user message."""
+    content = body["messages"][-1]["content"]
+    count = sum(1 for block in content if isinstance(block, dict) and block.get("type") == "image")
+    return json.dumps([f"Bar chart of HbA1c by treatment arm, figure {i + 1}." for i in range(count)])
+
+
+class HashingEmbedding(BaseEmbedding):
+    """
+    Deterministic, offline bag-of-words embedding (hashed word unigrams and bigrams).
+
+    Far weaker than BGE, but it ranks text by lexical overlap with the query,
+    which is enough to compare chunking strategies without downloading a model.
+    """
+
+    dim: int = Field(default=1024)
+
+    @classmethod
+    def class_name(cls) -> str:
+        return "HashingEmbedding"
+
+    def _embed(self, text: str) -> List[float]:
+        words = re.findall(r"\w+", text.lower())
+        vector = np.zeros(self.dim, dtype=np.float32)
+        for term in words + [f"{a} {b}" for a, b in zip(words, words[1:])]:
+            digest = hashlib.md5(term.encode()).digest()
+            vector[int.from_bytes(digest[:4], "little") % self.dim] += 1.0 if digest[4] & 1 else -1.0
+        norm = np.linalg.norm(vector)
+        return (vector / norm if norm else vector).tolist()
+
+    def _get_query_embedding(self, query: str) -> List[float]:
+        return self._embed(query)
+
+    async def _aget_query_embedding(self, query: str) -> List[float]:
+        return self._embed(query)
+
+    def _get_text_embedding(self, text: str) -> List[float]:
+        return self._embed(text)
+
+
+def hashing_backend(dim: int = 384) -> Any:
+    """EmbeddingService backend computing HashingEmbedding vectors, for benchmarking the service offline."""
+    model = HashingEmbedding(dim=dim)
+
+    def embed(texts: List[str]) -> np.ndarray:
+        return np.asarray([model._embed(text) for text in texts], dtype=np.float32)
+    return embed
+
+
+class StubCrossEncoder:
+    """
+    Offline stand-in for a cross-encoder scorer with a transformer-like CPU cost.
+
+    Each call burns CPU in proportion to the padded batch (pairs x longest
+    pair, in approximate tokens, capped at ``max_length``), and scores a pair
+    by the fraction of query words found in the passage, in [0, 1].
+    """
+
+    def __init__(self, max_length: int = 512, hidden: int = 384) -> None:
+        self.max_length = max_length
+        self.weights = np.random.default_rng(0).standard_normal((hidden, hidden)).astype(np.float32) / hidden ** 0.5
+
+    def __call__(self, pairs: List[Any]) -> np.ndarray:
+        lengths = [min(self.max_length, (len(query) + len(passage)) // 4 + 3) for query, passage in pairs]
+        states = np.ones((len(pairs) * max(lengths), self.weights.shape[0]), dtype=np.float32)
+        for _ in range(2):
+            states = np.tanh(states @ self.weights)
+        scores = []
+        for query, passage in pairs:
+            words = set(re.findall(r"\w+", query.lower()))
+            found = set(re.findall(r"\w+", passage.lower()))
+            scores.append(len(words & found) / len(words) if words else 0.0)
+        return np.asarray(scores, dtype=np.float32)
+
+    def predict(self, pairs: List[Any], **kwargs: Any) -> np.ndarray:
+        return self(pairs)
@@ -0,0 +1,423 @@
+"""
+Reproducible end-to-end benchmark suite with a regression check against a stored baseline.
+
+Every case runs offline on fixed synthetic data: PDFs from synthetic_pdf, the
+hashing embedding, the stub cross-encoder, and the local fake Anthropic
+server with fixed latency, token rate and seeded error injection, so two runs
+on one machine do the same work and differ only by timing noise. Cases:
+
+  ingestion         pages/sec and peak RSS of the IngestionQueue, in a fresh process
+  embedding         EmbeddingService chunks/sec, cold and from its cache
+  retrieval         hybrid retrieval recall@5 and latency
+  rerank            AdaptiveRerank latency, cold and cached, and recall@3
+  healthcare_query  process_healthcare_query end to end (stepwise, concurrent, fused) with injected 529s
+  sessions          concurrent multi-turn sessions through RAGService: answers/sec, p50/p99 latency,
+                    share of input tokens read from the prompt cache
+  startup           service import time, heavy modules it imports, first request after a warmed-up start
+
+Results are written as JSON (``--output``). With ``--baseline`` each metric is
+compared with the stored value: timings may be worse by their tolerance
+(``--tolerance`` overrides it), quality and count metrics must match exactly,
+and the exit status is 1 on any regression. Timings are machine-specific, so
+record the baseline with ``--update-baseline`` on the machine that checks it.
+
+Usage: python benchmarks/suite.py --baseline benchmarks/baseline.json --output results.json
+"""
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from dataclasses import asdict, dataclass
+from typing import Any, Callable, Dict, List, Optional
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "rag"))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import numpy as np  # noqa: E402
+from llama_index.core import VectorStoreIndex  # noqa: E402
+from llama_index.core.schema import QueryBundle  # noqa: E402
+
+from chunker import StructureChunker  # noqa: E402
+from corpus import CorpusIndex  # noqa: E402
+from fake_anthropic import FakeAnthropicServer  # noqa: E402
+from pdf_extraction import iter_pdf_pages  # noqa: E402
+from stubs import HashingEmbedding, StubCrossEncoder, hashing_backend, healthcare_responder  # noqa: E402
+from synthetic_pdf import make_guideline_pdf, make_pdf  # noqa: E402
+
+SEED = 0
+DEFAULT_BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baseline.json")
+# CPU-bound timings on a shared machine drift by up to a third from run to run
+DEFAULT_TOLERANCE = 0.5
+# Timings dominated by the fake Claude's fixed latency are steadier; a change means extra round trips
+CLAUDE_TOLERANCE = 0.2
+
+
+@dataclass
+class Metric:
+    value: float
+    unit: str
+    # "higher" or "lower" is better; "exact" must not change; None is reported only
+    better: Optional[str] = "lower"
+    tolerance: float = DEFAULT_TOLERANCE
+
+
+def exact(value: float, unit: str) -> Metric:
+    return Metric(value, unit, better="exact", tolerance=0.0)
+
+
+def quantile(values: List[float], q: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+def seed_everything() -> None:
+    random.seed(SEED)
+    np.random.seed(SEED)
+
+
+def guideline_chunks(seed: int = SEED):
+    """Structure-aware chunks of a synthetic guideline, and its Q&A set."""
+    pdf_bytes, qa = make_guideline_pdf(seed=seed)
+    pages = [(page, text) for page, text, _ in iter_pdf_pages(pdf_bytes, workers=1)]
+    return list(StructureChunker(256).iter_chunks(pages, f"guideline{seed}.pdf")), qa
+
+
+def guideline_retriever():
+    """A hybrid retriever over the synthetic guideline with the hashing embedding, and its Q&A set."""
+    from hybrid_retriever import HybridRetriever
+
+    chunks, qa = guideline_chunks()
+    embed_model = HashingEmbedding()
+    corpus = CorpusIndex(embed_model=embed_model)
+    corpus.add("guideline", VectorStoreIndex.from_documents(chunks, embed_model=embed_model), source="guideline.pdf")
+    return HybridRetriever(corpus, similarity_top_k=10, mode="hybrid", embed_model=embed_model), qa
+
+
+# Cases
+
+
+def _ingest(pages: int, results: Any) -> None:
+    import resource
+
+    from document_processor import iter_healthcare_document
+    from image_store import ImageStore
+    from ingestion import IngestionQueue
+
+    pdf_bytes = make_pdf(pages, images_per_page=1, distinct_images=20)
+    with tempfile.TemporaryDirectory() as tmp:
+        images = ImageStore(tmp)
+        queue = IngestionQueue(workers=1, batch_size=64, embed_model=HashingEmbedding())
+        chunker = StructureChunker(256)
+
+        def documents(progress):
+            return iter_healthcare_document(pdf_bytes, "bench.pdf", include_vision=True, image_store=images,
+                                            progress=progress, chunker=chunker)
+
+        start = time.perf_counter()
+        job = queue.submit(pdf_bytes, "bench.pdf", documents, {"bench": True})
+        job.wait()
+        elapsed = time.perf_counter() - start
+        queue.shutdown()
+    # Kilobytes on Linux
+    results.put({"seconds": elapsed, "nodes": job.nodes_indexed, "status": job.status,
+                 "peak_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024})
+
+
+def bench_ingestion(args: argparse.Namespace) -> Dict[str, Metric]:
+    # A fresh process, so peak RSS is the ingestion's and not what earlier cases left behind
+    context = multiprocessing.get_context("spawn")
+    results = context.Queue()
+    process = context.Process(target=_ingest, args=(args.pages, results))
+    process.start()
+    result = results.get()
+    process.join()
+    if result["status"] != "done":
+        raise RuntimeError("Ingestion failed")
+    return {
+        "pages_per_sec": Metric(args.pages / result["seconds"], "pages/s", "higher"),
+        "peak_rss_mb": Metric(result["peak_rss_mb"], "MB", "lower", tolerance=0.15),
+        "nodes": exact(result["nodes"], "nodes"),
+    }
+
+
+def bench_embedding(args: argparse.Namespace) -> Dict[str, Metric]:
+    from embedding_service import EmbeddingService
+
+    texts = [chunk.get_content(metadata_mode="embed")
+             for seed in range(args.embed_documents) for chunk in guideline_chunks(seed)[0]]
+    with tempfile.TemporaryDirectory() as tmp:
+        service = EmbeddingService(hashing_backend(), cache_path=os.path.join(tmp, "embeddings.sqlite3"))
+        start = time.perf_counter()
+        service.get_text_embedding_batch(texts)
+        cold = time.perf_counter() - start
+        start = time.perf_counter()
+        service.get_text_embedding_batch(texts)
+        warm = time.perf_counter() - start
+    return {
+        "chunks_per_sec": Metric(len(texts) / cold, "chunks/s", "higher"),
+        "cached_chunks_per_sec": Metric(len(texts) / warm, "chunks/s", "higher"),
+        "chunks": exact(len(texts), "chunks"),
+    }
+
+
+def bench_retrieval(args: argparse.Namespace) -> Dict[str, Metric]:
+    retriever, qa = guideline_retriever()
+    times, hits = [], 0
+    for question, answer in qa:
+        start = time.perf_counter()
+        nodes = retriever.retrieve(question)
+        times.append(time.perf_counter() - start)
+        hits += any(answer in n.node.get_content() for n in nodes[:5])
+    return {
+        "p50_ms": Metric(statistics.median(times) * 1000, "ms"),
+        "p95_ms": Metric(quantile(times, 0.95) * 1000, "ms", tolerance=1.0),
+        "recall_at_5": exact(hits / len(qa), "fraction"),
+    }
+
+
+def bench_rerank(args: argparse.Namespace) -> Dict[str, Metric]:
+    from reranker import AdaptiveRerank
+
+    retriever, qa = guideline_retriever()
+    candidates = [(question, answer, retriever.retrieve(question)) for question, answer in qa]
+    # A budget that never binds, so how many candidates are scored does not depend on the machine's speed
+    rerank = AdaptiveRerank(StubCrossEncoder(), top_n=10, latency_budget=60.0)
+    timings: Dict[str, List[float]] = {"cold": [], "cached": []}
+    hits = 0
+    for label in timings:
+        for question, answer, nodes in candidates:
+            start = time.perf_counter()
+            ranked = rerank.postprocess_nodes(list(nodes), query_bundle=QueryBundle(question))
+            timings[label].append(time.perf_counter() - start)
+            if label == "cold":
+                hits += any(answer in n.node.get_content() for n in ranked[:3])
+    return {
+        "p50_ms": Metric(statistics.median(timings["cold"]) * 1000, "ms"),
+        "cached_p50_ms": Metric(statistics.median(timings["cached"]) * 1000, "ms", tolerance=1.0),
+        "recall_at_3": exact(hits / len(qa), "fraction"),
+    }
+
+
+def _fake_claude(args: argparse.Namespace, error_rate: float = 0.0) -> FakeAnthropicServer:
+    return FakeAnthropicServer(responder=healthcare_responder, first_token_latency=args.first_token_latency,
+                               token_interval=1 / args.tokens_per_second,
+                               input_tokens_per_second=args.input_tokens_per_second,
+                               error_rate=error_rate, seed=SEED)
+
+
+def bench_healthcare_query(args: argparse.Namespace) -> Dict[str, Metric]:
+    from claude_llm import Claude, run_async
+    from healthcare_utils import aprocess_healthcare_query, process_healthcare_query
+    from resilience import ResiliencePolicy
+
+    query = "What is the first-line treatment for type 2 diabetes?"
+    with _fake_claude(args, error_rate=args.error_rate) as server:
+        policy = ResiliencePolicy(base_delay=0.01, max_delay=0.05)
+        claude = Claude("claude-3-5-sonnet-20240620", "bench", base_url=server.base_url, policy=policy)
+        runs: Dict[str, Callable[[], Any]] = {
+            "stepwise": lambda: process_healthcare_query(query, claude),
+            "concurrent": lambda: run_async(aprocess_healthcare_query(query, claude)),
+            "fused": lambda: run_async(aprocess_healthcare_query(query, claude, mode="fused")),
+        }
+        metrics = {}
+        for label, run in runs.items():
+            times = []
+            for _ in range(args.queries):
+                start = time.perf_counter()
+                result = run()
+                times.append(time.perf_counter() - start)
+                if result["category"] != "treatment":
+                    raise RuntimeError(f"Unexpected {label} result: {result['category']}")
+            metrics[f"{label}_ms"] = Metric(statistics.median(times) * 1000, "ms", tolerance=CLAUDE_TOLERANCE)
+        metrics["requests"] = exact(len(server.requests), "requests")
+        metrics["injected_errors"] = exact(server.injected_errors, "errors")
+        metrics["retries"] = Metric(policy.retries, "retries", better=None)
+    return metrics
+
+
+async def _sessions(args: argparse.Namespace, server: FakeAnthropicServer) -> Dict[str, Metric]:
+    from image_store import ImageStore
+    from reranker import AdaptiveRerank
+    from resilience import ServiceBusyError
+    from service import RAGService, ServiceConfig
+
+    pdf_bytes, qa = make_guideline_pdf(seed=SEED)
+    with tempfile.TemporaryDirectory() as tmp:
+        config = ServiceConfig(max_connections=64)
+        service = RAGService(config, HashingEmbedding(), image_store=ImageStore(tmp),
+                             rerank=AdaptiveRerank(StubCrossEncoder(), top_n=config.top_k),
+                             api_key="bench", base_url=server.base_url)
+        service.ingest(pdf_bytes, "guideline.pdf").wait()
+        latencies: List[float] = []
+        refused = 0
+
+        async def session(number: int) -> None:
+            nonlocal refused
+            history: List[Dict[str, Any]] = []
+            for turn in range(args.turns):
+                question = qa[(number * args.turns + turn) % len(qa)][0]
+                start = time.perf_counter()
+                try:
+                    result = await service.aquery(question, history=history)
+                except ServiceBusyError:
+                    refused += 1
+                    continue
+                latencies.append(time.perf_counter() - start)
+                history += [{"role": "user", "content": question}, {"role": "assistant", "content": result["answer"]}]
+
+        start = time.perf_counter()
+        await asyncio.gather(*(session(i) for i in range(args.sessions)))
+        elapsed = time.perf_counter() - start
+        tokens = service.stats()["tokens"]
+        service.shutdown()
+    return {
+        "answers_per_sec": Metric(len(latencies) / elapsed, "answers/s", "higher", tolerance=CLAUDE_TOLERANCE),
+        "p50_ms": Metric(quantile(latencies, 0.5) * 1000, "ms", tolerance=CLAUDE_TOLERANCE),
+        "p99_ms": Metric(quantile(latencies, 0.99) * 1000, "ms"),
+        "refused": exact(refused, "queries"),
+        # Falls if a change breaks the stable prompt prefix the turns share
+        "cache_read_rate": Metric(tokens["cache_read_rate"], "fraction", "higher", tolerance=CLAUDE_TOLERANCE),
+    }
+
+
+def bench_sessions(args: argparse.Namespace) -> Dict[str, Metric]:
+    with _fake_claude(args) as server:
+        return asyncio.run(_sessions(args, server))
+
+
+def bench_startup(args: argparse.Namespace) -> Dict[str, Metric]:
+    from bench_startup import first_request, import_profile
+
+    profile = import_profile("service")
+    with _fake_claude(args) as server:
+        # The first request comes once the stand-in models have had time to warm up
+        result = first_request(server.base_url, warm_up=True, model_load=args.model_load, idle=args.model_load + 0.5)
+    return {
+        "import_service_ms": Metric(profile["seconds"] * 1000, "ms"),
+        "heavy_modules": exact(len(profile["heavy"]), "modules"),
+        "from_env_ms": Metric(result["ready"] * 1000, "ms", tolerance=1.0),
+        "first_request_ms": Metric(result["first"] * 1000, "ms"),
+    }
+
+
+CASES: Dict[str, Callable[[argparse.Namespace], Dict[str, Metric]]] = {
+    "ingestion": bench_ingestion,
+    "embedding": bench_embedding,
+    "retrieval": bench_retrieval,
+    "rerank": bench_rerank,
+    "healthcare_query": bench_healthcare_query,
+    "sessions": bench_sessions,
+    "startup": bench_startup,
+}
+
+
+# Results and baselines
+
+
+def median_metrics(runs: List[Dict[str, Metric]]) -> Dict[str, Metric]:
+    """Per metric, the run with the median value."""
+    merged = {}
+    for name in runs[0]:
+        values = sorted((run[name] for run in runs), key=lambda metric: metric.value)
+        merged[name] = values[len(values) // 2]
+    return merged
+
+
+def run_suite(args: argparse.Namespace) -> Dict[str, Any]:
+    metrics: Dict[str, Dict[str, Any]] = {}
+    for case in args.cases:
+        runs = []
+        for _ in range(args.repeat):
+            seed_everything()
+            runs.append(CASES[case](args))
+        for name, metric in median_metrics(runs).items():
+            metrics[f"{case}.{name}"] = asdict(metric)
+            print(f"{case + '.' + name:<36} {metric.value:12.3f} {metric.unit}", flush=True)
+    return {"meta": environment(args), "metrics": metrics}
+
+
+def environment(args: argparse.Namespace) -> Dict[str, Any]:
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                                cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except OSError:
+        commit = None
+    return {
+        "commit": commit, "time": time.strftime("%Y-%m-%dT%H:%M:%S%z"), "python": platform.python_version(),
+        "platform": platform.platform(), "cpus": os.cpu_count(), "seed": SEED, "repeat": args.repeat,
+        "settings": {key: value for key, value in vars(args).items()
+                     if key not in ("output", "baseline", "update_baseline", "tolerance")},
+    }
+
+
+def compare(results: Dict[str, Any], baseline: Dict[str, Any], tolerance: Optional[float] = None) -> List[str]:
+    """One line per metric that regressed from ``baseline``; metrics missing from either side are skipped."""
+    regressions = []
+    for name, base in baseline["metrics"].items():
+        current = results["metrics"].get(name)
+        if current is None or base["better"] is None:
+            continue
+        allowed = base["tolerance"] if tolerance is None or base["better"] == "exact" else tolerance
+        value, reference = current["value"], base["value"]
+        if base["better"] == "exact":
+            regressed = abs(value - reference) > 1e-9
+        elif base["better"] == "higher":
+            regressed = value < reference * (1 - allowed)
+        else:
+            regressed = value > reference * (1 + allowed)
+        if regressed:
+            change = f"{(value - reference) / reference:+.0%}" if reference else "changed"
+            regressions.append(f"{name}: {value:.3f} {current['unit']} vs baseline {reference:.3f} ({change}, "
+                               f"{base['better']} is better, tolerance {allowed:.0%})")
+    return regressions
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--cases", nargs="+", choices=list(CASES), default=list(CASES))
+    parser.add_argument("--output", help="Write the results here as JSON")
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE, help="Fail on regressions against this results file")
+    parser.add_argument("--update-baseline", action="store_true", help="Write the results to --baseline instead")
+    parser.add_argument("--tolerance", type=float, help="Allowed relative slowdown of every timing metric")
+    parser.add_argument("--repeat", type=int, default=3, help="Runs per case; the median of each metric is kept")
+    parser.add_argument("--pages", type=int, default=100, help="Pages of the ingestion PDF")
+    parser.add_argument("--embed-documents", type=int, default=8, help="Synthetic guidelines to embed")
+    parser.add_argument("--queries", type=int, default=3, help="Healthcare queries per mode")
+    parser.add_argument("--sessions", type=int, default=8, help="Concurrent chat sessions")
+    parser.add_argument("--turns", type=int, default=3, help="Questions per session")
+    parser.add_argument("--first-token-latency", type=float, default=0.1)
+    parser.add_argument("--tokens-per-second", type=float, default=500.0, help="Fake Claude's output rate")
+    parser.add_argument("--input-tokens-per-second", type=float, default=50000.0, help="Fake Claude's prompt rate")
+    parser.add_argument("--model-load", type=float, default=1.0, help="Seconds the startup case's stand-in models take to load")
+    parser.add_argument("--error-rate", type=float, default=0.2, help="Fraction of healthcare_query requests failed with 529")
+    args = parser.parse_args()
+
+    results = run_suite(args)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+    if args.update_baseline:
+        with open(args.baseline, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"\nBaseline written to {args.baseline}")
+    elif os.path.exists(args.baseline):
+        with open(args.baseline) as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+        if regressions:
+            print(f"\n{len(regressions)} regression(s) against {args.baseline}:")
+            for line in regressions:
+                print(f"  {line}")
+            sys.exit(1)
+        print(f"\nNo regressions against {args.baseline}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,116 @@
+import io
+import random
+from typing import List, Optional, Tuple
+
+import fitz  # PyMuPDF
+
+PARAGRAPH = (
+    "Section {page}.{line}: For adults with type 2 diabetes, start metformin 500 mg once daily "
+    "with the evening meal and titrate by 500 mg weekly to a maximum of 2000 mg. Check eGFR "
+    "before starting; avoid if eGFR is below 30 mL/min/1.73m2 (ICD-10 E11.9, N18.4)."
+)
+
+
+def _jpeg(seed: int, size: int) -> bytes:
+    from PIL import Image, ImageDraw
+
+    # Gradient plus a seed-dependent stripe: photo-like enough that PNG re-encoding bloats it
+    image = Image.linear_gradient("L").resize((size, size)).convert("RGB")
+    ImageDraw.Draw(image).rectangle((0, 0, size, size // 4), fill=((seed * 37) % 256, (seed * 91) % 256, 0))
+    buffer = io.BytesIO()
+    image.save(buffer, format="JPEG", quality=85)
+    return buffer.getvalue()
+
+
+def make_pdf(pages: int, lines_per_page: int = 20, images_per_page: int = 0,
+             image_size: int = 256, distinct_images: Optional[int] = None) -> bytes:
+    """
+    Build a clinical-guideline-like PDF with text on every page and optional images.
+
+    ``distinct_images`` caps the number of different images, so the same figure
+    (e.g. a logo) repeats across pages as it does in real documents.
+    """
+    document = fitz.open()
+    image_cache = {}
+    for page_number in range(pages):
+        page = document.new_page()
+        text = "\n".join(PARAGRAPH.format(page=page_number + 1, line=line + 1) for line in range(lines_per_page))
+        overflow = page.insert_textbox(fitz.Rect(36, 36, 576, 520 if images_per_page else 806), text, fontsize=6)
+        if overflow < 0:
+            raise ValueError(f"{lines_per_page} lines do not fit on a page")
+        for i in range(images_per_page):
+            seed = page_number * images_per_page + i
+            if distinct_images:
+                seed %= distinct_images
+            if seed not in image_cache:
+                image_cache[seed] = _jpeg(seed, image_size)
+            x = 36 + i * 140
+            page.insert_image(fitz.Rect(x, 540, x + 130, 670), stream=image_cache[seed])
+    buffer = io.BytesIO()
+    document.save(buffer, garbage=3, deflate=True)
+    return buffer.getvalue()
+
+
+DRUGS = [
+    "metformin", "gliclazide", "sitagliptin", "empagliflozin", "dapagliflozin", "pioglitazone", "liraglutide",
+    "semaglutide", "insulin glargine", "ramipril", "lisinopril", "amlodipine", "bisoprolol", "atorvastatin",
+    "simvastatin", "warfarin", "apixaban", "rivaroxaban", "clopidogrel", "furosemide", "spironolactone",
+    "levothyroxine", "omeprazole", "sertraline", "amoxicillin", "doxycycline", "prednisolone", "allopurinol",
+    "colchicine", "methotrexate",
+]
+SIDE_EFFECTS = ["nausea", "dizziness", "headache", "hypoglycaemia", "rash", "oedema", "cough", "fatigue",
+                "constipation", "insomnia"]
+MONITORING = ["renal function", "liver enzymes", "blood pressure", "serum potassium", "full blood count",
+              "HbA1c", "lipid profile", "thyroid function"]
+FILLER = [
+    "Treatment decisions should be individualised and reviewed at each visit.",
+    "Discuss the expected benefits and possible harms with the patient before starting.",
+    "Consider adherence, frailty and comorbidities when choosing a regimen.",
+    "Record the indication and the planned review date in the clinical notes.",
+    "Advise patients to report any new or worsening symptoms promptly.",
+    "Dose adjustments may be required in older adults and in hepatic impairment.",
+]
+
+
+def make_guideline_pdf(drugs: int = 30, sections_per_page: int = 3, seed: int = 0) -> Tuple[bytes, List[Tuple[str, str]]]:
+    """
+    Build a multi-section prescribing guideline and a Q&A set over it.
+
+    Each drug gets a numbered section of general advice with three facts
+    (maximum dose, most common side effect, monitoring) buried in it. Returns
+    the PDF and a list of (question, answer) pairs, where the answer is a
+    string that occurs only in the passage stating the fact.
+    """
+    rng = random.Random(seed)
+    document = fitz.open()
+    qa = []
+    sections = []
+    for i, drug in enumerate(DRUGS[:drugs]):
+        dose = rng.choice([5, 10, 20, 40, 80, 100, 150, 250, 500]) * rng.choice([1, 2, 4])
+        side_effect = rng.choice(SIDE_EFFECTS)
+        monitoring = rng.choice(MONITORING)
+        months = rng.choice([1, 3, 6, 12])
+        facts = [
+            f"The maximum daily dose of {drug} is {dose} mg.",
+            f"The most frequently reported adverse effect of {drug} is {side_effect}.",
+            f"Patients taking {drug} should have their {monitoring} checked every {months} months.",
+        ]
+        qa += [
+            (f"What is the maximum daily dose of {drug}?", f"{drug} is {dose} mg"),
+            (f"What is the most common adverse effect of {drug}?", f"{drug} is {side_effect}"),
+            (f"How often should patients on {drug} be monitored?", f"checked every {months} months"),
+        ]
+        paragraphs = []
+        for fact in facts:
+            filler = rng.sample(FILLER, 3)
+            paragraphs.append(" ".join(filler[:2] + [fact] + filler[2:]))
+        sections.append(f"{i + 1}. {drug.title()} Prescribing\n" + "\n\n".join(paragraphs))
+    for start in range(0, len(sections), sections_per_page):
+        page = document.new_page()
+        text = "\n\n".join(sections[start:start + sections_per_page])
+        if page.insert_textbox(fitz.Rect(36, 36, 576, 806), text, fontsize=9) < 0:
+            raise ValueError(f"{sections_per_page} sections do not fit on a page")
+    buffer = io.BytesIO()
+    document.save(buffer, garbage=3, deflate=True)
+    return buffer.getvalue(), qa
+
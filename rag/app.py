@@ -1,15 +1,9 @@
 import streamlit as st
-from llama_index.core import VectorStoreIndex, Settings, Document
-from llama_index.core.embeddings import resolve_embed_model
-from llama_index.core.postprocessor import SentenceTransformerRerank
-from llama_index.core.llms import LLM
-from claude_llm import Claude
-from document_processor import process_healthcare_document
-from healthcare_utils import process_healthcare_query
-import os
-import asyncio
-from typing import Any, List, Optional
-from pydantic import BaseModel, Field
+from claude_llm import run_async
+from models import registry
+from resilience import ServiceBusyError
+import time
+import tracing
 
 def reset():
     st.session_state.messages = []
@@ -17,7 +11,6 @@ def reset():
 st.title("Healthcare Document Interrogation System")
 
 api_key = st.sidebar.text_input("Claude API Key", type="password")
-os.environ["ANTHROPIC_API_KEY"] = api_key
 
 def provider(model_name):
     return "claude-3-5-sonnet-20240620"
@@ -28,98 +21,109 @@ def mp_fragment():
     provider_name = provider(model_name)
     return model_name, provider_name
 
-class LLMMetadata(BaseModel):
-    model_name: str = Field(description="The model name")
-    context_window: int = Field(description="The context window size")
-    num_output: int = Field(description="Maximum number of output tokens")
-    is_chat_model: bool = Field(description="Whether the model is a chat model")
-    is_function_calling_model: bool = Field(description="Whether the model supports function calling")
-    max_tokens: Optional[int] = Field(description="The maximum number of tokens (if applicable)")
-    system_role: str = Field(default="system", description="The role for system messages")
-
-class ClaudeLLM(LLM):
-    claude_instance: Claude = Field(exclude=True)
-
-    def __init__(self, claude_instance: Claude):
-        super().__init__()
-        self.claude_instance = claude_instance
-
-    @property
-    def metadata(self) -> LLMMetadata:
-        return LLMMetadata(
-            model_name=self.claude_instance.model,
-            context_window=self.claude_instance.context_window,
-            num_output=self.claude_instance.max_tokens,
-            is_chat_model=True,
-            is_function_calling_model=False,
-            max_tokens=self.claude_instance.max_tokens,
-            system_role="system"
-        )
-
-    def complete(self, prompt: str, **kwargs: Any) -> str:
-        return self.claude_instance.complete(prompt, **kwargs)
-
-    def chat(self, messages: List[Any], **kwargs: Any) -> str:
-        return self.claude_instance.chat(messages, **kwargs)
-
-    def stream_complete(self, prompt: str, **kwargs: Any) -> Any:
-        raise NotImplementedError("Stream complete not implemented for Claude")
-
-    def stream_chat(self, messages: List[Any], **kwargs: Any) -> Any:
-        raise NotImplementedError("Stream chat not implemented for Claude")
-
-    async def acomplete(self, prompt: str, **kwargs: Any) -> str:
-        return await asyncio.to_thread(self.complete, prompt, **kwargs)
-
-    async def achat(self, messages: List[Any], **kwargs: Any) -> str:
-        return await asyncio.to_thread(self.chat, messages, **kwargs)
-
-    async def astream_chat(self, messages: List[Any], **kwargs: Any) -> Any:
-        raise NotImplementedError("Async stream chat not implemented for Claude")
+# The pipeline lives once per process: models, caches, the circuit breaker,
+# the ingestion workers and the document indexes survive Streamlit reruns and
+# are shared by every session, which is just one client of the service.
+# The embedder and reranker warm up in the background, so the first page
+# renders before they are loaded.
+@st.cache_resource
+def rag_service():
+    # Imported here so the title and sidebar render before llama_index loads on a cold start
+    from service import RAGService
 
-    async def astream_complete(self, prompt: str, **kwargs: Any) -> Any:
-        raise NotImplementedError("Async stream complete not implemented for Claude")
+    return RAGService.from_env()
 
 def load_models(model_name, provider_name):
-    claude = Claude(model=model_name, api_key=api_key)
-    Settings.llm = ClaudeLLM(claude)
-    Settings.embed_model = resolve_embed_model("local:BAAI/bge-small-en-v1.5")
-    st.write(f"Models loaded: {model_name}")
-    return claude
-
-@st.cache_resource
-def rerank_model():
-    rerank = SentenceTransformerRerank(
-        model="cross-encoder/ms-marco-MiniLM-L-2-v2", top_n=3
+    service = rag_service()
+    # Claude instances are cheap: the HTTP connection pool behind them is shared process-wide
+    claude = service.claude(api_key)
+    loading = registry.pending()
+    if loading:
+        st.caption(f"Loading {', '.join(loading)} in the background; the first answer waits for them.")
+    else:
+        st.write(f"Models loaded: {claude.model}")
+    return service, claude
+
+def latency_waterfall(trace_id):
+    """Gantt chart of the spans of one turn: retrieval, reranking, each Claude call."""
+    import altair as alt
+    import pandas as pd
+
+    rows = tracing.waterfall(tracing.tracer.trace(trace_id))
+    if not rows:
+        st.caption("No trace recorded for the last turn.")
+        return
+    for i, row in enumerate(rows):
+        # Numbered so repeated span names get their own rows
+        row["label"] = f"{i + 1:02d} {'· ' * row['depth']}{row['span']}"
+    frame = pd.DataFrame(rows)
+    chart = alt.Chart(frame).mark_bar().encode(
+        x=alt.X("start_ms", title="ms since the turn started"), x2="end_ms",
+        y=alt.Y("label", sort=None, title=None), color=alt.Color("depth:O", legend=None),
+        tooltip=[column for column in frame.columns if column not in ("label", "depth", "start_ms", "end_ms")],
     )
-    return rerank
+    st.altair_chart(chart, use_container_width=True)
 
 with st.sidebar:
     model_name, provider_name = mp_fragment()
-    uploaded_file = st.file_uploader("Upload a healthcare PDF", accept_multiple_files=False, on_change=reset)
+    uploaded_files = st.file_uploader("Upload healthcare PDFs", type="pdf", accept_multiple_files=True)
     st.sidebar.button("Clear Chat History", on_click=reset)
-
-claude_instance = load_models(model_name, provider_name)
-
-if uploaded_file is not None:
-    @st.cache_resource
-    def vector_store(uploaded_file):
-        try:
-            st.write(f"Processing file: {uploaded_file.name}")
-            documents = process_healthcare_document(uploaded_file, include_vision=True)
-            st.write(f"Created {len(documents)} document chunks")
-            index = VectorStoreIndex.from_documents(documents)
-            st.write("Vector index created successfully")
-            return index 
-        except Exception as e:
-            st.error(f"Error creating index: {str(e)}")
-           
-    index = vector_store(uploaded_file)
-    if index:
-        chat_engine = index.as_chat_engine(chat_mode="context", verbose=True, similarity_top_k=10, node_postprocessors=[rerank_model()])
-        st.write("Chat engine created successfully")
-    else:
-        st.error("Failed to create chat engine")
+    show_waterfall = st.checkbox("Show latency waterfall")
+
+service, claude_instance = load_models(model_name, provider_name)
+
+with st.sidebar.expander("Response cache"):
+    stats = claude_instance.response_cache.stats
+    st.write(f"Hit rate: {stats.hit_rate:.0%} ({stats.exact_hits} exact, {stats.semantic_hits} semantic, "
+             f"{stats.persistent_hits} from disk, {stats.misses} misses)")
+    st.write(f"Latency saved: {stats.latency_saved:.1f}s")
+
+with st.sidebar.expander("API health"):
+    health = claude_instance.policy.stats()
+    p95 = f"{health['p95_latency']:.1f}s" if health["p95_latency"] is not None else "n/a"
+    st.write(f"Circuit: {health['circuit']} · p95 latency: {p95}")
+    st.write(f"Retries: {health['retries']} · hedged requests: {health['hedges']}")
+    load = service.limiter.stats()
+    st.write(f"Queries in flight: {load['in_flight']} · turned away: {load['rejected']}")
+
+with st.sidebar.expander("Reranker"):
+    rerank_stats = service.rerank.stats()
+    if rerank_stats["p95_latency"] is not None:
+        st.write(f"Latency: p50 {rerank_stats['p50_latency'] * 1000:.0f} ms · p95 {rerank_stats['p95_latency'] * 1000:.0f} ms")
+    st.write(f"Reranked: {rerank_stats['reranks']} · skipped: {rerank_stats['skipped']} · "
+             f"cached scores used: {rerank_stats['cache_hits']}")
+
+# Uploads are ingested by the service's worker pool; the same file uploaded in
+# several sessions is one shared document. This session queries its own uploads,
+# including those still being ingested, over what is indexed so far.
+document_ids, ingesting = [], []
+for uploaded_file in uploaded_files or []:
+    job = service.ingest(uploaded_file.getvalue(), uploaded_file.name, api_key=api_key)
+    if job.status == "failed":
+        st.error(f"Error creating index for {uploaded_file.name}: {job.error}")
+        if st.button("Retry", key=f"retry-{job.key}"):
+            service.ingest(uploaded_file.getvalue(), uploaded_file.name, api_key=api_key, retry=True)
+            st.rerun()
+        continue
+    document_ids.append(job.key)
+    if not job.done:
+        ingesting.append(uploaded_file.name)
+        status = job.snapshot()
+        if status["status"] == "queued":
+            text = f"{uploaded_file.name}: waiting for a free worker"
+        elif status["images_total"] and status["pages_done"] == status["pages_total"]:
+            text = f"{uploaded_file.name}: captioned {status['images_done']}/{status['images_total']} figures"
+        else:
+            text = (f"{uploaded_file.name}: read {status['pages_done']}/{status['pages_total'] or '?'} pages, "
+                    f"{status['nodes_indexed']} chunks searchable")
+        st.progress(status["progress"], text=text)
+
+ready = [service.corpus.documents[key]["source"] for key in document_ids if key in service.corpus]
+if ready:
+    still = f" (still indexing {', '.join(ingesting)})" if ingesting else ""
+    st.write(f"Chat engine ready over {len(ready)} document(s): {', '.join(ready)}{still}")
+elif uploaded_files and not ingesting:
+    st.error("Failed to create chat engine")
 
 if "messages" not in st.session_state:
     st.session_state.messages = []
@@ -137,9 +141,9 @@ if len(st.session_state.messages) == 0:
 if prompt := st.chat_input():
     if not api_key:
         st.warning("Please enter a Claude API key.")
-    elif not uploaded_file:
+    elif not uploaded_files:
         st.warning("Please upload a healthcare document.")
-    elif 'chat_engine' not in locals():
+    elif not ready:
         st.warning("Chat engine not initialized. Please check for errors above.")
     else: 
         st.session_state.messages.append({"role": "user", "content": prompt})
@@ -148,16 +152,17 @@ if prompt := st.chat_input():
         
         with st.chat_message("assistant"):
             try:
-                st.write("Processing query...")
-                chat_response = chat_engine.chat(prompt)
-                print(chat_response)
-                st.write("Query processed successfully")
-                
-                # Process the query using Claude 3.5 Sonnet
-                result = process_healthcare_query(str(chat_response), claude_instance)
-                
-                # Display the formatted response
-                st.write(result["response"])
+                with tracing.span("turn") as turn:
+                    st.session_state.last_trace = turn.trace_id
+                    # Render the answer token by token as Claude generates it
+                    # Earlier turns are trimmed to the history budget, older ones summarized
+                    answer = st.write_stream(service.stream_chat(prompt, history=st.session_state.messages[:-1],
+                                                                 document_ids=document_ids, api_key=api_key))
+
+                    # Categorize the question and pull key points and follow-ups out of the answer shown
+                    with st.spinner("Extracting key points..."):
+                        result = run_async(service.aanalyze(prompt, answer, api_key))
+                st.caption(f"Category: {result['category']}")
                 
                 # Display key points
                 st.write("Key Points:")
@@ -169,7 +174,19 @@ if prompt := st.chat_input():
                 for question in result["follow_up_questions"]:
                     st.write(f"• {question}")
                 
-                st.session_state.messages.append({"role": "assistant", "content": result["response"]})
+                st.session_state.messages.append({"role": "assistant", "content": answer})
             
+            except ServiceBusyError:
+                st.session_state.messages.pop()
+                st.warning("The service is busy answering other questions; please try again in a moment.")
             except Exception as e:
-                st.error(f"Error processing query: {str(e)}")
\ No newline at end of file
+                st.error(f"Error processing query: {str(e)}")
+
+if show_waterfall and "last_trace" in st.session_state:
+    with st.expander("Latency of the last turn", expanded=True):
+        latency_waterfall(st.session_state.last_trace)
+
+# Poll while documents are still being ingested, so new batches become searchable and progress moves
+if ingesting:
+    time.sleep(1)
+    st.rerun()
@@ -0,0 +1,198 @@
+import hashlib
+import re
+from dataclasses import dataclass
+from typing import Iterable, Iterator, List, Optional, Tuple
+
+from llama_index.core import Document
+
+from context_packer import estimate_tokens
+
+# Offsets and the end page locate a chunk in the PDF; they mean nothing to the embedding model or Claude
+PROVENANCE_METADATA_KEYS = ["page_end", "char_start", "char_end"]
+
+_NUMBERED = re.compile(r"^(\d+(\.\d+)*\.?|[A-Z]\.|[IVX]+\.)\s+\S")
+_CELL_GAP = re.compile(r"\S(?:\t+| {2,}| *\| *)(?=\S)")
+_SENTENCE_END = re.compile(r"(?<=[.!?])[\"')\]]*\s+(?=[A-Z0-9\"'(\[])")
+
+
+@dataclass
+class _Unit:
+    kind: str  # "heading", "sentence" or "row"
+    text: str
+    page: int
+    start: int
+    end: int
+
+
+def is_heading(line: str) -> bool:
+    """Short, unpunctuated, numbered / upper-case / title-case lines."""
+    words = line.split()
+    if not words or len(words) > 12 or len(line) > 80 or line[-1] in ".,;:!?":
+        return False
+    if _NUMBERED.match(line) or (line.isupper() and len(line) > 3):
+        return True
+    capitalized = [w for w in words if w[0].isupper() or not w[0].isalpha()]
+    return len(words) > 1 and len(capitalized) / len(words) >= 0.75
+
+
+def is_table_row(line: str) -> bool:
+    return len(_CELL_GAP.findall(line)) >= 2
+
+
+def _sentences(text: str, page: int, offset: int) -> Iterator[_Unit]:
+    start = 0
+    for match in _SENTENCE_END.finditer(text):
+        sentence = text[start:match.start()].strip()
+        if sentence:
+            yield _Unit("sentence", sentence, page, offset + start, offset + match.start())
+        start = match.end()
+    sentence = text[start:].strip()
+    if sentence:
+        yield _Unit("sentence", sentence, page, offset + start, offset + len(text.rstrip()))
+
+
+def _page_units(page: int, text: str) -> Iterator[_Unit]:
+    """Headings, sentences and table rows of one page, with character offsets into ``text``."""
+    lines: List[Tuple[int, str]] = []
+    position = 0
+    for line in text.split("\n"):
+        lines.append((position, line))
+        position += len(line) + 1
+
+    paragraph_start: Optional[int] = None
+    paragraph_end = 0
+    for i, (offset, line) in enumerate(lines):
+        stripped = line.strip()
+        rows = [stripped, lines[i - 1][1].strip() if i else "", lines[i + 1][1].strip() if i + 1 < len(lines) else ""]
+        # A row only counts as part of a table next to another row
+        is_row = is_table_row(stripped) and (is_table_row(rows[1]) or is_table_row(rows[2]))
+        # Wrapped paragraph lines can look like headings, so a heading must follow a finished sentence
+        after_sentence = paragraph_start is None or rows[1].endswith((".", "!", "?", ":"))
+        plain = stripped and not is_row and not (after_sentence and is_heading(stripped))
+        if plain:
+            if paragraph_start is None:
+                paragraph_start = offset
+            paragraph_end = offset + len(line)
+            continue
+        if paragraph_start is not None:
+            # Newlines become spaces, so offsets into the joined paragraph still match the page text
+            yield from _sentences(text[paragraph_start:paragraph_end].replace("\n", " "), page, paragraph_start)
+            paragraph_start = None
+        if is_row:
+            yield _Unit("row", stripped, page, offset, offset + len(line))
+        elif stripped:
+            yield _Unit("heading", stripped, page, offset, offset + len(line))
+    if paragraph_start is not None:
+        yield from _sentences(text[paragraph_start:paragraph_end].replace("\n", " "), page, paragraph_start)
+
+
+class StructureChunker:
+    """
+    Split page text into chunks along the document's structure.
+
+    Chunks never cross a section heading, which is kept in the chunk's
+    ``section`` metadata. Within a section, sentences are packed up to
+    ``chunk_tokens`` and consecutive chunks share ``overlap_sentences``
+    sentences. Tables (runs of lines with column gaps) become their own chunks,
+    split by row with the header row repeated when they are too long. Every
+    chunk records the page and character offset it starts at and where it ends.
+    """
+
+    def __init__(self, chunk_tokens: int = 256, overlap_sentences: int = 1) -> None:
+        self.chunk_tokens = chunk_tokens
+        self.overlap_sentences = overlap_sentences
+
+    def config(self) -> dict:
+        return {"chunking": "structure", "chunk_tokens": self.chunk_tokens, "overlap_sentences": self.overlap_sentences}
+
+    def _document(self, units: List[_Unit], source: str, section: str, chunk_type: str) -> Document:
+        separator = "\n" if chunk_type == "table" else " "
+        text = separator.join(unit.text for unit in units)
+        first, last = units[0], units[-1]
+        doc_id = hashlib.sha256(f"{source}|{first.page}|{first.start}|{last.page}|{last.end}|{text}".encode()).hexdigest()
+        return Document(
+            id_=doc_id,
+            text=text,
+            metadata={
+                "source": source,
+                "page": first.page,
+                "page_end": last.page,
+                "char_start": first.start,
+                "char_end": last.end,
+                "section": section,
+                "chunk_type": chunk_type,
+            },
+            excluded_embed_metadata_keys=PROVENANCE_METADATA_KEYS,
+            excluded_llm_metadata_keys=PROVENANCE_METADATA_KEYS,
+        )
+
+    def _table_chunks(self, rows: List[_Unit], source: str, section: str) -> Iterator[Document]:
+        header, body = rows[0], rows[1:]
+        batch, tokens = [header], estimate_tokens(header.text)
+        for row in body:
+            row_tokens = estimate_tokens(row.text)
+            if len(batch) > 1 and tokens + row_tokens > self.chunk_tokens:
+                yield self._document(batch, source, section, "table")
+                batch, tokens = [header], estimate_tokens(header.text)
+            batch.append(row)
+            tokens += row_tokens
+        yield self._document(batch, source, section, "table")
+
+    def iter_chunks(self, pages: Iterable[Tuple[int, str]], source: str) -> Iterator[Document]:
+        """Chunk Documents for ``(page number, page text)`` pairs, yielded as soon as each is complete."""
+        section = ""
+        sentences: List[_Unit] = []
+        tokens = 0
+        rows: List[_Unit] = []
+
+        def flush_sentences() -> Iterator[Document]:
+            nonlocal sentences, tokens
+            if sentences:
+                yield self._document(sentences, source, section, "text")
+            sentences, tokens = [], 0
+
+        def flush_rows() -> Iterator[Document]:
+            nonlocal rows
+            if rows:
+                yield from self._table_chunks(rows, source, section)
+            rows = []
+
+        for page, text in pages:
+            for unit in _page_units(page, text):
+                if unit.kind != "row":
+                    yield from flush_rows()
+                if unit.kind == "heading":
+                    yield from flush_sentences()
+                    section = unit.text
+                elif unit.kind == "row":
+                    if not rows:
+                        yield from flush_sentences()
+                    rows.append(unit)
+                else:
+                    unit_tokens = estimate_tokens(unit.text)
+                    if sentences and tokens + unit_tokens > self.chunk_tokens:
+                        # Only carry sentences over if the chunk had more than that, or chunks would repeat
+                        keep = self.overlap_sentences if len(sentences) > self.overlap_sentences else 0
+                        overlap = sentences[-keep:] if keep else []
+                        yield self._document(sentences, source, section, "text")
+                        sentences = overlap
+                        tokens = sum(estimate_tokens(s.text) for s in sentences)
+                    sentences.append(unit)
+                    tokens += unit_tokens
+        yield from flush_rows()
+        yield from flush_sentences()
+
+
+CHUNKING_MODES = ["structure", "page"]
+
+
+def make_chunker(mode: str = "structure", chunk_tokens: int = 256, overlap_sentences: int = 1) -> Optional[StructureChunker]:
+    """The chunker for a chunking mode; "page" means one Document per page, i.e. no chunker."""
+    if mode not in CHUNKING_MODES:
+        raise ValueError(f"Invalid chunking mode: {mode}. Choose from {CHUNKING_MODES}")
+    return StructureChunker(chunk_tokens, overlap_sentences) if mode == "structure" else None
+
+
+def chunking_config(chunker: Optional[StructureChunker]) -> dict:
+    """The index_config entries describing ``chunker``."""
+    return chunker.config() if chunker else {"chunking": "page"}
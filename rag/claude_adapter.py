@@ -0,0 +1,122 @@
+import asyncio
+from typing import Any, Dict, List, Optional, Tuple
+
+from llama_index.core.base.llms.types import (
+    ChatMessage, ChatResponse, ChatResponseAsyncGen, ChatResponseGen,
+    CompletionResponse, CompletionResponseAsyncGen, CompletionResponseGen, MessageRole,
+)
+from llama_index.core.llms import LLM
+from pydantic import BaseModel, Field
+
+from claude_llm import Claude
+
+
+class LLMMetadata(BaseModel):
+    model_name: str = Field(description="The model name")
+    context_window: int = Field(description="The context window size")
+    num_output: int = Field(description="Maximum number of output tokens")
+    is_chat_model: bool = Field(description="Whether the model is a chat model")
+    is_function_calling_model: bool = Field(description="Whether the model supports function calling")
+    max_tokens: Optional[int] = Field(description="The maximum number of tokens (if applicable)")
+    system_role: str = Field(default="system", description="The role for system messages")
+
+class ClaudeLLM(LLM):
+    claude_instance: Claude = Field(exclude=True)
+
+    def __init__(self, claude_instance: Claude):
+        super().__init__()
+        self.claude_instance = claude_instance
+
+    @property
+    def metadata(self) -> LLMMetadata:
+        return LLMMetadata(
+            model_name=self.claude_instance.model,
+            context_window=self.claude_instance.context_window,
+            num_output=self.claude_instance.max_tokens,
+            is_chat_model=True,
+            is_function_calling_model=False,
+            max_tokens=self.claude_instance.max_tokens,
+            system_role="system"
+        )
+
+    def _to_claude_messages(self, messages: List[Any]) -> Tuple[Optional[Any], List[Dict[str, Any]]]:
+        """
+        Split llama-index chat messages into Claude's system prompt and message list.
+
+        A message with ``cache_control`` in its ``additional_kwargs`` becomes a
+        content block carrying it, so the prompt up to and including it is
+        cached; the system prompt is then sent as a list of blocks.
+        """
+        system_blocks = []
+        prepared_messages = []
+        for message in messages:
+            if isinstance(message, ChatMessage):
+                role, content = message.role.value, message.content or ""
+                cache_control = message.additional_kwargs.get("cache_control")
+            else:
+                role, content, cache_control = message["role"], message["content"], message.get("cache_control")
+            # The API rejects empty text blocks, so an empty message cannot end a cached prefix
+            block = {"type": "text", "text": content, "cache_control": cache_control} if cache_control and content else None
+            if role == MessageRole.SYSTEM.value:
+                system_blocks.append(block or {"type": "text", "text": content})
+            else:
+                prepared_messages.append({"role": role, "content": [block] if block else content})
+        if any("cache_control" in block for block in system_blocks):
+            return [block for block in system_blocks if block["text"]], prepared_messages
+        return ("\n\n".join(block["text"] for block in system_blocks) or None), prepared_messages
+
+    def _chat_kwargs(self, messages: List[Any], kwargs: Dict[str, Any]) -> Tuple[List[Dict[str, Any]], Dict[str, Any]]:
+        system, prepared_messages = self._to_claude_messages(messages)
+        if system:
+            kwargs = {**kwargs, "system": system}
+        return prepared_messages, kwargs
+
+    def complete(self, prompt: str, formatted: bool = False, **kwargs: Any) -> CompletionResponse:
+        return CompletionResponse(text=self.claude_instance.complete(prompt, **kwargs))
+
+    def chat(self, messages: List[Any], **kwargs: Any) -> ChatResponse:
+        prepared_messages, kwargs = self._chat_kwargs(messages, kwargs)
+        text = self.claude_instance.chat(prepared_messages, **kwargs)
+        return ChatResponse(message=ChatMessage(role=MessageRole.ASSISTANT, content=text))
+
+    def stream_complete(self, prompt: str, formatted: bool = False, **kwargs: Any) -> CompletionResponseGen:
+        def gen() -> CompletionResponseGen:
+            text = ""
+            for delta in self.claude_instance.stream_complete(prompt, **kwargs):
+                text += delta
+                yield CompletionResponse(text=text, delta=delta)
+        return gen()
+
+    def stream_chat(self, messages: List[Any], **kwargs: Any) -> ChatResponseGen:
+        prepared_messages, kwargs = self._chat_kwargs(messages, kwargs)
+
+        def gen() -> ChatResponseGen:
+            text = ""
+            for delta in self.claude_instance.stream_chat(prepared_messages, **kwargs):
+                text += delta
+                yield ChatResponse(message=ChatMessage(role=MessageRole.ASSISTANT, content=text), delta=delta)
+        return gen()
+
+    async def acomplete(self, prompt: str, formatted: bool = False, **kwargs: Any) -> CompletionResponse:
+        return CompletionResponse(text=await self.claude_instance.acomplete(prompt, **kwargs))
+
+    async def achat(self, messages: List[Any], **kwargs: Any) -> ChatResponse:
+        return await asyncio.to_thread(self.chat, messages, **kwargs)
+
+    async def astream_chat(self, messages: List[Any], **kwargs: Any) -> ChatResponseAsyncGen:
+        prepared_messages, kwargs = self._chat_kwargs(messages, kwargs)
+
+        async def gen() -> ChatResponseAsyncGen:
+            text = ""
+            async for delta in self.claude_instance.astream_chat(prepared_messages, **kwargs):
+                text += delta
+                yield ChatResponse(message=ChatMessage(role=MessageRole.ASSISTANT, content=text), delta=delta)
+        return gen()
+
+    async def astream_complete(self, prompt: str, formatted: bool = False, **kwargs: Any) -> CompletionResponseAsyncGen:
+        async def gen() -> CompletionResponseAsyncGen:
+            text = ""
+            async for delta in self.claude_instance.astream_complete(prompt, **kwargs):
+                text += delta
+                yield CompletionResponse(text=text, delta=delta)
+        return gen()
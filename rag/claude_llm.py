@@ -1,18 +1,182 @@
 import os
-from anthropic import Anthropic, APIError
-from typing import Optional, List, Any
+import asyncio
+import logging
+import threading
+import weakref
+try:
+    # Newer anthropic SDKs run on their own httpx fork and reject plain httpx clients
+    import httpx2 as httpx
+except ImportError:
+    import httpx
+from anthropic import Anthropic, AsyncAnthropic, APIError
+from typing import Optional, List, Any, Awaitable, Iterator, AsyncIterator, Dict, Tuple, TypeVar
 import base64
+import time
+from dataclasses import asdict, dataclass
+import tracing
+from image_store import detect_media_type
+from resilience import ResiliencePolicy
+from response_cache import Prompt, ResponseCache
+
+logger = logging.getLogger(__name__)
 
 # Set this environment variable to suppress tokenizer warnings
 os.environ["TOKENIZERS_PARALLELISM"] = "false"
 
+def pool_limits(max_connections: int = 32, max_keepalive_connections: int = 16,
+                keepalive_expiry: float = 30.0) -> httpx.Limits:
+    return httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_keepalive_connections,
+                        keepalive_expiry=keepalive_expiry)
+
+DEFAULT_LIMITS = pool_limits()
+DEFAULT_TIMEOUT = httpx.Timeout(120.0, connect=10.0)
+
+T = TypeVar("T")
+
+# Ends a cacheable prompt prefix. Prefixes shorter than the model's minimum
+# (1024 tokens for Sonnet and Opus) are silently not cached.
+CACHE_CONTROL = {"type": "ephemeral"}
+
+def cached_text(text: str) -> Dict[str, Any]:
+    """A text content block that ends a prompt-cache prefix: the prompt up to and including it is cached for reuse."""
+    return {"type": "text", "text": text, "cache_control": CACHE_CONTROL}
+
+@dataclass
+class TokenUsage:
+    """
+    Tokens billed across calls. Input is split three ways: uncached tokens,
+    tokens written to the prompt cache, and tokens read from it.
+    """
+    requests: int = 0
+    input_tokens: int = 0
+    cache_creation_input_tokens: int = 0
+    cache_read_input_tokens: int = 0
+    output_tokens: int = 0
+
+    def add(self, usage: Any) -> None:
+        """Add an Anthropic response's ``usage``."""
+        with _usage_lock:
+            self.requests += 1
+            for key in ("input_tokens", "cache_creation_input_tokens", "cache_read_input_tokens", "output_tokens"):
+                setattr(self, key, getattr(self, key) + (getattr(usage, key, None) or 0))
+
+    @property
+    def cache_read_rate(self) -> float:
+        """Fraction of input tokens read from the prompt cache."""
+        total = self.input_tokens + self.cache_creation_input_tokens + self.cache_read_input_tokens
+        return self.cache_read_input_tokens / total if total else 0.0
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {**asdict(self), "cache_read_rate": self.cache_read_rate}
+
+_ClientKey = Tuple[Optional[str], Optional[str], Tuple[Any, ...]]
+_clients: Dict[_ClientKey, Anthropic] = {}
+# httpx async connections belong to the event loop that opened them, and each
+# asyncio.run gets a new loop, so async clients are pooled per loop (run_async
+# closes them when its loop ends)
+_async_clients: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, Dict[_ClientKey, AsyncAnthropic]]" = weakref.WeakKeyDictionary()
+_policies: Dict[Optional[str], ResiliencePolicy] = {}
+_usages: Dict[Optional[str], TokenUsage] = {}
+_pool_lock = threading.Lock()
+_usage_lock = threading.Lock()
+
+def _client_key(api_key: Optional[str], base_url: Optional[str], limits: httpx.Limits) -> _ClientKey:
+    return api_key, base_url, (limits.max_connections, limits.max_keepalive_connections, limits.keepalive_expiry)
+
+def shared_client(api_key: Optional[str] = None, base_url: Optional[str] = None,
+                  limits: httpx.Limits = DEFAULT_LIMITS) -> Anthropic:
+    """
+    Process-wide keep-alive client for this key and endpoint.
+
+    The SDK's own retries are disabled; ResiliencePolicy retries instead.
+    """
+    key = _client_key(api_key, base_url, limits)
+    with _pool_lock:
+        if key not in _clients:
+            _clients[key] = Anthropic(api_key=api_key, base_url=base_url, max_retries=0,
+                                      http_client=httpx.Client(limits=limits, timeout=DEFAULT_TIMEOUT))
+        return _clients[key]
+
+def shared_async_client(api_key: Optional[str] = None, base_url: Optional[str] = None,
+                        limits: httpx.Limits = DEFAULT_LIMITS) -> AsyncAnthropic:
+    """Like shared_client, pooled per running event loop."""
+    key = _client_key(api_key, base_url, limits)
+    loop = asyncio.get_running_loop()
+    with _pool_lock:
+        clients = _async_clients.setdefault(loop, {})
+        if key not in clients:
+            clients[key] = AsyncAnthropic(api_key=api_key, base_url=base_url, max_retries=0,
+                                          http_client=httpx.AsyncClient(limits=limits, timeout=DEFAULT_TIMEOUT))
+        return clients[key]
+
+async def close_async_clients() -> None:
+    """Close the async clients pooled for the running event loop, which must not outlive it."""
+    loop = asyncio.get_running_loop()
+    with _pool_lock:
+        clients = _async_clients.pop(loop, {})
+    for client in clients.values():
+        await client.close()
+
+def run_async(coroutine: Awaitable[T]) -> T:
+    """
+    ``asyncio.run(coroutine)``, closing the async clients it pooled before its loop ends.
+
+    Each asyncio.run has a loop of its own, so callers that run one per
+    request (the Streamlit script) would otherwise leave a client and its
+    open connections behind every time.
+    """
+    async def main() -> T:
+        try:
+            return await coroutine
+        finally:
+            await close_async_clients()
+    return asyncio.run(main())
+
+def shared_policy(base_url: Optional[str] = None) -> ResiliencePolicy:
+    """Default policy per endpoint, so the circuit breaker outlives Claude instances."""
+    with _pool_lock:
+        if base_url not in _policies:
+            _policies[base_url] = ResiliencePolicy()
+        return _policies[base_url]
+
+def shared_usage(base_url: Optional[str] = None) -> TokenUsage:
+    """Token usage per endpoint, tallied across Claude instances."""
+    with _pool_lock:
+        if base_url not in _usages:
+            _usages[base_url] = TokenUsage()
+        return _usages[base_url]
+
+def _log_error(action: str, error: Exception) -> None:
+    # The type and status code only: API error messages can quote the prompt, and so patient data
+    if isinstance(error, APIError) and "credit balance is too low" in str(error):
+        logger.error("Claude %s failed: insufficient credits; upgrade the Anthropic account or purchase more credits",
+                     action)
+    else:
+        logger.error("Claude %s failed: %s (status %s)", action, type(error).__name__,
+                     getattr(error, "status_code", None))
+
 class Claude:
-    def __init__(self, model: str, api_key: Optional[str] = None) -> None:
+    def __init__(self, model: str, api_key: Optional[str] = None, base_url: Optional[str] = None,
+                 response_cache: Optional[ResponseCache] = None, policy: Optional[ResiliencePolicy] = None,
+                 limits: httpx.Limits = DEFAULT_LIMITS, max_tokens: int = 1000,
+                 usage: Optional[TokenUsage] = None, raise_errors: bool = False) -> None:
         self.api_key = api_key
-        self.client = Anthropic(api_key=self.api_key)
+        # By default API errors are printed and an empty answer returned, as the
+        # Streamlit app expects; services raise them to report them to clients
+        self.raise_errors = raise_errors
+        self.base_url = base_url
+        self.limits = limits
+        self.response_cache = response_cache
+        self.policy = policy or shared_policy(base_url)
+        self.usage = usage or shared_usage(base_url)
+        self.client = shared_client(self.api_key, base_url, limits)
         self.model = model
         self.context_window = self._get_context_window(model)
-        self.max_tokens = 1000
+        self.max_tokens = max_tokens
+
+    @property
+    def async_client(self) -> AsyncAnthropic:
+        return shared_async_client(self.api_key, self.base_url, self.limits)
 
     def _get_context_window(self, model: str) -> int:
         context_windows = {
@@ -29,93 +193,264 @@ class Claude:
         prepared_messages = []
         for message in messages:
             if isinstance(message, dict) and 'role' in message and 'content' in message:
+                # Lists of content blocks (e.g. with cache_control) are passed through as they are
+                content = message['content']
                 prepared_messages.append({
                     'role': message['role'],
-                    'content': str(message['content'])
+                    'content': content if isinstance(content, list) else str(content)
                 })
             else:
-                print(f"Skipping invalid message: {message}")
+                # Messages carry patient text, so only their type is recorded
+                tracing.add("skipped_messages")
+                logger.warning("Skipping invalid message of type %s", type(message).__name__)
         return prepared_messages
 
+    def _cached(self, prompt: Prompt, kwargs: dict) -> Optional[str]:
+        tracing.set_attributes(model=self.model)
+        if self.response_cache is None:
+            return None
+        cached = self.response_cache.get(self.model, prompt, {"max_tokens": self.max_tokens, **kwargs})
+        tracing.set_attributes(cache_hit=cached is not None)
+        return cached
+
+    def _record_usage(self, usage: Any) -> None:
+        tracing.record_usage(usage)
+        self.usage.add(usage)
+
+    def _cache(self, prompt: Prompt, kwargs: dict, text: str, start: float) -> str:
+        if self.response_cache is not None and text:
+            self.response_cache.put(self.model, prompt, {"max_tokens": self.max_tokens, **kwargs}, text,
+                                    latency=time.perf_counter() - start)
+        return text
+
+    @tracing.traced("llm.chat")
     def chat(self, messages: List[Any], **kwargs) -> str:
         try:
             prepared_messages = self._prepare_messages(messages)
-            response = self.client.messages.create(
+            cached = self._cached(prepared_messages, kwargs)
+            if cached is not None:
+                return cached
+            start = time.perf_counter()
+            response = self.policy.call(lambda: self.client.messages.create(
                 model=self.model,
                 max_tokens=self.max_tokens,
                 messages=prepared_messages,
                 **kwargs
-            )
-            print(f"Response type: {type(response)}")
-            print(f"Response content: {response.content}")
-            return response.content[0].text if response.content else ""
+            ))
+            self._record_usage(response.usage)
+            return self._cache(prepared_messages, kwargs, response.content[0].text if response.content else "", start)
         except APIError as e:
-            if "credit balance is too low" in str(e):
-                print("Error: Insufficient credits. Please upgrade your Anthropic account or purchase more credits.")
-            else:
-                print(f"An error occurred during chat: {e}")
+            tracing.record_error(e)
+            if self.raise_errors:
+                raise
+            _log_error("chat", e)
             return ""
         except Exception as e:
-            print(f"An unexpected error occurred: {e}")
+            tracing.record_error(e)
+            if self.raise_errors:
+                raise
+            _log_error("chat", e)
             return ""
 
+    @tracing.traced("llm.complete")
     def complete(self, prompt: str, **kwargs) -> str:
         try:
-            response = self.client.messages.create(
+            cached = self._cached(prompt, kwargs)
+            if cached is not None:
+                return cached
+            start = time.perf_counter()
+            response = self.policy.call(lambda: self.client.messages.create(
                 model=self.model,
                 max_tokens=self.max_tokens,
                 messages=[{"role": "user", "content": prompt}],
                 **kwargs
-            )
-            print(f"Response type: {type(response)}")
-            print(f"Response content: {response.content}")
-            return response.content[0].text if response.content else ""
+            ))
+            self._record_usage(response.usage)
+            return self._cache(prompt, kwargs, response.content[0].text if response.content else "", start)
         except APIError as e:
-            if "credit balance is too low" in str(e):
-                print("Error: Insufficient credits. Please upgrade your Anthropic account or purchase more credits.")
-            else:
-                print(f"An error occurred during completion: {e}")
+            tracing.record_error(e)
+            if self.raise_errors:
+                raise
+            _log_error("completion", e)
+            return ""
+        except Exception as e:
+            tracing.record_error(e)
+            if self.raise_errors:
+                raise
+            _log_error("completion", e)
+            return ""
+
+    @tracing.traced("llm.complete")
+    async def acomplete(self, prompt: str, **kwargs) -> str:
+        try:
+            cached = self._cached(prompt, kwargs)
+            if cached is not None:
+                return cached
+            start = time.perf_counter()
+            async_client = self.async_client
+            response = await self.policy.acall(lambda: async_client.messages.create(
+                model=self.model,
+                max_tokens=self.max_tokens,
+                messages=[{"role": "user", "content": prompt}],
+                **kwargs
+            ))
+            self._record_usage(response.usage)
+            return self._cache(prompt, kwargs, response.content[0].text if response.content else "", start)
+        except APIError as e:
+            tracing.record_error(e)
+            if self.raise_errors:
+                raise
+            _log_error("async completion", e)
             return ""
         except Exception as e:
-            print(f"An unexpected error occurred: {e}")
+            tracing.record_error(e)
+            if self.raise_errors:
+                raise
+            _log_error("async completion", e)
             return ""
 
-    def chat_with_vision(self, messages: List[Any], images: List[str], **kwargs) -> str:
+    @tracing.traced("llm.stream_chat")
+    def stream_chat(self, messages: List[Any], **kwargs) -> Iterator[str]:
+        """Yield the response text in deltas as Claude generates it."""
+        try:
+            prepared_messages = self._prepare_messages(messages)
+            cached = self._cached(prepared_messages, kwargs)
+            if cached is not None:
+                yield cached
+                return
+            start = time.perf_counter()
+            chunks = []
+            for text in self.policy.stream(lambda: self.client.messages.stream(
+                model=self.model,
+                max_tokens=self.max_tokens,
+                messages=prepared_messages,
+                **kwargs
+            ), on_usage=self.usage.add):
+                if not chunks:
+                    tracing.set_attributes(first_token_ms=(time.perf_counter() - start) * 1000)
+                chunks.append(text)
+                yield text
+            self._cache(prepared_messages, kwargs, "".join(chunks), start)
+        except APIError as e:
+            tracing.record_error(e)
+            if self.raise_errors:
+                raise
+            _log_error("streaming chat", e)
+        except Exception as e:
+            tracing.record_error(e)
+            if self.raise_errors:
+                raise
+            _log_error("streaming chat", e)
+
+    def stream_complete(self, prompt: str, **kwargs) -> Iterator[str]:
+        return self.stream_chat([{"role": "user", "content": prompt}], **kwargs)
+
+    @tracing.traced("llm.stream_chat")
+    async def astream_chat(self, messages: List[Any], **kwargs) -> AsyncIterator[str]:
+        """Async version of stream_chat."""
         try:
             prepared_messages = self._prepare_messages(messages)
-            for image in images:
+            cached = self._cached(prepared_messages, kwargs)
+            if cached is not None:
+                yield cached
+                return
+            start = time.perf_counter()
+            async_client = self.async_client
+            chunks = []
+            async for text in self.policy.astream(lambda: async_client.messages.stream(
+                model=self.model,
+                max_tokens=self.max_tokens,
+                messages=prepared_messages,
+                **kwargs
+            ), on_usage=self.usage.add):
+                if not chunks:
+                    tracing.set_attributes(first_token_ms=(time.perf_counter() - start) * 1000)
+                chunks.append(text)
+                yield text
+            self._cache(prepared_messages, kwargs, "".join(chunks), start)
+        except APIError as e:
+            tracing.record_error(e)
+            if self.raise_errors:
+                raise
+            _log_error("async streaming chat", e)
+        except Exception as e:
+            tracing.record_error(e)
+            if self.raise_errors:
+                raise
+            _log_error("async streaming chat", e)
+
+    def astream_complete(self, prompt: str, **kwargs) -> AsyncIterator[str]:
+        return self.astream_chat([{"role": "user", "content": prompt}], **kwargs)
+
+    def _image_block(self, image: bytes, media_type: Optional[str] = None) -> dict:
+        media_type = media_type or detect_media_type(image)
+        if media_type is None:
+            raise ValueError("Unsupported image format")
+        return {
+            "type": "image",
+            "source": {
+                "type": "base64",
+                "media_type": media_type,
+                "data": base64.b64encode(image).decode()
+            }
+        }
+
+    @tracing.traced("llm.vision")
+    def chat_with_vision(self, messages: List[Any], images: List[bytes], media_types: Optional[List[str]] = None, **kwargs) -> str:
+        """
+        Chat with raw image bytes attached, e.g. from ImageStore.get.
+
+        Media types are detected from the image bytes unless given.
+        """
+        tracing.set_attributes(model=self.model, images=len(images))
+        try:
+            prepared_messages = self._prepare_messages(messages)
+            for i, image in enumerate(images):
                 prepared_messages.append({
                     "role": "user",
-                    "content": [
-                        {
-                            "type": "image",
-                            "source": {
-                                "type": "base64",
-                                "media_type": "image/jpeg",
-                                "data": base64.b64encode(image).decode()
-                            }
-                        }
-                    ]
+                    "content": [self._image_block(image, media_types[i] if media_types else None)]
                 })
-            response = self.client.messages.create(
+            response = self.policy.call(lambda: self.client.messages.create(
                 model=self.model,
                 max_tokens=self.max_tokens,
                 messages=prepared_messages,
                 **kwargs
-            )
-            print(f"Response type: {type(response)}")
-            print(f"Response content: {response.content}")
+            ), hedge=False)
+            self._record_usage(response.usage)
             return response.content[0].text if response.content else ""
         except APIError as e:
-            if "credit balance is too low" in str(e):
-                print("Error: Insufficient credits. Please upgrade your Anthropic account or purchase more credits.")
-            else:
-                print(f"An error occurred during chat with vision: {e}")
+            tracing.record_error(e)
+            if self.raise_errors:
+                raise
+            _log_error("chat with vision", e)
             return ""
         except Exception as e:
-            print(f"An unexpected error occurred: {e}")
+            tracing.record_error(e)
+            if self.raise_errors:
+                raise
+            _log_error("chat with vision", e)
             return ""
 
+    @tracing.traced("llm.vision")
+    def describe_images(self, images: List[bytes], prompt: str, media_types: Optional[List[str]] = None, **kwargs) -> str:
+        """
+        Send several images and a prompt in a single user message.
+
+        Unlike the other methods, API errors that survive the retry policy are
+        raised rather than swallowed so batch callers can skip or report them.
+        """
+        tracing.set_attributes(model=self.model, images=len(images))
+        content = [self._image_block(image, media_types[i] if media_types else None) for i, image in enumerate(images)]
+        content.append({"type": "text", "text": prompt})
+        response = self.policy.call(lambda: self.client.messages.create(
+            model=self.model,
+            max_tokens=self.max_tokens,
+            messages=[{"role": "user", "content": content}],
+            **kwargs
+        ), hedge=False)
+        self._record_usage(response.usage)
+        return response.content[0].text if response.content else ""
+
     def get_model_name(self) -> str:
         return self.model
 
@@ -0,0 +1,155 @@
+import math
+import re
+from typing import Any, Callable, Dict, List, Optional, Set, Tuple
+
+from llama_index.core.bridge.pydantic import Field, PrivateAttr
+from llama_index.core.llms import ChatMessage, MessageRole
+from llama_index.core.postprocessor.types import BaseNodePostprocessor
+from llama_index.core.schema import MetadataMode, NodeWithScore, QueryBundle
+
+# Claude's tokenizer is not available offline; English clinical text averages
+# a little under 4 characters per token, so this errs on the side of overcounting
+CHARS_PER_TOKEN = 3.5
+
+# Room for the system prompt, context template and the question itself
+PROMPT_OVERHEAD_TOKENS = 1024
+
+SUMMARY_PROMPT = """
+Summarize the earlier part of this conversation between a user and a healthcare
+document assistant in at most {max_words} words. Keep the questions asked, the
+facts and figures given in answers, and anything the user said about themselves.
+
+{transcript}
+"""
+
+
+def estimate_tokens(text: str) -> int:
+    return math.ceil(len(text) / CHARS_PER_TOKEN)
+
+
+def prompt_budgets(context_window: int, max_tokens: int, context_tokens: int, history_tokens: int) -> Tuple[int, int]:
+    """
+    (retrieved context, chat history) token budgets, scaled down together if
+    they would not fit in the model's window alongside the answer.
+    """
+    available = max(0, context_window - max_tokens - PROMPT_OVERHEAD_TOKENS)
+    requested = context_tokens + history_tokens
+    if requested <= available:
+        return context_tokens, history_tokens
+    scale = available / requested
+    return int(context_tokens * scale), int(history_tokens * scale)
+
+
+def _shingles(text: str, size: int = 8) -> Set[Tuple[str, ...]]:
+    words = re.findall(r"\w+", text.lower())
+    if len(words) <= size:
+        return {tuple(words)} if words else set()
+    return {tuple(words[i:i + size]) for i in range(len(words) - size + 1)}
+
+
+def pack_nodes(nodes: List[NodeWithScore], budget_tokens: int, overlap_threshold: float = 0.8,
+               count_tokens: Callable[[str], int] = estimate_tokens) -> List[NodeWithScore]:
+    """
+    Greedily fill ``budget_tokens`` with the highest-scoring nodes.
+
+    A node whose word 8-grams are at least ``overlap_threshold`` covered by
+    already-selected nodes (e.g. the overlap between neighbouring chunks, or
+    the same passage indexed twice) is skipped, as is any node that no longer
+    fits; smaller, lower-ranked nodes may still fill the remaining space.
+    """
+    ranked = sorted(nodes, key=lambda n: n.score if n.score is not None else float("-inf"), reverse=True)
+    selected, seen, used = [], set(), 0
+    for node in ranked:
+        text = node.node.get_content(metadata_mode=MetadataMode.LLM)
+        shingles = _shingles(text)
+        if shingles and len(shingles & seen) / len(shingles) >= overlap_threshold:
+            continue
+        tokens = count_tokens(text)
+        if used + tokens > budget_tokens:
+            continue
+        selected.append(node)
+        seen |= shingles
+        used += tokens
+    return selected
+
+
+class TokenBudgetPostprocessor(BaseNodePostprocessor):
+    """Node postprocessor that applies pack_nodes after the reranker."""
+
+    budget_tokens: int = Field(description="Maximum tokens of retrieved context to send.")
+    overlap_threshold: float = Field(default=0.8, description="Shingle coverage above which a node is a duplicate.")
+    _count_tokens: Callable[[str], int] = PrivateAttr()
+
+    def __init__(self, budget_tokens: int, overlap_threshold: float = 0.8,
+                 count_tokens: Callable[[str], int] = estimate_tokens) -> None:
+        super().__init__(budget_tokens=budget_tokens, overlap_threshold=overlap_threshold)
+        self._count_tokens = count_tokens
+
+    @classmethod
+    def class_name(cls) -> str:
+        return "TokenBudgetPostprocessor"
+
+    def _postprocess_nodes(self, nodes: List[NodeWithScore],
+                           query_bundle: Optional[QueryBundle] = None) -> List[NodeWithScore]:
+        return pack_nodes(nodes, self.budget_tokens, self.overlap_threshold, self._count_tokens)
+
+
+def _transcript(messages: List[Dict[str, Any]]) -> str:
+    return "\n".join(f"{m['role'].capitalize()}: {m['content']}" for m in messages)
+
+
+def pack_history(messages: List[Dict[str, Any]], budget_tokens: int,
+                 summarize: Optional[Callable[[str, int], str]] = None,
+                 count_tokens: Callable[[str], int] = estimate_tokens, align: int = 1) -> List[ChatMessage]:
+    """
+    Chat history for the next turn within ``budget_tokens``.
+
+    The most recent turns are kept verbatim. Older turns are dropped, or, with
+    ``summarize(transcript, max_words)``, replaced by a system message holding
+    a summary that gets up to a quarter of the budget. The kept history always
+    starts with a user turn, as the Claude API requires.
+
+    With ``align``, messages are dropped that many at a time (as long as a
+    turn is left), so the packed history, summary included, stays the same
+    prefix for several turns instead of shifting every turn, and can be read
+    from the prompt cache.
+    """
+    summary_budget = budget_tokens // 4 if summarize else 0
+    kept: List[Dict[str, Any]] = []
+    used = 0
+    for message in reversed(messages):
+        tokens = count_tokens(str(message["content"]))
+        if used + tokens > budget_tokens - summary_budget:
+            break
+        kept.insert(0, message)
+        used += tokens
+    extra = (align - (len(messages) - len(kept)) % align) % align
+    # Unless that would leave less than a turn
+    if extra and len(kept) - extra >= 2:
+        kept = kept[extra:]
+        used = sum(count_tokens(str(m["content"])) for m in kept)
+    while kept and kept[0]["role"] != "user":
+        kept.pop(0)
+
+    history = [ChatMessage(role=MessageRole(m["role"]), content=str(m["content"])) for m in kept]
+    older = messages[:len(messages) - len(kept)]
+    if summarize and older:
+        # From the fixed summary budget alone, minus the prompt framing, so the
+        # request for the same older turns is the same from turn to turn
+        max_words = int(summary_budget * CHARS_PER_TOKEN / 6)
+        summary = summarize(_transcript(older), max_words).strip()
+        if summary and count_tokens(summary) <= budget_tokens - used:
+            history.insert(0, ChatMessage(role=MessageRole.SYSTEM, content=f"Summary of the earlier conversation:\n{summary}"))
+    return history
+
+
+def claude_summarizer(claude_instance: Any) -> Callable[[str, int], str]:
+    """
+    A ``summarize`` callable for pack_history backed by ``claude_instance.complete``.
+
+    The same older turns produce the same prompt, so with a response cache the
+    summary is only generated once per step of the conversation.
+    """
+    def summarize(transcript: str, max_words: int) -> str:
+        return claude_instance.complete(SUMMARY_PROMPT.format(max_words=max_words, transcript=transcript))
+    return summarize
@@ -0,0 +1,156 @@
+import threading
+from typing import Any, Dict, Iterable, List, Optional
+
+from llama_index.core import VectorStoreIndex
+
+from hybrid_retriever import SearchSegment
+
+
+class CorpusIndex:
+    """
+    A single searchable index over many documents, updated one document at a time.
+
+    Documents are added from their own VectorStoreIndex (usually loaded from
+    the IndexStore) by copying its nodes and vector store rows, so adding a
+    document never re-embeds anything and removing one touches only its own
+    nodes. Documents are identified by a caller-chosen
+    key, normally the hash of the file. Each index added for a document also
+    keeps a SearchSegment (embedding matrix and lexical index) for
+    HybridRetriever, until ``compact`` merges them.
+    """
+
+    def __init__(self, embed_model: Optional[Any] = None) -> None:
+        self.index = VectorStoreIndex(nodes=[], embed_model=embed_model)
+        self.documents: Dict[str, Dict[str, Any]] = {}
+        self.segments: Dict[str, List[SearchSegment]] = {}
+        self._lock = threading.Lock()
+
+    def __contains__(self, key: str) -> bool:
+        return key in self.documents
+
+    def __len__(self) -> int:
+        return len(self.documents)
+
+    def add(self, key: str, document_index: VectorStoreIndex, source: str = "") -> int:
+        """Add the nodes of ``document_index`` under ``key``; returns the number of nodes added."""
+        with self._lock:
+            if key in self.documents:
+                return 0
+            return self._add_part(key, document_index, source)
+
+    def extend(self, key: str, part_index: VectorStoreIndex, source: str = "") -> int:
+        """
+        Add the nodes of ``part_index`` (e.g. the next batch of pages) to the document ``key``.
+
+        Lets a document be queried while it is still being ingested; nodes
+        already in the document are skipped.
+        """
+        with self._lock:
+            return self._add_part(key, part_index, source)
+
+    def parts(self, key: str) -> int:
+        """How many indexes have added nodes under ``key``."""
+        document = self.documents.get(key)
+        return document["parts"] if document else 0
+
+    def batches(self, key: str) -> int:
+        """How many indexes have been passed under ``key``, including those with no new nodes."""
+        document = self.documents.get(key)
+        return document["batches"] if document else 0
+
+    def _add_part(self, key: str, document_index: VectorStoreIndex, source: str) -> int:
+        document = self.documents.setdefault(key, {"source": source, "node_ids": [], "parts": 0, "batches": 0})
+        document["batches"] += 1
+        known = set(document["node_ids"])
+        all_ids = list(document_index.index_struct.nodes_dict.values())
+        node_ids = [node_id for node_id in all_ids if node_id not in known]
+        if not node_ids:
+            return 0
+        nodes = document_index.docstore.get_nodes(node_ids)
+        # Copy the vector store rows as they are: assigning node.embedding would
+        # have pydantic validate every float, which dominates the cost of adding
+        source_data = document_index.vector_store.data
+        data = self.index.vector_store.data
+        for node_id in node_ids:
+            data.embedding_dict[node_id] = source_data.embedding_dict[node_id]
+            data.text_id_to_ref_doc_id[node_id] = source_data.text_id_to_ref_doc_id.get(node_id, "None")
+            if source_data.metadata_dict is not None and node_id in source_data.metadata_dict:
+                data.metadata_dict[node_id] = source_data.metadata_dict[node_id]
+        self.index.docstore.add_documents(nodes, allow_update=True)
+        for node in nodes:
+            self.index.index_struct.add_node(node, text_id=node.node_id)
+        self.index.storage_context.index_store.add_index_struct(self.index.index_struct)
+        document["node_ids"] += node_ids
+        document["parts"] += 1
+        # The index's own lexical index covers nodes already in the document too
+        segment = (SearchSegment.from_index(document_index) if len(node_ids) == len(all_ids)
+                   else SearchSegment.from_nodes(nodes, source_data.embedding_dict))
+        self.segments.setdefault(key, []).append(segment)
+        return len(nodes)
+
+    def compact(self, key: str) -> None:
+        """
+        Merge the segments of the document ``key`` into one, once it is complete.
+
+        A document followed while it was ingested has a segment per batch, and
+        searches pay a per-segment cost, so hundreds of them slow every query.
+        """
+        with self._lock:
+            segments = self.segments.get(key)
+            if segments is not None and len(segments) > 1:
+                self.segments[key] = [SearchSegment.merge(segments)]
+
+    def remove(self, key: str) -> bool:
+        with self._lock:
+            document = self.documents.pop(key, None)
+            if document is None:
+                return False
+            self.segments.pop(key, None)
+            node_ids = document["node_ids"]
+            self.index.delete_nodes(node_ids, delete_from_docstore=True)
+            for node_id in node_ids:
+                self.index.index_struct.delete(node_id)
+            self.index.storage_context.index_store.add_index_struct(self.index.index_struct)
+            return True
+
+    def sync(self, wanted: Dict[str, Any]) -> List[str]:
+        """Remove documents whose key is not in ``wanted``; returns the keys still to be added."""
+        for key in [key for key in self.documents if key not in wanted]:
+            self.remove(key)
+        return [key for key in wanted if key not in self.documents]
+
+    def search_segments(self, keys: Optional[Iterable[str]] = None) -> List[SearchSegment]:
+        """Segments of every document, or of the documents ``keys`` only."""
+        with self._lock:
+            if keys is None:
+                return [segment for parts in self.segments.values() for segment in parts]
+            return [segment for key in keys for segment in self.segments.get(key, [])]
+
+    def view(self, keys: Iterable[str]) -> "CorpusView":
+        return CorpusView(self, keys)
+
+    def sources(self) -> List[str]:
+        return [document["source"] for document in self.documents.values()]
+
+
+class CorpusView:
+    """
+    The documents ``keys`` of a CorpusIndex, searchable by HybridRetriever like the corpus itself.
+
+    Nothing is copied: many requests can share one CorpusIndex and each search
+    only its own documents.
+    """
+
+    def __init__(self, corpus: CorpusIndex, keys: Iterable[str]) -> None:
+        self.corpus = corpus
+        self.keys = list(keys)
+
+    @property
+    def index(self) -> VectorStoreIndex:
+        return self.corpus.index
+
+    def __len__(self) -> int:
+        return sum(1 for key in self.keys if key in self.corpus)
+
+    def search_segments(self) -> List[SearchSegment]:
+        return self.corpus.search_segments(self.keys)
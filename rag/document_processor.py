@@ -1,68 +1,83 @@
-import streamlit as st
-from PyPDF2 import PdfReader
 from llama_index.core import Document
-import fitz  # PyMuPDF
-import io
-from PIL import Image
-import base64
+from chunker import StructureChunker
+from image_store import ImageStore
+from pdf_extraction import extract_images_from_page, iter_pdf_pages  # noqa: F401 (re-exported)
+from typing import Callable, Iterator, Optional, Tuple
+
+# Image references are for loading bytes on demand, not for embedding or the LLM prompt
+IMAGE_METADATA_KEYS = ["image_ref", "media_type"]
+
+def iter_healthcare_document(pdf_bytes: bytes, source: str, include_vision: bool = True,
+                             image_store: Optional[ImageStore] = None,
+                             workers: Optional[int] = None, pages_per_shard: int = 32,
+                             progress: Optional[Callable[[int, int], None]] = None,
+                             chunker: Optional[StructureChunker] = None) -> Iterator[Document]:
+    """
+    Yield text Documents followed by the image Documents of the pages they cover, in page order.
+
+    Without ``chunker`` there is one text Document per non-empty page; with it,
+    the text is split into structure-aware chunks that may span pages. Image
+    Documents carry a reference into ``image_store`` rather than the image
+    itself, and each distinct image is emitted once, on the first page it
+    appears on.
+    """
+    if include_vision and image_store is None:
+        image_store = ImageStore()
+    seen_refs = set()
+    pending_images = []
+
+    def pages() -> Iterator[Tuple[int, str]]:
+        for page_number, text, images in iter_pdf_pages(pdf_bytes, image_store=image_store if include_vision else None,
+                                                        workers=workers, pages_per_shard=pages_per_shard, progress=progress):
+            for ref in images:
+                if ref in seen_refs:
+                    continue
+                seen_refs.add(ref)
+                pending_images.append(Document(
+                    text=f"Image {len(seen_refs)} from {source}",
+                    metadata={
+                        "source": source,
+                        "page": page_number,
+                        "type": "image",
+                        "image_ref": ref,
+                        "media_type": ImageStore.media_type(ref)
+                    },
+                    excluded_embed_metadata_keys=IMAGE_METADATA_KEYS,
+                    excluded_llm_metadata_keys=IMAGE_METADATA_KEYS
+                ))
+            yield page_number, text
+
+    if chunker is not None:
+        text_documents = chunker.iter_chunks(pages(), source)
+    else:
+        text_documents = (Document(text=text, metadata={"source": source, "page": page_number})
+                          for page_number, text in pages() if text.strip())
+    for document in text_documents:
+        yield document
+        yield from pending_images
+        pending_images.clear()
+    yield from pending_images
+
+def process_healthcare_document(uploaded_file, include_vision=True, image_store=None, chunker=None):
+    # The Streamlit upload path; imported here so the headless service does not need Streamlit
+    import streamlit as st
 
-def process_healthcare_document(uploaded_file, include_vision=True):
     st.write(f"Processing file: {uploaded_file.name}")
-    text_list = []
-    image_list = []
-    
+    progress_bar = st.progress(0.0, text="Reading pages...")
+
+    def progress(done, total):
+        progress_bar.progress(done / total, text=f"Processed {done}/{total} pages")
+
     try:
-        # Use PyPDF2 for text extraction
-        reader = PdfReader(uploaded_file)
-        for i, page in enumerate(reader.pages):
-            text = page.extract_text()
-            text_list.append(text)
-            st.write(f"Processed page {i+1} (text)")
-        
-        # Use PyMuPDF for image extraction if include_vision is True
-        if include_vision:
-            pdf_document = fitz.open(stream=uploaded_file.read(), filetype="pdf")
-            for i, page in enumerate(pdf_document):
-                images = extract_images_from_page(page)
-                image_list.extend(images)
-                st.write(f"Processed page {i+1} (images)")
+        pdf_bytes = uploaded_file.getvalue() if hasattr(uploaded_file, "getvalue") else uploaded_file.read()
+        documents = list(iter_healthcare_document(pdf_bytes, uploaded_file.name, include_vision=include_vision,
+                                                  image_store=image_store, progress=progress, chunker=chunker))
     except Exception as e:
         st.error(f"Error processing document: {str(e)}")
         return []
+    finally:
+        progress_bar.empty()
 
-    # Create documents with text content
-    documents = [Document(text=t, metadata={"source": uploaded_file.name, "page": i}) for i, t in enumerate(text_list) if t.strip()]
-    
-    # Add image documents if vision is included
-    if include_vision:
-        for i, img in enumerate(image_list):
-            img_doc = Document(
-                text=f"Image {i+1} from {uploaded_file.name}",
-                metadata={
-                    "source": uploaded_file.name,
-                    "type": "image",
-                    "image": img
-                }
-            )
-            documents.append(img_doc)
-    
-    st.write(f"Created {len(documents)} document chunks (including {len(image_list)} images)")
+    image_count = sum(1 for doc in documents if doc.metadata.get("type") == "image")
+    st.write(f"Created {len(documents)} document chunks (including {image_count} images)")
     return documents
-
-def extract_images_from_page(page):
-    images = []
-    for img_index, img in enumerate(page.get_images(full=True)):
-        xref = img[0]
-        base_image = page.parent.extract_image(xref)
-        image_bytes = base_image["image"]
-        
-        # Convert to PIL Image
-        image = Image.open(io.BytesIO(image_bytes))
-        
-        # Convert to base64
-        buffered = io.BytesIO()
-        image.save(buffered, format="PNG")
-        img_str = base64.b64encode(buffered.getvalue()).decode()
-        
-        images.append(img_str)
-    return images
\ No newline at end of file
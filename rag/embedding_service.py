@@ -0,0 +1,207 @@
+import hashlib
+import os
+import sqlite3
+import threading
+from typing import Callable, Dict, List, Optional
+
+import numpy as np
+from llama_index.core.base.embeddings.base import BaseEmbedding
+from llama_index.core.bridge.pydantic import Field, PrivateAttr
+
+import tracing
+
+DEFAULT_MODEL = "BAAI/bge-small-en-v1.5"
+DEFAULT_CACHE_PATH = os.path.join(os.path.expanduser("~"), ".cache", "healthcare-rag", "embeddings.sqlite3")
+
+# What llama-index's HuggingFaceEmbedding prepends to BGE queries; kept so vectors match existing indexes
+BGE_QUERY_INSTRUCTION = "Represent this question for searching relevant passages: "
+
+BACKENDS = ["torch", "onnx"]
+
+# Embeds a batch of texts into an (n, dim) array of L2-normalized float32 vectors
+Backend = Callable[[List[str]], np.ndarray]
+
+
+def torch_backend(model_name: str = DEFAULT_MODEL, threads: Optional[int] = None) -> Backend:
+    """sentence-transformers on CPU, with ``threads`` intra-op threads (default: torch's choice)."""
+    import torch
+    from sentence_transformers import SentenceTransformer
+
+    if threads:
+        torch.set_num_threads(threads)
+    model = SentenceTransformer(model_name, device="cpu")
+
+    def embed(texts: List[str]) -> np.ndarray:
+        with torch.inference_mode():
+            # The batch is already sized and length-sorted by EmbeddingService
+            return model.encode(texts, batch_size=len(texts), normalize_embeddings=True,
+                                convert_to_numpy=True, show_progress_bar=False).astype(np.float32)
+    return embed
+
+
+def onnx_backend(model_name: str = DEFAULT_MODEL, threads: Optional[int] = None, quantize: bool = True,
+                 export_dir: Optional[str] = None) -> Backend:
+    """
+    ONNX Runtime on CPU, optionally with dynamic int8 quantization, via optimum.
+
+    The exported (and quantized) model is saved under ``export_dir`` and reused
+    on later runs. BGE models use the [CLS] token as the sentence embedding.
+    """
+    import onnxruntime
+    from optimum.onnxruntime import ORTModelForFeatureExtraction, ORTQuantizer
+    from optimum.onnxruntime.configuration import AutoQuantizationConfig
+    from transformers import AutoTokenizer
+
+    export_dir = export_dir or os.path.join(os.path.expanduser("~"), ".cache", "healthcare-rag", "onnx",
+                                            model_name.replace("/", "--") + ("-int8" if quantize else ""))
+    options = onnxruntime.SessionOptions()
+    if threads:
+        options.intra_op_num_threads = threads
+    if not os.path.exists(os.path.join(export_dir, "model.onnx")) and not os.path.exists(os.path.join(export_dir, "model_quantized.onnx")):
+        model = ORTModelForFeatureExtraction.from_pretrained(model_name, export=True)
+        model.save_pretrained(export_dir)
+        AutoTokenizer.from_pretrained(model_name).save_pretrained(export_dir)
+        if quantize:
+            quantizer = ORTQuantizer.from_pretrained(export_dir)
+            quantizer.quantize(save_dir=export_dir,
+                               quantization_config=AutoQuantizationConfig.avx2(is_static=False, per_channel=False))
+    file_name = "model_quantized.onnx" if quantize else "model.onnx"
+    model = ORTModelForFeatureExtraction.from_pretrained(export_dir, file_name=file_name, session_options=options)
+    tokenizer = AutoTokenizer.from_pretrained(export_dir)
+
+    def embed(texts: List[str]) -> np.ndarray:
+        inputs = tokenizer(texts, padding=True, truncation=True, max_length=512, return_tensors="np")
+        hidden = model(**inputs).last_hidden_state
+        vectors = np.asarray(hidden[:, 0], dtype=np.float32)
+        return vectors / np.linalg.norm(vectors, axis=1, keepdims=True).clip(min=1e-12)
+    return embed
+
+
+def make_backend(backend: str = "torch", model_name: str = DEFAULT_MODEL, threads: Optional[int] = None) -> Backend:
+    if backend not in BACKENDS:
+        raise ValueError(f"Invalid embedding backend: {backend}. Choose from {BACKENDS}")
+    if backend == "onnx":
+        try:
+            return onnx_backend(model_name, threads=threads)
+        except ImportError:
+            raise ImportError("The onnx embedding backend needs `pip install optimum[onnxruntime]`")
+    return torch_backend(model_name, threads=threads)
+
+
+class EmbeddingCache:
+    """SQLite-backed float32 vectors keyed by a hash of model and text, safe to share between threads."""
+
+    def __init__(self, path: str, namespace: str) -> None:
+        self.namespace = namespace
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("CREATE TABLE IF NOT EXISTS embeddings (key TEXT PRIMARY KEY, vector BLOB NOT NULL)")
+        self._conn.commit()
+
+    def key(self, text: str) -> str:
+        return hashlib.sha256(f"{self.namespace}\0{text}".encode()).hexdigest()
+
+    def get_many(self, texts: List[str]) -> Dict[str, np.ndarray]:
+        keys = {self.key(text): text for text in texts}
+        found = {}
+        with self._lock:
+            items = list(keys.items())
+            # Stay under SQLite's bound-parameter limit
+            for start in range(0, len(items), 500):
+                batch = items[start:start + 500]
+                rows = self._conn.execute(
+                    f"SELECT key, vector FROM embeddings WHERE key IN ({','.join('?' * len(batch))})",
+                    [key for key, _ in batch],
+                ).fetchall()
+                for key, vector in rows:
+                    found[keys[key]] = np.frombuffer(vector, dtype=np.float32)
+        return found
+
+    def put_many(self, vectors: Dict[str, np.ndarray]) -> None:
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO embeddings (key, vector) VALUES (?, ?)",
+                [(self.key(text), np.asarray(vector, dtype=np.float32).tobytes()) for text, vector in vectors.items()],
+            )
+            self._conn.commit()
+
+
+class EmbeddingService(BaseEmbedding):
+    """
+    Embedding model wrapper for indexing throughput on CPU.
+
+    Texts are deduplicated, looked up in an optional persistent cache, and the
+    rest embedded in batches of ``embed_batch_size`` after sorting by length,
+    so each batch pads to similar lengths. Plug in the backend with
+    ``make_backend`` (sentence-transformers or ONNX Runtime int8).
+    """
+
+    model_name: str = Field(default=DEFAULT_MODEL)
+    query_instruction: str = Field(default=BGE_QUERY_INSTRUCTION)
+    _backend: Backend = PrivateAttr()
+    _cache: Optional[EmbeddingCache] = PrivateAttr()
+
+    def __init__(self, backend: Backend, model_name: str = DEFAULT_MODEL, embed_batch_size: int = 32,
+                 cache_path: Optional[str] = None, query_instruction: str = BGE_QUERY_INSTRUCTION) -> None:
+        super().__init__(model_name=model_name, embed_batch_size=embed_batch_size, query_instruction=query_instruction)
+        self._backend = backend
+        self._cache = EmbeddingCache(cache_path, namespace=model_name) if cache_path else None
+
+    @classmethod
+    def class_name(cls) -> str:
+        return "EmbeddingService"
+
+    def embed(self, texts: List[str]) -> np.ndarray:
+        """(len(texts), dim) matrix of embeddings, in the order given."""
+        with tracing.span("embed.model", texts=len(texts)) as span:
+            unique = list(dict.fromkeys(texts))
+            vectors = self._cache.get_many(unique) if self._cache else {}
+            missing = sorted((text for text in unique if text not in vectors), key=len)
+            computed = {}
+            for start in range(0, len(missing), self.embed_batch_size):
+                batch = missing[start:start + self.embed_batch_size]
+                computed.update(zip(batch, self._backend(batch)))
+            if self._cache and computed:
+                self._cache.put_many(computed)
+            span.set(cache_hits=len(unique) - len(missing), computed=len(missing))
+        vectors.update(computed)
+        return np.stack([vectors[text] for text in texts]) if texts else np.zeros((0, 0), dtype=np.float32)
+
+    def _get_query_embedding(self, query: str) -> List[float]:
+        with tracing.span("embed.query"):
+            return self._backend([self.query_instruction + query])[0].tolist()
+
+    async def _aget_query_embedding(self, query: str) -> List[float]:
+        return self._get_query_embedding(query)
+
+    def _get_text_embedding(self, text: str) -> List[float]:
+        return self.embed([text])[0].tolist()
+
+    def _get_text_embeddings(self, texts: List[str]) -> List[List[float]]:
+        return self.embed(texts).tolist()
+
+    def get_text_embedding_batch(self, texts: List[str], show_progress: bool = False, **kwargs) -> List[List[float]]:
+        # The base class slices texts into embed_batch_size batches before we see
+        # them; take them all at once so length sorting and dedup span the document
+        return self._get_text_embeddings(texts)
+
+
+def embedding_service(backend: str = "torch", threads: Optional[int] = None, batch_size: int = 32,
+                      cache_path: Optional[str] = DEFAULT_CACHE_PATH, model: Optional[Backend] = None) -> EmbeddingService:
+    """
+    The app's BGE embedding service.
+
+    int8 ONNX vectors differ slightly from the full-precision ones, so they get
+    their own model name, and so their own cache entries and index store keys.
+    ``model`` is the already made ``backend`` to embed with, such as a model
+    registry's lazily loaded one; by default it is loaded here.
+    """
+    if backend not in BACKENDS:
+        raise ValueError(f"Invalid embedding backend: {backend}. Choose from {BACKENDS}")
+    if cache_path:
+        os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+    model_name = DEFAULT_MODEL if backend == "torch" else f"{DEFAULT_MODEL}@onnx-int8"
+    if model is None:
+        model = make_backend(backend, threads=threads)
+    return EmbeddingService(model, model_name=model_name, embed_batch_size=batch_size, cache_path=cache_path)
+
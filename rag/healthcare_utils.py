@@ -1,11 +1,54 @@
-from typing import List, Dict, Any
-from claude_llm import Claude  # Import the Claude class we updated earlier
+import asyncio
+import json
+from typing import List, Dict, Any, Optional, Tuple
+from pydantic import BaseModel, Field, ValidationError, field_validator
+from claude_llm import Claude, cached_text  # Import the Claude class we updated earlier
+import tracing
 
-def categorize_query(query: str, claude_instance: Claude) -> str:
-    """
-    Use Claude 3.5 Sonnet to categorize the healthcare query.
-    """
-    prompt = f"""
+VALID_CATEGORIES = ["diagnosis", "treatment", "research", "patient_education", "general"]
+
+# "stepwise" sends one prompt per enrichment step; "fused" asks for all of them
+# in a single structured response and falls back to "stepwise" if it doesn't validate.
+QUERY_MODES = ["stepwise", "fused"]
+
+class HealthcareQueryResult(BaseModel):
+    category: str = Field(description="One of: " + ", ".join(VALID_CATEGORIES))
+    response: str = Field(description="The response formatted for the category, with a suitable prefix")
+    key_points: List[str] = Field(description="Key points of the response, one per item")
+    follow_up_questions: List[str] = Field(description="3 relevant follow-up questions", min_length=1)
+
+    @field_validator("category")
+    @classmethod
+    def _normalize_category(cls, value: str) -> str:
+        return _parse_category(value)
+
+    @field_validator("response")
+    @classmethod
+    def _require_response(cls, value: str) -> str:
+        if not value.strip():
+            raise ValueError("response must not be empty")
+        return value.strip()
+
+class HealthcareEnrichment(BaseModel):
+    key_points: List[str] = Field(description="Key points of the response, one per item")
+    follow_up_questions: List[str] = Field(description="3 relevant follow-up questions", min_length=1)
+
+# Each prompt is a cacheable system prompt and a user message. The fixed
+# instructions, and the response shared by the post-processing steps, go in
+# the system prompt so the calls about one response share a cached prefix;
+# what varies from call to call goes in the user message.
+Prompt = Tuple[List[Dict[str, Any]], str]
+
+def _complete(claude_instance: Claude, prompt: Prompt) -> str:
+    system, text = prompt
+    return claude_instance.complete(text, system=system)
+
+async def _acomplete(claude_instance: Claude, prompt: Prompt) -> str:
+    system, text = prompt
+    return await claude_instance.acomplete(text, system=system)
+
+def _categorize_prompt(query: str) -> Prompt:
+    return [cached_text("""
     Categorize the following healthcare query into one of these categories:
     - diagnosis
     - treatment
@@ -14,84 +57,306 @@ def categorize_query(query: str, claude_instance: Claude) -> str:
     - general
 
     If the query doesn't fit into any of these categories, classify it as 'general'.
-
+    """)], f"""
     Query: {query}
 
     Respond with only the category name.
     """
-    
-    response = claude_instance.complete(prompt)
+
+def _response_context(response: str) -> List[Dict[str, Any]]:
+    return [cached_text(f"""
+    You are post-processing an answer to a healthcare query.
+
+    Response: {response}
+    """)]
+
+def _parse_category(response: str) -> str:
     category = response.strip().lower()
-    
     # Validate the category
-    valid_categories = ["diagnosis", "treatment", "research", "patient_education", "general"]
-    return category if category in valid_categories else "general"
+    return category if category in VALID_CATEGORIES else "general"
 
-def format_healthcare_response(response: str, category: str, claude_instance: Claude) -> str:
-    """
-    Use Claude 3.5 Sonnet to format the healthcare response based on the query category.
-    """
-    prompt = f"""
-    Format the following healthcare response for the category '{category}'. 
+def _format_prompt(response: str, category: str) -> Prompt:
+    return _response_context(response), f"""
+    Format the healthcare response above for the category '{category}'.
     Add a suitable prefix and ensure the response is clear, concise, and appropriate for the category.
 
-    Original response: {response}
-
     Formatted response:
     """
-    
-    formatted_response = claude_instance.complete(prompt)
-    return formatted_response.strip()
 
-def extract_key_points(response: str, claude_instance: Claude) -> List[str]:
-    """
-    Use Claude 3.5 Sonnet to extract key points from the healthcare response.
-    """
-    prompt = f"""
-    Extract the key points from the following healthcare response. 
+def _key_points_prompt(response: str) -> Prompt:
+    return _response_context(response), """
+    Extract the key points from the healthcare response above.
     Present them as a bullet-point list.
 
-    Response: {response}
-
     Key points:
     """
-    
-    key_points = claude_instance.complete(prompt)
+
+def _parse_key_points(key_points: str) -> List[str]:
     return [point.strip() for point in key_points.split('\n') if point.strip()]
 
-def generate_follow_up_questions(response: str, category: str, claude_instance: Claude) -> List[str]:
-    """
-    Use Claude 3.5 Sonnet to generate relevant follow-up questions based on the response and category.
-    """
-    prompt = f"""
-    Based on the following healthcare response in the category '{category}', 
+def _follow_up_prompt(response: str, category: str) -> Prompt:
+    return _response_context(response), f"""
+    Based on the healthcare response above, in the category '{category}',
     generate 3 relevant follow-up questions that a patient or healthcare provider might ask.
 
-    Response: {response}
-
     Follow-up questions:
     1.
     2.
     3.
     """
-    
-    questions = claude_instance.complete(prompt)
+
+def _parse_follow_up_questions(questions: str) -> List[str]:
     return [q.strip() for q in questions.split('\n') if q.strip() and q[0].isdigit()]
 
-def process_healthcare_query(query: str, claude_instance: Claude) -> Dict[str, Any]:
+def _fused_prompt(query: str, response: str) -> Prompt:
+    schema = json.dumps(HealthcareQueryResult.model_json_schema()["properties"], indent=2)
+    # Same system prompt as the per-step prompts, so a fallback reads it from the cache
+    return _response_context(response), f"""
+    The response above answers this query: {query}
+
+    In a single JSON object:
+    - categorize the query as one of: {", ".join(VALID_CATEGORIES)} ('general' if nothing fits)
+    - format the response for that category with a suitable prefix, keeping it clear and concise
+    - extract the key points of the response
+    - generate 3 relevant follow-up questions that a patient or healthcare provider might ask
+
+    Respond with only a JSON object with these fields:
+    {schema}
+    """
+
+def _enrich_prompt(query: str, response: str) -> Prompt:
+    schema = json.dumps(HealthcareEnrichment.model_json_schema()["properties"], indent=2)
+    return _response_context(response), f"""
+    The response above answers this query: {query}
+
+    In a single JSON object:
+    - extract the key points of the response
+    - generate 3 relevant follow-up questions that a patient or healthcare provider might ask
+
+    Respond with only a JSON object with these fields:
+    {schema}
+    """
+
+def _parse_json_reply(raw: str, model: Any) -> Optional[Any]:
+    text = raw.strip()
+    # Tolerate a fenced ```json block around the object
+    if text.startswith("```"):
+        text = text.split("\n", 1)[1] if "\n" in text else ""
+        text = text.rsplit("```", 1)[0]
+    try:
+        return model.model_validate_json(text.strip())
+    except ValidationError as e:
+        # The caller falls back to per-step calls; the span notes why, without the response text
+        tracing.set_attributes(fused_fallback=True, validation_errors=e.error_count())
+        return None
+
+def _clean(items: List[str]) -> List[str]:
+    return [item.strip() for item in items if item.strip()]
+
+def _parse_enrichment(raw: str) -> Optional[Tuple[List[str], List[str]]]:
+    result = _parse_json_reply(raw, HealthcareEnrichment)
+    return None if result is None else (_clean(result.key_points), _clean(result.follow_up_questions))
+
+def _parse_fused(query: str, raw: str) -> Optional[Dict[str, Any]]:
+    result = _parse_json_reply(raw, HealthcareQueryResult)
+    if result is None:
+        return None
+    return {
+        "category": result.category,
+        "original_query": query,
+        "response": result.response,
+        "key_points": _clean(result.key_points),
+        "follow_up_questions": _clean(result.follow_up_questions)
+    }
+
+def _cancel_pending(tasks: List["asyncio.Task[Any]"]) -> None:
+    """After a failure, cancel the tasks still running and mark the other failures as retrieved."""
+    for task in tasks:
+        if not task.done():
+            task.cancel()
+        elif not task.cancelled():
+            task.exception()
+
+def _check_mode(mode: str) -> None:
+    if mode not in QUERY_MODES:
+        raise ValueError(f"Unknown query mode '{mode}', expected one of {QUERY_MODES}")
+
+@tracing.traced("healthcare.categorize")
+def categorize_query(query: str, claude_instance: Claude) -> str:
+    """
+    Use Claude 3.5 Sonnet to categorize the healthcare query.
+    """
+    return _parse_category(_complete(claude_instance, _categorize_prompt(query)))
+
+@tracing.traced("healthcare.format")
+def format_healthcare_response(response: str, category: str, claude_instance: Claude) -> str:
+    """
+    Use Claude 3.5 Sonnet to format the healthcare response based on the query category.
+    """
+    formatted_response = _complete(claude_instance, _format_prompt(response, category))
+    return formatted_response.strip()
+
+@tracing.traced("healthcare.key_points")
+def extract_key_points(response: str, claude_instance: Claude) -> List[str]:
+    """
+    Use Claude 3.5 Sonnet to extract key points from the healthcare response.
+    """
+    return _parse_key_points(_complete(claude_instance, _key_points_prompt(response)))
+
+@tracing.traced("healthcare.follow_up")
+def generate_follow_up_questions(response: str, category: str, claude_instance: Claude) -> List[str]:
+    """
+    Use Claude 3.5 Sonnet to generate relevant follow-up questions based on the response and category.
+    """
+    return _parse_follow_up_questions(_complete(claude_instance, _follow_up_prompt(response, category)))
+
+@tracing.traced("healthcare.process")
+def process_healthcare_query(query: str, claude_instance: Claude, mode: str = "stepwise") -> Dict[str, Any]:
     """
     Process a healthcare query using Claude 3.5 Sonnet's capabilities.
+
+    In "fused" mode the four enrichment steps share one structured request.
     """
-    category = categorize_query(query, claude_instance)
-    response = claude_instance.complete(query)
+    _check_mode(mode)
+    tracing.set_attributes(mode=mode)
+    if mode == "fused":
+        response = claude_instance.complete(query)
+        fused = _parse_fused(query, _complete(claude_instance, _fused_prompt(query, response)))
+        if fused is not None:
+            return fused
+        category = categorize_query(query, claude_instance)
+    else:
+        category = categorize_query(query, claude_instance)
+        response = claude_instance.complete(query)
     formatted_response = format_healthcare_response(response, category, claude_instance)
     key_points = extract_key_points(response, claude_instance)
     follow_up_questions = generate_follow_up_questions(response, category, claude_instance)
-    
+
     return {
         "category": category,
         "original_query": query,
         "response": formatted_response,
         "key_points": key_points,
         "follow_up_questions": follow_up_questions
-    }
\ No newline at end of file
+    }
+
+@tracing.traced("healthcare.enrich")
+def enrich_healthcare_response(query: str, response: str, claude_instance: Claude) -> Dict[str, Any]:
+    """
+    Category, key points and follow-up questions for a ``response`` already given to ``query``.
+
+    Unlike process_healthcare_query, no new response is generated and
+    ``response`` is returned as it is: the category comes from the query, and
+    the key points and follow-up questions from the response, in one
+    structured request. If that doesn't validate they are asked for one
+    prompt each.
+    """
+    category = categorize_query(query, claude_instance)
+    enrichment = _parse_enrichment(_complete(claude_instance, _enrich_prompt(query, response)))
+    if enrichment is None:
+        enrichment = (extract_key_points(response, claude_instance),
+                      generate_follow_up_questions(response, category, claude_instance))
+    key_points, follow_up_questions = enrichment
+
+    return {
+        "category": category,
+        "original_query": query,
+        "response": response,
+        "key_points": key_points,
+        "follow_up_questions": follow_up_questions
+    }
+
+@tracing.traced("healthcare.categorize")
+async def acategorize_query(query: str, claude_instance: Claude) -> str:
+    """
+    Async version of categorize_query.
+    """
+    return _parse_category(await _acomplete(claude_instance, _categorize_prompt(query)))
+
+@tracing.traced("healthcare.format")
+async def aformat_healthcare_response(response: str, category: str, claude_instance: Claude) -> str:
+    """
+    Async version of format_healthcare_response.
+    """
+    formatted_response = await _acomplete(claude_instance, _format_prompt(response, category))
+    return formatted_response.strip()
+
+@tracing.traced("healthcare.key_points")
+async def aextract_key_points(response: str, claude_instance: Claude) -> List[str]:
+    """
+    Async version of extract_key_points.
+    """
+    return _parse_key_points(await _acomplete(claude_instance, _key_points_prompt(response)))
+
+@tracing.traced("healthcare.follow_up")
+async def agenerate_follow_up_questions(response: str, category: str, claude_instance: Claude) -> List[str]:
+    """
+    Async version of generate_follow_up_questions.
+    """
+    return _parse_follow_up_questions(await _acomplete(claude_instance, _follow_up_prompt(response, category)))
+
+@tracing.traced("healthcare.process")
+async def aprocess_healthcare_query(query: str, claude_instance: Claude, mode: str = "stepwise") -> Dict[str, Any]:
+    """
+    Process a healthcare query with the independent Claude calls running concurrently.
+
+    The category and the base completion run side by side. Key points only need
+    the base completion, so they start as soon as it arrives; formatting and
+    follow-up questions also wait for the category. The critical path is two
+    round-trips instead of five. "fused" mode works as in process_healthcare_query.
+    """
+    _check_mode(mode)
+    tracing.set_attributes(mode=mode)
+    if mode == "fused":
+        response = await claude_instance.acomplete(query)
+        fused = _parse_fused(query, await _acomplete(claude_instance, _fused_prompt(query, response)))
+        if fused is not None:
+            return fused
+    tasks = [asyncio.create_task(acategorize_query(query, claude_instance))]
+    try:
+        if mode != "fused":
+            response = await claude_instance.acomplete(query)
+        tasks.append(asyncio.create_task(aextract_key_points(response, claude_instance)))
+        category = await tasks[0]
+        tasks += [asyncio.create_task(aformat_healthcare_response(response, category, claude_instance)),
+                  asyncio.create_task(agenerate_follow_up_questions(response, category, claude_instance))]
+        key_points, formatted_response, follow_up_questions = await asyncio.gather(*tasks[1:])
+    finally:
+        _cancel_pending(tasks)
+
+    return {
+        "category": category,
+        "original_query": query,
+        "response": formatted_response,
+        "key_points": key_points,
+        "follow_up_questions": follow_up_questions
+    }
+
+@tracing.traced("healthcare.enrich")
+async def aenrich_healthcare_response(query: str, response: str, claude_instance: Claude) -> Dict[str, Any]:
+    """
+    Async version of enrich_healthcare_response.
+
+    The category and the structured request run side by side, so analysing a
+    streamed answer adds one round-trip.
+    """
+    tasks = [asyncio.create_task(acategorize_query(query, claude_instance)),
+             asyncio.create_task(_acomplete(claude_instance, _enrich_prompt(query, response)))]
+    try:
+        category = await tasks[0]
+        enrichment = _parse_enrichment(await tasks[1])
+        if enrichment is None:
+            tasks += [asyncio.create_task(aextract_key_points(response, claude_instance)),
+                      asyncio.create_task(agenerate_follow_up_questions(response, category, claude_instance))]
+            enrichment = tuple(await asyncio.gather(*tasks[2:]))
+    finally:
+        _cancel_pending(tasks)
+    key_points, follow_up_questions = enrichment
+
+    return {
+        "category": category,
+        "original_query": query,
+        "response": response,
+        "key_points": key_points,
+        "follow_up_questions": follow_up_questions
+    }
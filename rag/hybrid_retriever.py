@@ -0,0 +1,190 @@
+import math
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+from llama_index.core import QueryBundle, Settings, VectorStoreIndex
+from llama_index.core.retrievers import BaseRetriever
+from llama_index.core.schema import BaseNode, NodeWithScore
+
+from lexical_index import LexicalIndex, lexical_index_for, tokenize
+import tracing
+
+RETRIEVAL_MODES = ["hybrid", "vector", "bm25"]
+
+# The usual reciprocal rank fusion constant; it damps the weight of the very top ranks
+RRF_K = 60
+
+# Node metadata holding the cosine similarity of a retrieved node, when vector search ranked it
+VECTOR_SCORE_KEY = "vector_score"
+
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+Ranking = List[Tuple[str, float]]
+
+
+@dataclass
+class SearchSegment:
+    """One document's nodes, with their L2-normalized embeddings as a matrix and their lexical index."""
+
+    node_ids: List[str]
+    embeddings: np.ndarray
+    lexical: LexicalIndex
+
+    def __len__(self) -> int:
+        return len(self.node_ids)
+
+    @classmethod
+    def from_index(cls, index: VectorStoreIndex) -> "SearchSegment":
+        return cls._from_lexical(lexical_index_for(index), index.vector_store.data.embedding_dict)
+
+    @classmethod
+    def from_nodes(cls, nodes: Sequence[BaseNode], embedding_dict: Dict[str, List[float]]) -> "SearchSegment":
+        """A segment over ``nodes`` alone, with their embeddings from ``embedding_dict``."""
+        return cls._from_lexical(LexicalIndex.from_nodes(nodes), embedding_dict)
+
+    @classmethod
+    def _from_lexical(cls, lexical: LexicalIndex, embedding_dict: Dict[str, List[float]]) -> "SearchSegment":
+        embeddings = np.asarray([embedding_dict[node_id] for node_id in lexical.node_ids], dtype=np.float32)
+        if embeddings.size:
+            embeddings /= np.linalg.norm(embeddings, axis=1, keepdims=True).clip(min=1e-12)
+        return cls(lexical.node_ids, embeddings, lexical)
+
+    @classmethod
+    def merge(cls, segments: Sequence["SearchSegment"]) -> "SearchSegment":
+        """One segment over the nodes of ``segments``; searching it ranks them as searching them all does."""
+        return cls([node_id for segment in segments for node_id in segment.node_ids],
+                   np.concatenate([segment.embeddings for segment in segments if len(segment)] or
+                                  [np.zeros((0, 0), dtype=np.float32)]),
+                   LexicalIndex.merge([segment.lexical for segment in segments]))
+
+
+def _top_k(segments: Sequence[SearchSegment], scores: List[np.ndarray], top_k: int, positive: bool = False) -> Ranking:
+    """The ``top_k`` best (node id, score) pairs over all segments' score arrays."""
+    if not scores:
+        return []
+    combined = np.concatenate(scores)
+    candidates = np.flatnonzero(combined > 0) if positive else np.arange(len(combined))
+    if len(candidates) > top_k:
+        candidates = candidates[np.argpartition(-combined[candidates], top_k - 1)[:top_k]]
+    candidates = candidates[np.argsort(-combined[candidates], kind="stable")]
+    starts = np.cumsum([0] + [len(segment) for segment in segments])
+    owners = np.searchsorted(starts, candidates, side="right") - 1
+    return [(segments[owner].node_ids[i - starts[owner]], float(combined[i])) for owner, i in zip(owners, candidates)]
+
+
+def dense_search(segments: Sequence[SearchSegment], query_embedding: Sequence[float], top_k: int) -> Ranking:
+    """Cosine similarity of every node to the query, as SimpleVectorStore computes it, in one matmul per segment."""
+    query = np.asarray(query_embedding, dtype=np.float32)
+    query /= max(float(np.linalg.norm(query)), 1e-12)
+    segments = [segment for segment in segments if len(segment)]
+    return _top_k(segments, [segment.embeddings @ query for segment in segments], top_k)
+
+
+def bm25_search(segments: Sequence[SearchSegment], query: str, top_k: int,
+                k1: float = BM25_K1, b: float = BM25_B) -> Ranking:
+    """Okapi BM25 over all segments, with document frequencies and average length taken across them."""
+    terms = list(dict.fromkeys(tokenize(query)))
+    segments = [segment for segment in segments if len(segment)]
+    total = sum(len(segment) for segment in segments)
+    if not terms or not total:
+        return []
+    average_length = max(sum(segment.lexical.total_length for segment in segments) / total, 1.0)
+    idf = {}
+    for term in terms:
+        df = sum(segment.lexical.document_frequency(term) for segment in segments)
+        if df:
+            idf[term] = math.log(1 + (total - df + 0.5) / (df + 0.5))
+    scores = []
+    for segment in segments:
+        segment_scores = np.zeros(len(segment), dtype=np.float32)
+        for term, weight in idf.items():
+            positions, freqs = segment.lexical.postings(term)
+            if positions.size:
+                norm = k1 * (1 - b + b * segment.lexical.lengths[positions] / average_length)
+                segment_scores[positions] += weight * freqs * (k1 + 1) / (freqs + norm)
+        scores.append(segment_scores)
+    # Nodes sharing no term with the query are not lexical candidates at all
+    return _top_k(segments, scores, top_k, positive=True)
+
+
+def reciprocal_rank_fusion(rankings: Sequence[Ranking], top_k: int, k: int = RRF_K) -> Ranking:
+    """Fuse rankings by summing 1 / (k + rank) for every ranking a node appears in."""
+    fused: Dict[str, float] = {}
+    for ranking in rankings:
+        for rank, (node_id, _) in enumerate(ranking, start=1):
+            fused[node_id] = fused.get(node_id, 0.0) + 1.0 / (k + rank)
+    return sorted(fused.items(), key=lambda item: item[1], reverse=True)[:top_k]
+
+
+def _search(segments: Sequence[SearchSegment], query: str, query_embedding: Optional[Sequence[float]],
+            top_k: int, mode: str, candidate_k: Optional[int]) -> Tuple[Ranking, Ranking]:
+    """The final ranking, and the vector ranking it was made from (empty in bm25 mode)."""
+    if mode not in RETRIEVAL_MODES:
+        raise ValueError(f"Invalid retrieval mode: {mode}. Choose from {RETRIEVAL_MODES}")
+    if mode == "bm25":
+        return bm25_search(segments, query, top_k), []
+    if mode == "vector":
+        dense = dense_search(segments, query_embedding, top_k)
+        return dense, dense
+    candidate_k = candidate_k or 3 * top_k
+    dense = dense_search(segments, query_embedding, candidate_k)
+    return reciprocal_rank_fusion([dense, bm25_search(segments, query, candidate_k)], top_k), dense
+
+
+def hybrid_search(segments: Sequence[SearchSegment], query: str, query_embedding: Optional[Sequence[float]],
+                  top_k: int, mode: str = "hybrid", candidate_k: Optional[int] = None) -> Ranking:
+    """
+    The ``top_k`` nodes for ``query`` by vector similarity, BM25, or both fused.
+
+    In hybrid mode each retriever contributes ``candidate_k`` candidates
+    (default ``3 * top_k``) to reciprocal rank fusion.
+    """
+    return _search(segments, query, query_embedding, top_k, mode, candidate_k)[0]
+
+
+class HybridRetriever(BaseRetriever):
+    """
+    Retriever over a CorpusIndex that fuses vector and BM25 candidates.
+
+    Scores of the returned nodes are fused RRF scores in hybrid mode, cosine
+    similarities in vector mode and BM25 scores in bm25 mode; the reranker
+    downstream replaces them either way. Nodes among the vector candidates also
+    carry their cosine similarity in ``VECTOR_SCORE_KEY`` metadata (hidden from
+    the embedding model and the LLM), as RRF scores say little about margins.
+    """
+
+    def __init__(self, corpus: Any, similarity_top_k: int = 10, mode: str = "hybrid",
+                 candidate_k: Optional[int] = None, embed_model: Optional[Any] = None, **kwargs: Any) -> None:
+        if mode not in RETRIEVAL_MODES:
+            raise ValueError(f"Invalid retrieval mode: {mode}. Choose from {RETRIEVAL_MODES}")
+        self.corpus = corpus
+        self.similarity_top_k = similarity_top_k
+        self.mode = mode
+        self.candidate_k = candidate_k
+        self._embed_model = embed_model or Settings.embed_model
+        super().__init__(**kwargs)
+
+    @tracing.traced("retrieve")
+    def _retrieve(self, query_bundle: QueryBundle) -> List[NodeWithScore]:
+        query_embedding = None
+        if self.mode != "bm25":
+            query_embedding = query_bundle.embedding or self._embed_model.get_agg_embedding_from_queries(
+                query_bundle.embedding_strs)
+        with tracing.span("retrieve.search", mode=self.mode, top_k=self.similarity_top_k) as span:
+            ranking, dense = _search(self.corpus.search_segments(), query_bundle.query_str, query_embedding,
+                                     self.similarity_top_k, self.mode, self.candidate_k)
+            span.set(results=len(ranking))
+        vector_scores = dict(dense)
+        docstore = self.corpus.index.docstore
+        results = []
+        for node_id, score in ranking:
+            # The docstore hands out a fresh node each time, so this never reaches the stored one
+            node = docstore.get_node(node_id)
+            if node_id in vector_scores:
+                node.metadata[VECTOR_SCORE_KEY] = vector_scores[node_id]
+                node.excluded_embed_metadata_keys.append(VECTOR_SCORE_KEY)
+                node.excluded_llm_metadata_keys.append(VECTOR_SCORE_KEY)
+            results.append(NodeWithScore(node=node, score=score))
+        return results
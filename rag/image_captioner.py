@@ -0,0 +1,161 @@
+import json
+import sqlite3
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from pathlib import Path
+from typing import Callable, Dict, List, Optional
+
+from llama_index.core import Document
+
+from claude_llm import Claude
+from image_store import ImageStore
+import tracing
+
+CAPTION_PROMPT = """
+You are indexing figures from a healthcare document so they can be found by search.
+For each of the {count} images above, in order, write a short caption describing what
+it shows (chart type, axes, anatomy, table contents, key values), followed by any text
+visible in the image transcribed verbatim.
+
+Respond with only a JSON array of {count} strings, one per image.
+"""
+
+# Claude rejects images over 5 MB; keep whole requests well under the 32 MB cap
+MAX_IMAGE_BYTES = 5 * 1024 * 1024
+
+
+class CaptionCache:
+    """SQLite-backed captions keyed by image content hash, safe to share between threads."""
+
+    def __init__(self, path: str) -> None:
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("CREATE TABLE IF NOT EXISTS captions (image_hash TEXT PRIMARY KEY, caption TEXT NOT NULL)")
+        self._conn.commit()
+
+    @staticmethod
+    def image_hash(ref: str) -> str:
+        return ref.rsplit(".", 1)[0]
+
+    def get_many(self, refs: List[str]) -> Dict[str, str]:
+        hashes = {self.image_hash(ref): ref for ref in refs}
+        found = {}
+        with self._lock:
+            for image_hash, ref in hashes.items():
+                row = self._conn.execute("SELECT caption FROM captions WHERE image_hash = ?", (image_hash,)).fetchone()
+                if row:
+                    found[ref] = row[0]
+        return found
+
+    def put_many(self, captions: Dict[str, str]) -> None:
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO captions (image_hash, caption) VALUES (?, ?)",
+                [(self.image_hash(ref), caption) for ref, caption in captions.items()],
+            )
+            self._conn.commit()
+
+
+class ImageCaptioner:
+    """
+    Caption and transcribe stored images with Claude vision so figures become searchable.
+
+    Small images are packed ``images_per_request`` to a request, requests run on
+    a pool of ``max_workers`` threads, and rate-limit or overload errors are
+    retried by the Claude instance's ResiliencePolicy.
+    Captions are cached by image hash, so a figure is only ever captioned once.
+    """
+
+    def __init__(self, claude_instance: Claude, image_store: ImageStore, cache_path: Optional[str] = None,
+                 max_workers: int = 4, images_per_request: int = 4, max_request_bytes: int = 8 * 1024 * 1024) -> None:
+        self.claude_instance = claude_instance
+        self.image_store = image_store
+        self.cache = CaptionCache(cache_path or str(Path(image_store.root) / "captions.sqlite3"))
+        self.max_workers = max_workers
+        self.images_per_request = images_per_request
+        self.max_request_bytes = max_request_bytes
+
+    def _batches(self, refs: List[str]) -> List[List[str]]:
+        batches, batch, batch_bytes = [], [], 0
+        for ref in refs:
+            size = self.image_store.path(ref).stat().st_size
+            if size > MAX_IMAGE_BYTES:
+                print(f"Skipping image {ref}: {size} bytes is over Claude's per-image limit")
+                continue
+            if batch and (len(batch) >= self.images_per_request or batch_bytes + size > self.max_request_bytes):
+                batches.append(batch)
+                batch, batch_bytes = [], 0
+            batch.append(ref)
+            batch_bytes += size
+        if batch:
+            batches.append(batch)
+        return batches
+
+    def _describe(self, refs: List[str]) -> str:
+        images = [self.image_store.get(ref) for ref in refs]
+        media_types = [ImageStore.media_type(ref) for ref in refs]
+        prompt = CAPTION_PROMPT.format(count=len(refs))
+        return self.claude_instance.describe_images(images, prompt, media_types=media_types)
+
+    def _parse(self, raw: str, count: int) -> Optional[List[str]]:
+        text = raw.strip()
+        if text.startswith("```"):
+            text = text.split("\n", 1)[1] if "\n" in text else ""
+            text = text.rsplit("```", 1)[0]
+        try:
+            captions = json.loads(text)
+        except json.JSONDecodeError:
+            return None
+        if not isinstance(captions, list) or len(captions) != count:
+            return None
+        return [str(caption).strip() for caption in captions]
+
+    def _caption_batch(self, batch: List[str]) -> Dict[str, str]:
+        captions = self._parse(self._describe(batch), len(batch))
+        if captions is None and len(batch) > 1:
+            # The model lost track of the image order; caption one by one instead
+            results = {}
+            for ref in batch:
+                results.update(self._caption_batch([ref]))
+            return results
+        if captions is None:
+            print(f"Could not parse caption for image {batch[0]}")
+            return {}
+        results = dict(zip(batch, captions))
+        self.cache.put_many(results)
+        return results
+
+    @tracing.traced("caption")
+    def caption(self, refs: List[str], progress: Optional[Callable[[int, int], None]] = None) -> Dict[str, str]:
+        """Captions for ``refs``, from the cache where possible. Images that fail are left out."""
+        refs = list(dict.fromkeys(refs))
+        captions = self.cache.get_many(refs)
+        batches = self._batches([ref for ref in refs if ref not in captions])
+        tracing.set_attributes(images=len(refs), cache_hits=len(captions), requests=len(batches))
+        done = len(captions)
+        if progress and refs:
+            progress(done, len(refs))
+        with ThreadPoolExecutor(max_workers=self.max_workers) as pool:
+            futures = {pool.submit(tracing.propagate(self._caption_batch), batch): batch for batch in batches}
+            for future in as_completed(futures):
+                try:
+                    captions.update(future.result())
+                except Exception as e:
+                    print(f"Captioning failed for {len(futures[future])} image(s): {e}")
+                done += len(futures[future])
+                if progress:
+                    progress(done, len(refs))
+        return captions
+
+    def caption_documents(self, documents: List[Document],
+                          progress: Optional[Callable[[int, int], None]] = None) -> List[Document]:
+        """Replace the placeholder text of image Documents with their captions, in place."""
+        image_documents = [doc for doc in documents if doc.metadata.get("type") == "image" and "image_ref" in doc.metadata]
+        captions = self.caption([doc.metadata["image_ref"] for doc in image_documents], progress=progress)
+        for doc in image_documents:
+            caption = captions.get(doc.metadata["image_ref"])
+            if caption:
+                page = doc.metadata.get("page")
+                location = f"page {page + 1} of " if page is not None else ""
+                doc.set_content(f"Figure on {location}{doc.metadata['source']}: {caption}")
+        return documents
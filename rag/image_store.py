@@ -0,0 +1,74 @@
+import hashlib
+import os
+import tempfile
+from pathlib import Path
+from typing import Optional
+
+DEFAULT_ROOT = os.path.join(os.path.expanduser("~"), ".cache", "healthcare-rag", "images")
+
+# Image formats Claude's vision API accepts as-is, by PyMuPDF extension
+CLAUDE_MEDIA_TYPES = {
+    "jpeg": "image/jpeg",
+    "jpg": "image/jpeg",
+    "png": "image/png",
+    "gif": "image/gif",
+    "webp": "image/webp",
+}
+
+
+def detect_media_type(image_bytes: bytes) -> Optional[str]:
+    """Media type from the file signature, or None if Claude can't take it as-is."""
+    if image_bytes.startswith(b"\x89PNG\r\n\x1a\n"):
+        return "image/png"
+    if image_bytes.startswith(b"\xff\xd8\xff"):
+        return "image/jpeg"
+    if image_bytes[:6] in (b"GIF87a", b"GIF89a"):
+        return "image/gif"
+    if image_bytes[:4] == b"RIFF" and image_bytes[8:12] == b"WEBP":
+        return "image/webp"
+    return None
+
+
+class ImageStore:
+    """
+    Content-addressed store for images extracted from documents.
+
+    Images are written once under their SHA-256, so the same figure shared by
+    several pages or documents is stored a single time. A reference has the
+    form ``<sha256>.<ext>`` and is all a Document needs to carry; bytes are
+    read back only when a vision call needs them.
+    """
+
+    def __init__(self, root: str = DEFAULT_ROOT) -> None:
+        self.root = Path(root)
+        self.root.mkdir(parents=True, exist_ok=True)
+
+    def path(self, ref: str) -> Path:
+        return self.root / ref[:2] / ref
+
+    def put(self, image_bytes: bytes, ext: str) -> str:
+        ref = f"{hashlib.sha256(image_bytes).hexdigest()}.{ext}"
+        path = self.path(ref)
+        if not path.exists():
+            path.parent.mkdir(exist_ok=True)
+            # Write-then-rename so concurrent ingestion workers never see partial files;
+            # each writer gets its own temporary file, whatever process or thread it is
+            fd, tmp = tempfile.mkstemp(prefix=f".{ref}.", suffix=".tmp", dir=path.parent)
+            try:
+                with os.fdopen(fd, "wb") as f:
+                    f.write(image_bytes)
+                os.replace(tmp, path)
+            except BaseException:
+                os.unlink(tmp)
+                raise
+        return ref
+
+    def get(self, ref: str) -> bytes:
+        return self.path(ref).read_bytes()
+
+    def __contains__(self, ref: str) -> bool:
+        return self.path(ref).exists()
+
+    @staticmethod
+    def media_type(ref: str) -> str:
+        return CLAUDE_MEDIA_TYPES[ref.rsplit(".", 1)[-1]]
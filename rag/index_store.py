@@ -0,0 +1,257 @@
+import argparse
+import hashlib
+import io
+import json
+import os
+import shutil
+import time
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional
+
+import numpy as np
+from llama_index.core import Document, Settings, StorageContext, VectorStoreIndex, load_index_from_storage
+from llama_index.core.storage.docstore import SimpleDocumentStore
+from llama_index.core.storage.index_store import SimpleIndexStore
+from llama_index.core.vector_stores import SimpleVectorStore
+
+from lexical_index import LexicalIndex, attach_lexical_index, lexical_index_for
+
+DEFAULT_EMBED_MODEL = "local:BAAI/bge-small-en-v1.5"
+DEFAULT_ROOT = os.path.join(os.path.expanduser("~"), ".cache", "healthcare-rag", "indexes")
+DEFAULT_MAX_BYTES = 2 * 1024 ** 3
+
+# Bump when the on-disk layout or document processing changes so old entries miss
+STORE_VERSION = 2
+
+DOCSTORE_FILE = "docstore.json"
+INDEX_STORE_FILE = "index_store.json"
+VECTOR_DATA_FILE = "vector_store.json"
+EMBEDDINGS_FILE = "embeddings.npy"
+LEXICAL_FILE = "lexical.npz"
+META_FILE = "meta.json"
+
+
+def index_config(embed_model_name: str = DEFAULT_EMBED_MODEL, **extra: Any) -> Dict[str, Any]:
+    """
+    Everything besides the PDF bytes that changes what ends up in the index.
+    """
+    return {
+        "version": STORE_VERSION,
+        "embed_model": embed_model_name,
+        "chunk_size": Settings.chunk_size,
+        "chunk_overlap": Settings.chunk_overlap,
+        **extra,
+    }
+
+
+class IndexStore:
+    """
+    Persistent cache of built VectorStoreIndexes keyed by PDF content and index config.
+
+    Each entry is a directory holding the serialized docstore and index struct,
+    the embedding vectors as a .npy matrix that is memory-mapped on load, the
+    BM25 lexical index, and a meta.json. Entries are evicted least-recently-used
+    first once the store grows past ``max_bytes``.
+    """
+
+    def __init__(self, root: str = DEFAULT_ROOT, max_bytes: int = DEFAULT_MAX_BYTES) -> None:
+        self.root = Path(root)
+        self.max_bytes = max_bytes
+        self.root.mkdir(parents=True, exist_ok=True)
+
+    @staticmethod
+    def key(pdf_bytes: bytes, config: Dict[str, Any]) -> str:
+        digest = hashlib.sha256(pdf_bytes)
+        digest.update(json.dumps(config, sort_keys=True).encode())
+        return digest.hexdigest()
+
+    def _entry(self, key: str) -> Path:
+        return self.root / key
+
+    def __contains__(self, key: str) -> bool:
+        return (self._entry(key) / META_FILE).exists()
+
+    def load(self, key: str) -> Optional[VectorStoreIndex]:
+        entry = self._entry(key)
+        if key not in self:
+            return None
+        try:
+            meta = json.loads((entry / META_FILE).read_text())
+            embeddings = np.load(entry / EMBEDDINGS_FILE, mmap_mode="r")
+            vector_store = SimpleVectorStore.from_dict(json.loads((entry / VECTOR_DATA_FILE).read_text()))
+            # Assigned after from_dict, which would decode every row into a list of
+            # Python floats; this way the rows stay views of the memory-mapped matrix
+            vector_store.data.embedding_dict = dict(zip(meta["node_ids"], embeddings))
+            storage_context = StorageContext.from_defaults(
+                docstore=SimpleDocumentStore.from_persist_path(str(entry / DOCSTORE_FILE)),
+                index_store=SimpleIndexStore.from_persist_path(str(entry / INDEX_STORE_FILE)),
+                vector_store=vector_store,
+            )
+            index = load_index_from_storage(storage_context)
+            if (entry / LEXICAL_FILE).exists():
+                attach_lexical_index(index, LexicalIndex.load(str(entry / LEXICAL_FILE)))
+            else:
+                # Entries written before lexical indexes were stored get theirs now
+                lexical_index_for(index).save(str(entry / LEXICAL_FILE))
+        except Exception as e:
+            print(f"Discarding unreadable index store entry {key}: {e}")
+            shutil.rmtree(entry, ignore_errors=True)
+            return None
+        # mtime of meta.json doubles as the LRU clock
+        os.utime(entry / META_FILE)
+        return index
+
+    def save(self, key: str, index: VectorStoreIndex, config: Dict[str, Any], source: str = "") -> None:
+        entry = self._entry(key)
+        tmp = self.root / f".{key}.{os.getpid()}.tmp"
+        shutil.rmtree(tmp, ignore_errors=True)
+        tmp.mkdir(parents=True)
+
+        vector_data = index.vector_store.to_dict()
+        embedding_dict = vector_data.pop("embedding_dict")
+        node_ids = list(embedding_dict)
+        embeddings = np.asarray([embedding_dict[node_id] for node_id in node_ids], dtype=np.float32)
+        vector_data["embedding_dict"] = {}
+
+        index.docstore.persist(str(tmp / DOCSTORE_FILE))
+        index.storage_context.index_store.persist(str(tmp / INDEX_STORE_FILE))
+        (tmp / VECTOR_DATA_FILE).write_text(json.dumps(vector_data))
+        np.save(tmp / EMBEDDINGS_FILE, embeddings)
+        lexical_index_for(index).save(str(tmp / LEXICAL_FILE))
+        (tmp / META_FILE).write_text(json.dumps({
+            "key": key,
+            "source": source,
+            "config": config,
+            "created": time.time(),
+            "node_ids": node_ids,
+            "dim": int(embeddings.shape[1]) if embeddings.size else 0,
+        }))
+
+        shutil.rmtree(entry, ignore_errors=True)
+        os.replace(tmp, entry)
+        self.evict(keep=key)
+
+    def get_or_build(self, pdf_bytes: bytes, build_documents: Callable[[], List[Document]],
+                     config: Optional[Dict[str, Any]] = None, source: str = "") -> VectorStoreIndex:
+        """
+        Load the index for ``pdf_bytes`` from disk, or build, persist and return it.
+        """
+        config = config or index_config()
+        key = self.key(pdf_bytes, config)
+        index = self.load(key)
+        if index is None:
+            index = VectorStoreIndex.from_documents(build_documents())
+            self.save(key, index, config, source=source)
+        return index
+
+    def _size(self, entry: Path) -> int:
+        return sum(f.stat().st_size for f in entry.rglob("*") if f.is_file())
+
+    def entries(self) -> List[Dict[str, Any]]:
+        """Entries with their size and last access time, least recently used first."""
+        entries = []
+        for entry in self.root.iterdir():
+            meta_file = entry / META_FILE
+            if entry.name.startswith(".") or not meta_file.exists():
+                continue
+            entries.append({
+                "key": entry.name,
+                "size": self._size(entry),
+                "last_access": meta_file.stat().st_mtime,
+                "source": json.loads(meta_file.read_text()).get("source", ""),
+            })
+        return sorted(entries, key=lambda e: e["last_access"])
+
+    def total_size(self) -> int:
+        return sum(entry["size"] for entry in self.entries())
+
+    def evict(self, keep: Optional[str] = None) -> List[str]:
+        """Delete least recently used entries until the store fits in max_bytes."""
+        entries = self.entries()
+        total = sum(entry["size"] for entry in entries)
+        evicted = []
+        for entry in entries:
+            if total <= self.max_bytes:
+                break
+            if entry["key"] == keep:
+                continue
+            shutil.rmtree(self._entry(entry["key"]), ignore_errors=True)
+            total -= entry["size"]
+            evicted.append(entry["key"])
+        return evicted
+
+
+def warm(directory: str, store: IndexStore, include_vision: bool = True, caption_model: Optional[str] = None,
+         chunking: str = "structure", chunk_tokens: int = 256, embed_backend: str = "torch") -> None:
+    """
+    Build and persist indexes for every PDF under ``directory``.
+
+    With ``caption_model`` figures are captioned with Claude vision
+    (ANTHROPIC_API_KEY must be set), matching what the app builds when it has a key.
+    The chunking and embedding settings must match the app's for its lookups to hit.
+    """
+    from chunker import chunking_config, make_chunker
+    from document_processor import process_healthcare_document
+    from embedding_service import embedding_service
+
+    Settings.embed_model = embedding_service(backend=embed_backend)
+    caption_images = bool(caption_model) and include_vision
+    chunker = make_chunker(chunking, chunk_tokens)
+    config = index_config(f"local:{Settings.embed_model.model_name}", include_vision=include_vision,
+                          caption_images=caption_images, **chunking_config(chunker))
+    captioner = None
+    if caption_images:
+        from claude_llm import Claude
+        from image_captioner import ImageCaptioner
+        from image_store import ImageStore
+
+        captioner = ImageCaptioner(Claude(caption_model, api_key=os.environ.get("ANTHROPIC_API_KEY")), ImageStore())
+    for path in sorted(Path(directory).rglob("*.pdf")):
+        pdf_bytes = path.read_bytes()
+        key = IndexStore.key(pdf_bytes, config)
+        if key in store:
+            print(f"cached  {path}")
+            continue
+        start = time.perf_counter()
+
+        def build_documents() -> List[Document]:
+            pdf_file = io.BytesIO(pdf_bytes)
+            pdf_file.name = path.name
+            documents = process_healthcare_document(pdf_file, include_vision=include_vision, chunker=chunker)
+            return captioner.caption_documents(documents) if captioner else documents
+
+        store.get_or_build(pdf_bytes, build_documents, config, source=path.name)
+        print(f"built   {path} in {time.perf_counter() - start:.1f}s")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Manage the persistent healthcare document index store.")
+    parser.add_argument("--root", default=os.environ.get("HEALTHCARE_RAG_INDEX_DIR", DEFAULT_ROOT))
+    parser.add_argument("--max-bytes", type=int, default=int(os.environ.get("HEALTHCARE_RAG_INDEX_MAX_BYTES", DEFAULT_MAX_BYTES)))
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    warm_parser = subparsers.add_parser("warm", help="Pre-build indexes for a directory of PDFs")
+    warm_parser.add_argument("directory")
+    warm_parser.add_argument("--no-vision", action="store_true", help="Skip image extraction")
+    warm_parser.add_argument("--caption-model", default=None,
+                             help="Caption figures with this Claude model (needs ANTHROPIC_API_KEY)")
+    warm_parser.add_argument("--chunking", choices=["structure", "page"],
+                             default=os.environ.get("HEALTHCARE_RAG_CHUNKING", "structure"))
+    warm_parser.add_argument("--chunk-tokens", type=int, default=int(os.environ.get("HEALTHCARE_RAG_CHUNK_TOKENS", 256)))
+    warm_parser.add_argument("--embed-backend", choices=["torch", "onnx"],
+                             default=os.environ.get("HEALTHCARE_RAG_EMBED_BACKEND", "torch"))
+    subparsers.add_parser("list", help="List cached indexes, least recently used first")
+    args = parser.parse_args()
+
+    store = IndexStore(args.root, args.max_bytes)
+    if args.command == "warm":
+        warm(args.directory, store, include_vision=not args.no_vision, caption_model=args.caption_model,
+             chunking=args.chunking, chunk_tokens=args.chunk_tokens, embed_backend=args.embed_backend)
+    else:
+        for entry in store.entries():
+            accessed = time.strftime("%Y-%m-%d %H:%M", time.localtime(entry["last_access"]))
+            print(f"{entry['key'][:16]}  {entry['size'] / 1024 ** 2:8.1f} MB  {accessed}  {entry['source']}")
+        print(f"total {store.total_size() / 1024 ** 2:.1f} MB of {store.max_bytes / 1024 ** 2:.0f} MB")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,236 @@
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Iterable, List, Optional
+
+from llama_index.core import Document, VectorStoreIndex
+
+from corpus import CorpusIndex
+from index_store import IndexStore
+import tracing
+
+# Yields the Documents of a PDF, reporting (pages done, total pages) as it goes
+DocumentSource = Callable[[Callable[[int, int], None]], Iterable[Document]]
+# Captions image Documents in place, reporting (images done, total images)
+Captioner = Callable[[List[Document], Callable[[int, int], None]], Any]
+
+
+class IngestionJob:
+    """
+    Progress and partial results of indexing one PDF, shared by every session that submits it.
+
+    Text is indexed in batches as pages are read; each batch is published as
+    its own VectorStoreIndex in ``batches()`` so the document can be queried
+    before it is complete. Figures are captioned and indexed last.
+    """
+
+    def __init__(self, key: str, source: str) -> None:
+        self.id = uuid.uuid4().hex
+        self.key = key
+        self.source = source
+        # queued -> running -> done | failed
+        self.status = "queued"
+        self.pages_done = 0
+        self.pages_total = 0
+        self.images_done = 0
+        self.images_total = 0
+        self.nodes_indexed = 0
+        self.error: Optional[str] = None
+        self.created = time.time()
+        self.started: Optional[float] = None
+        self.finished: Optional[float] = None
+        self.index: Optional[VectorStoreIndex] = None
+        self._batches: List[VectorStoreIndex] = []
+        self._lock = threading.Lock()
+        self._finished = threading.Event()
+
+    @property
+    def done(self) -> bool:
+        return self.status in ("done", "failed")
+
+    def batches(self, start: int = 0) -> List[VectorStoreIndex]:
+        """Indexes published so far, from the ``start``-th on."""
+        with self._lock:
+            return self._batches[start:]
+
+    def publish(self, batch: VectorStoreIndex) -> None:
+        with self._lock:
+            self._batches.append(batch)
+            self.nodes_indexed += len(batch.index_struct.nodes_dict)
+
+    def finish(self, status: str, error: Optional[str] = None) -> None:
+        self.status = status
+        self.error = error
+        self.finished = time.time()
+        self._finished.set()
+
+    def wait(self, timeout: Optional[float] = None) -> bool:
+        return self._finished.wait(timeout)
+
+    def progress(self) -> float:
+        """Fraction of the work done; figures count as a final stretch when there are any."""
+        if self.status == "done":
+            return 1.0
+        pages = self.pages_done / self.pages_total if self.pages_total else 0.0
+        if not self.images_total:
+            return 0.9 * pages
+        return 0.7 * pages + 0.3 * self.images_done / self.images_total
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "key": self.key, "source": self.source, "status": self.status, "progress": self.progress(),
+            "pages_done": self.pages_done, "pages_total": self.pages_total,
+            "images_done": self.images_done, "images_total": self.images_total,
+            "nodes_indexed": self.nodes_indexed, "batches": len(self._batches), "error": self.error,
+            "queued_for": (self.started or time.time()) - self.created,
+        }
+
+
+class IngestionQueue:
+    """
+    Background PDF ingestion on a local worker pool, so indexing never runs in a request's thread.
+
+    Jobs are keyed like IndexStore entries (file hash plus index config), so
+    every session submitting the same file at the same settings gets the same
+    job and the work is done once. Finished indexes are persisted to the
+    IndexStore, and a job for a file already stored just loads it. Only the
+    ``max_finished`` most recently finished jobs are kept in memory.
+    """
+
+    def __init__(self, store: Optional[IndexStore] = None, workers: int = 2, batch_size: int = 64,
+                 embed_model: Optional[Any] = None, max_finished: int = 32) -> None:
+        self.store = store
+        self.batch_size = batch_size
+        self.embed_model = embed_model
+        self.max_finished = max_finished
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="ingest")
+        self._jobs: Dict[str, IngestionJob] = {}
+        self._lock = threading.Lock()
+
+    def submit(self, pdf_bytes: bytes, source: str, documents: DocumentSource, config: Dict[str, Any],
+               caption: Optional[Captioner] = None, retry: bool = False) -> IngestionJob:
+        """
+        The job indexing ``pdf_bytes`` with ``config``, started if there is none yet.
+
+        A failed job is returned as it is, so its error can be shown, unless
+        ``retry`` is set.
+        """
+        key = IndexStore.key(pdf_bytes, config)
+        with self._lock:
+            job = self._jobs.get(key)
+            if job is not None and not (retry and job.status == "failed"):
+                return job
+            self._evict_finished()
+            job = self._jobs[key] = IngestionJob(key, source)
+        self._executor.submit(self._run, job, documents, config, caption)
+        return job
+
+    def _evict_finished(self) -> None:
+        finished = sorted((job for job in self._jobs.values() if job.done), key=lambda job: job.finished)
+        for job in finished[:max(0, len(finished) - self.max_finished + 1)]:
+            del self._jobs[job.key]
+
+    def get(self, key: str) -> Optional[IngestionJob]:
+        return self._jobs.get(key)
+
+    def jobs(self) -> List[IngestionJob]:
+        with self._lock:
+            return list(self._jobs.values())
+
+    def shutdown(self, wait: bool = True) -> None:
+        self._executor.shutdown(wait=wait, cancel_futures=True)
+
+    def _index(self, documents: List[Document], job: IngestionJob, document: CorpusIndex) -> None:
+        if not documents:
+            return
+        with tracing.span("ingest.embed", documents=len(documents)):
+            batch = VectorStoreIndex.from_documents(documents, embed_model=self.embed_model)
+        with tracing.span("ingest.index", nodes=len(batch.index_struct.nodes_dict)):
+            document.extend(job.key, batch, source=job.source)
+            job.publish(batch)
+
+    def _run(self, job: IngestionJob, documents: DocumentSource, config: Dict[str, Any],
+             caption: Optional[Captioner]) -> None:
+        job.status = "running"
+        job.started = time.time()
+        with tracing.span("ingest", queued_ms=(job.started - job.created) * 1000) as span:
+            self._ingest(job, documents, config, caption)
+            span.set(status=job.status, pages=job.pages_total, images=job.images_total, nodes=job.nodes_indexed)
+
+    def _ingest(self, job: IngestionJob, documents: DocumentSource, config: Dict[str, Any],
+                caption: Optional[Captioner]) -> None:
+        try:
+            with tracing.span("ingest.load"):
+                stored = self.store.load(job.key) if self.store else None
+            if stored is not None:
+                job.index = stored
+                job.publish(stored)
+                job.finish("done")
+                return
+
+            def pages(done: int, total: int) -> None:
+                job.pages_done, job.pages_total = done, total
+
+            def images(done: int, total: int) -> None:
+                job.images_done, job.images_total = done, total
+
+            # The whole document is assembled from the batches, for the IndexStore
+            document = CorpusIndex(embed_model=self.embed_model)
+            image_documents: List[Document] = []
+            stream = iter(documents(pages))
+            exhausted = False
+            while not exhausted:
+                # Figures are extracted in the same pass over the pages as the text, so parsing covers both
+                batch: List[Document] = []
+                with tracing.span("ingest.parse") as span:
+                    for doc in stream:
+                        if doc.metadata.get("type") == "image":
+                            image_documents.append(doc)
+                            continue
+                        batch.append(doc)
+                        if len(batch) >= self.batch_size:
+                            break
+                    else:
+                        exhausted = True
+                    span.set(documents=len(batch), pages_done=job.pages_done)
+                self._index(batch, job, document)
+            if image_documents:
+                job.images_total = len(image_documents)
+                if caption is not None:
+                    caption(image_documents, images)
+                job.images_done = job.images_total
+                self._index(image_documents, job, document)
+            job.index = document.index
+            if self.store is not None:
+                with tracing.span("ingest.save"):
+                    self.store.save(job.key, document.index, config, source=job.source)
+            job.finish("done")
+        except Exception as e:
+            tracing.record_error(e)
+            print(f"Error ingesting {job.source}: {e}")
+            job.finish("failed", str(e))
+
+
+def follow(corpus: CorpusIndex, key: str, job: IngestionJob, followed: Dict[str, str]) -> int:
+    """
+    Add the batches ``job`` has published since the last call to ``corpus``, under ``key``.
+
+    ``followed`` maps keys to the id of the job each document was filled from
+    and should live as long as the corpus; if the job changes (a retry, or
+    the finished job was evicted and the index reloaded) the document is
+    rebuilt from the new one. Once the job is done and all its batches are
+    added, the document's batch segments are merged into one. Returns the
+    number of nodes added.
+    """
+    if followed.get(key) != job.id:
+        corpus.remove(key)
+        followed[key] = job.id
+    # Read before following, so batches published meanwhile are not left out of the merge
+    done = job.done
+    added = 0
+    for batch in job.batches(start=corpus.batches(key)):
+        added += corpus.extend(key, batch, source=job.source)
+    if done and job.status == "done":
+        corpus.compact(key)
+    return added
@@ -0,0 +1,147 @@
+import re
+import weakref
+from collections import Counter
+from typing import Iterable, List, Sequence, Tuple
+
+import numpy as np
+from llama_index.core import VectorStoreIndex
+from llama_index.core.schema import BaseNode, MetadataMode
+
+# Keeps codes and doses whole: "e11.9", "1.73m2", "500mg", "hba1c", "co-amoxiclav"
+_TOKEN = re.compile(r"[a-z0-9]+(?:[./+-][a-z0-9]+)*")
+_COMPOUND_SEPARATOR = re.compile(r"[/+-]")
+
+STOPWORDS = frozenset("""
+a an and are as at be been but by can do does for from had has have how i if in into is it its may of on or
+should than that the their them then there these they this to was were what when where which while who why
+will with would you your
+""".split())
+
+
+def tokenize(text: str) -> List[str]:
+    """Lower-cased terms of ``text`` without stopwords; compounds also yield their parts."""
+    tokens = []
+    for token in _TOKEN.findall(text.lower()):
+        if token in STOPWORDS:
+            continue
+        tokens.append(token)
+        if _COMPOUND_SEPARATOR.search(token):
+            tokens += [part for part in _COMPOUND_SEPARATOR.split(token) if part and part not in STOPWORDS]
+    return tokens
+
+
+class LexicalIndex:
+    """
+    Inverted index of one document's nodes, for BM25.
+
+    Postings are stored as CSR arrays: the postings of term ``t`` are
+    ``positions[offsets[t]:offsets[t + 1]]`` (positions in ``node_ids``) with
+    their term frequencies in ``freqs``, so scoring a query term is a slice and
+    a few vector operations. Corpus-wide statistics (document frequency,
+    average length) are left to the caller, so indexes of several documents
+    can be searched together.
+    """
+
+    def __init__(self, node_ids: List[str], lengths: np.ndarray, terms: List[str], offsets: np.ndarray,
+                 positions: np.ndarray, freqs: np.ndarray) -> None:
+        self.node_ids = node_ids
+        self.lengths = lengths
+        self.terms = terms
+        self.offsets = offsets
+        self.positions = positions
+        self.freqs = freqs
+        self.vocabulary = {term: i for i, term in enumerate(terms)}
+        self.total_length = float(lengths.sum())
+
+    def __len__(self) -> int:
+        return len(self.node_ids)
+
+    @classmethod
+    def build(cls, node_ids: List[str], texts: Iterable[str]) -> "LexicalIndex":
+        vocabulary = {}
+        term_ids, positions, freqs, lengths = [], [], [], []
+        for position, text in enumerate(texts):
+            counts = Counter(tokenize(text))
+            lengths.append(sum(counts.values()))
+            for term, count in counts.items():
+                term_ids.append(vocabulary.setdefault(term, len(vocabulary)))
+                positions.append(position)
+                freqs.append(count)
+        term_ids = np.asarray(term_ids, dtype=np.int64)
+        # Stable, so each term's postings stay in node order
+        order = np.argsort(term_ids, kind="stable")
+        offsets = np.zeros(len(vocabulary) + 1, dtype=np.int64)
+        offsets[1:] = np.cumsum(np.bincount(term_ids, minlength=len(vocabulary)))
+        return cls(list(node_ids), np.asarray(lengths, dtype=np.float32), list(vocabulary), offsets,
+                   np.asarray(positions, dtype=np.int32)[order], np.asarray(freqs, dtype=np.float32)[order])
+
+    @classmethod
+    def merge(cls, indexes: List["LexicalIndex"]) -> "LexicalIndex":
+        """One index over the nodes of ``indexes``, in order, from their postings; nothing is re-tokenized."""
+        vocabulary = {}
+        term_ids, positions = [], []
+        base = 0
+        for index in indexes:
+            mapping = np.asarray([vocabulary.setdefault(term, len(vocabulary)) for term in index.terms], dtype=np.int64)
+            term_ids.append(np.repeat(mapping, np.diff(index.offsets)))
+            positions.append(index.positions + base)
+            base += len(index)
+        term_ids = np.concatenate(term_ids)
+        # Stable, and the parts are in node order, so each term's postings stay in node order
+        order = np.argsort(term_ids, kind="stable")
+        offsets = np.zeros(len(vocabulary) + 1, dtype=np.int64)
+        offsets[1:] = np.cumsum(np.bincount(term_ids, minlength=len(vocabulary)))
+        return cls([node_id for index in indexes for node_id in index.node_ids],
+                   np.concatenate([index.lengths for index in indexes]), list(vocabulary), offsets,
+                   np.concatenate(positions)[order], np.concatenate([index.freqs for index in indexes])[order])
+
+    @classmethod
+    def from_nodes(cls, nodes: Sequence[BaseNode]) -> "LexicalIndex":
+        """Index ``nodes`` as the embedding model sees them (text plus section and source)."""
+        return cls.build([node.node_id for node in nodes],
+                         (node.get_content(metadata_mode=MetadataMode.EMBED) for node in nodes))
+
+    @classmethod
+    def from_index(cls, index: VectorStoreIndex) -> "LexicalIndex":
+        return cls.from_nodes(index.docstore.get_nodes(list(index.index_struct.nodes_dict.values())))
+
+    def postings(self, term: str) -> Tuple[np.ndarray, np.ndarray]:
+        """Positions of the nodes containing ``term`` and its frequency in each."""
+        t = self.vocabulary.get(term)
+        if t is None:
+            return self.positions[:0], self.freqs[:0]
+        start, end = self.offsets[t], self.offsets[t + 1]
+        return self.positions[start:end], self.freqs[start:end]
+
+    def document_frequency(self, term: str) -> int:
+        t = self.vocabulary.get(term)
+        return 0 if t is None else int(self.offsets[t + 1] - self.offsets[t])
+
+    def save(self, path: str) -> None:
+        with open(path, "wb") as f:
+            np.savez(f, node_ids=np.asarray(self.node_ids, dtype=str), lengths=self.lengths,
+                     terms=np.asarray(self.terms, dtype=str), offsets=self.offsets, positions=self.positions,
+                     freqs=self.freqs)
+
+    @classmethod
+    def load(cls, path: str) -> "LexicalIndex":
+        with np.load(path) as data:
+            return cls(data["node_ids"].tolist(), data["lengths"], data["terms"].tolist(), data["offsets"],
+                       data["positions"], data["freqs"])
+
+
+# Lexical indexes travel with the VectorStoreIndex they were built or loaded for
+_lexical_indexes: "weakref.WeakKeyDictionary[VectorStoreIndex, LexicalIndex]" = weakref.WeakKeyDictionary()
+
+
+def attach_lexical_index(index: VectorStoreIndex, lexical: LexicalIndex) -> None:
+    _lexical_indexes[index] = lexical
+
+
+def lexical_index_for(index: VectorStoreIndex) -> LexicalIndex:
+    """The lexical index attached to ``index``, built from its nodes if it has none."""
+    lexical = _lexical_indexes.get(index)
+    if lexical is None:
+        lexical = LexicalIndex.from_index(index)
+        attach_lexical_index(index, lexical)
+    return lexical
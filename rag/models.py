@@ -0,0 +1,120 @@
+"""
+Process-wide registry of the heavy models: the embedder and the reranker's cross-encoder.
+
+Each model is loaded once per process, by the first caller that needs it or
+by ``warm_up`` on a background thread at start-up, and is then shared by
+every RAGService, Streamlit session and request. Models are registered as
+factories, so registering imports nothing heavy; torch and
+sentence-transformers are only imported when a factory runs.
+"""
+import threading
+import time
+from typing import Any, Callable, Dict, Iterable, List, Optional
+
+import tracing
+
+
+class LazyModel:
+    """A callable model (an embedding backend, a scorer) that loads from the registry on its first call."""
+
+    def __init__(self, registry: "ModelRegistry", name: str) -> None:
+        self.registry = registry
+        self.name = name
+
+    def load(self) -> Any:
+        return self.registry.get(self.name)
+
+    def __call__(self, *args: Any, **kwargs: Any) -> Any:
+        return self.load()(*args, **kwargs)
+
+
+class ModelRegistry:
+    """
+    Named model factories, each run at most once.
+
+    Different models can load in parallel; concurrent callers of
+    ``get`` for a model that is loading wait for it rather than load it again.
+    A factory that fails is retried by the next ``get``.
+    """
+
+    def __init__(self) -> None:
+        self._factories: Dict[str, Callable[[], Any]] = {}
+        self._models: Dict[str, Any] = {}
+        self._locks: Dict[str, threading.Lock] = {}
+        self._lock = threading.Lock()
+        self.load_seconds: Dict[str, float] = {}
+        self.errors: Dict[str, str] = {}
+
+    def register(self, name: str, factory: Callable[[], Any], replace: bool = False) -> None:
+        """
+        Load ``name`` with ``factory`` when first needed.
+
+        Registering a name again is a no-op, so every service made in the
+        process shares the first registration's model; ``replace`` swaps in
+        ``factory`` and drops the model loaded by the old one.
+        """
+        with self._lock:
+            if name in self._factories and not replace:
+                return
+            self._factories[name] = factory
+            self._locks.setdefault(name, threading.Lock())
+            self._models.pop(name, None)
+
+    def get(self, name: str) -> Any:
+        """The model ``name``, loaded now if it is not yet. Raises KeyError for unregistered names."""
+        if name in self._models:
+            return self._models[name]
+        with self._lock:
+            if name not in self._factories:
+                raise KeyError(f"Unknown model: {name}")
+            lock = self._locks[name]
+        with lock:
+            if name not in self._models:
+                start = time.perf_counter()
+                with tracing.span("model.load", model=name):
+                    try:
+                        model = self._factories[name]()
+                    except Exception as e:
+                        self.errors[name] = str(e)
+                        raise
+                self.load_seconds[name] = time.perf_counter() - start
+                self.errors.pop(name, None)
+                self._models[name] = model
+            return self._models[name]
+
+    def lazy(self, name: str) -> LazyModel:
+        return LazyModel(self, name)
+
+    def loaded(self, name: str) -> bool:
+        return name in self._models
+
+    def pending(self) -> List[str]:
+        """Registered models that are not loaded yet."""
+        with self._lock:
+            return [name for name in self._factories if name not in self._models]
+
+    def warm_up(self, names: Optional[Iterable[str]] = None) -> threading.Thread:
+        """
+        Load ``names`` (default: every registered model) on a daemon thread, and return the thread.
+
+        Failures are printed and left for the first real use to raise.
+        """
+        names = list(names) if names is not None else self.pending()
+
+        def load() -> None:
+            for name in names:
+                try:
+                    self.get(name)
+                except Exception as e:
+                    print(f"Error loading model {name}: {e}")
+
+        thread = threading.Thread(target=load, name="model-warm-up", daemon=True)
+        thread.start()
+        return thread
+
+    def stats(self) -> Dict[str, Any]:
+        return {"loaded": [name for name in self._factories if name in self._models], "pending": self.pending(),
+                "load_seconds": dict(self.load_seconds), "errors": dict(self.errors)}
+
+
+registry = ModelRegistry()
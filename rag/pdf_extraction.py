@@ -0,0 +1,111 @@
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from typing import TYPE_CHECKING, Callable, Dict, Iterator, List, Optional, Tuple
+
+from image_store import CLAUDE_MEDIA_TYPES, ImageStore
+
+if TYPE_CHECKING:
+    # PyMuPDF is imported where a PDF is opened, so importing the service does not load it
+    import fitz
+
+# (page number, page text, image store references of the page's images)
+PageContent = Tuple[int, str, List[str]]
+
+# Set in each pool worker by _init_worker so the PDF is shipped once per process
+_worker_pdf: Optional["fitz.Document"] = None
+_worker_image_store: Optional[ImageStore] = None
+
+
+def extract_images_from_page(page, image_store: ImageStore, seen_xrefs: Optional[Dict[int, str]] = None) -> List[str]:
+    """
+    Store the page's images and return their references.
+
+    Images are kept in their original encoding when Claude accepts it and
+    converted to PNG otherwise. ``seen_xrefs`` caches references by PDF xref
+    so an image repeated on many pages is only extracted once.
+    """
+    seen_xrefs = {} if seen_xrefs is None else seen_xrefs
+    images = []
+    for img in page.get_images(full=True):
+        xref = img[0]
+        if xref not in seen_xrefs:
+            base_image = page.parent.extract_image(xref)
+            ext = base_image["ext"]
+            if ext in CLAUDE_MEDIA_TYPES:
+                seen_xrefs[xref] = image_store.put(base_image["image"], ext)
+            else:
+                import fitz
+
+                pixmap = fitz.Pixmap(page.parent, xref)
+                if pixmap.n - pixmap.alpha >= 4:
+                    pixmap = fitz.Pixmap(fitz.csRGB, pixmap)
+                seen_xrefs[xref] = image_store.put(pixmap.tobytes("png"), "png")
+        images.append(seen_xrefs[xref])
+    return images
+
+
+def _extract_range(pdf: "fitz.Document", start: int, stop: int, image_store: Optional[ImageStore]) -> List[PageContent]:
+    pages = []
+    seen_xrefs: Dict[int, str] = {}
+    for page_number in range(start, stop):
+        page = pdf[page_number]
+        images = extract_images_from_page(page, image_store, seen_xrefs) if image_store else []
+        pages.append((page_number, page.get_text(), images))
+    return pages
+
+
+def _init_worker(pdf_bytes: bytes, image_root: Optional[str]) -> None:
+    import fitz
+
+    global _worker_pdf, _worker_image_store
+    _worker_pdf = fitz.open(stream=pdf_bytes, filetype="pdf")
+    _worker_image_store = ImageStore(image_root) if image_root else None
+
+
+def _extract_shard(start: int, stop: int) -> List[PageContent]:
+    return _extract_range(_worker_pdf, start, stop, _worker_image_store)
+
+
+def default_workers() -> int:
+    return max(1, min(8, (os.cpu_count() or 1) - 1))
+
+
+def iter_pdf_pages(pdf_bytes: bytes, image_store: Optional[ImageStore] = None, workers: Optional[int] = None,
+                   pages_per_shard: int = 32,
+                   progress: Optional[Callable[[int, int], None]] = None) -> Iterator[PageContent]:
+    """
+    Extract text from every page in a single PyMuPDF pass, and images into ``image_store`` if given.
+
+    Page ranges of ``pages_per_shard`` pages are spread over a process pool and
+    yielded in page order as soon as each shard is done. ``progress`` is called
+    with (pages done, total pages) once per shard. Documents that fit in one
+    shard, or ``workers=1``, are processed in-process.
+    """
+    import fitz
+
+    with fitz.open(stream=pdf_bytes, filetype="pdf") as pdf:
+        page_count = pdf.page_count
+        shards = [(start, min(start + pages_per_shard, page_count)) for start in range(0, page_count, pages_per_shard)]
+        workers = min(workers or default_workers(), len(shards))
+        if workers <= 1:
+            for start, stop in shards:
+                yield from _extract_range(pdf, start, stop, image_store)
+                if progress:
+                    progress(stop, page_count)
+            return
+
+    # spawn rather than fork: the app process runs Streamlit/torch threads
+    context = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(max_workers=workers, mp_context=context,
+                             initializer=_init_worker,
+                             initargs=(pdf_bytes, str(image_store.root) if image_store else None)) as pool:
+        futures = [pool.submit(_extract_shard, start, stop) for start, stop in shards]
+        try:
+            for future, (_, stop) in zip(futures, shards):
+                yield from future.result()
+                if progress:
+                    progress(stop, page_count)
+        finally:
+            for future in futures:
+                future.cancel()
@@ -0,0 +1,229 @@
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import asdict, dataclass
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+from llama_index.core.bridge.pydantic import Field, PrivateAttr
+from llama_index.core.callbacks import CBEventType, EventPayload
+from llama_index.core.postprocessor.types import BaseNodePostprocessor
+from llama_index.core.schema import MetadataMode, NodeWithScore, QueryBundle
+
+from context_packer import CHARS_PER_TOKEN, estimate_tokens
+from hybrid_retriever import VECTOR_SCORE_KEY
+from resilience import LatencyTracker
+from response_cache import normalize
+import tracing
+
+DEFAULT_RERANK_MODEL = "cross-encoder/ms-marco-MiniLM-L-2-v2"
+MAX_LENGTH = 512
+
+# Scores (query, passage) pairs, higher is more relevant
+Scorer = Callable[[List[Tuple[str, str]]], np.ndarray]
+
+
+def cross_encoder_scorer(model_name: str = DEFAULT_RERANK_MODEL, max_length: int = MAX_LENGTH,
+                         threads: Optional[int] = None) -> Scorer:
+    """A sentence-transformers CrossEncoder on CPU that scores all pairs it is given in one padded batch."""
+    import torch
+    from sentence_transformers import CrossEncoder
+
+    if threads:
+        torch.set_num_threads(threads)
+    model = CrossEncoder(model_name, max_length=max_length, device="cpu")
+
+    def score(pairs: List[Tuple[str, str]]) -> np.ndarray:
+        with torch.inference_mode():
+            return np.asarray(model.predict(pairs, batch_size=len(pairs), show_progress_bar=False,
+                                            convert_to_numpy=True), dtype=np.float32)
+    return score
+
+
+def passage_windows(text: str, max_tokens: int) -> List[str]:
+    """``text`` split at word boundaries into windows of about ``max_tokens``, so long passages are not truncated."""
+    if estimate_tokens(text) <= max_tokens:
+        return [text]
+    max_chars = int(max_tokens * CHARS_PER_TOKEN)
+    windows, current, length = [], [], 0
+    for word in text.split():
+        if current and length + len(word) + 1 > max_chars:
+            windows.append(" ".join(current))
+            current, length = [], 0
+        current.append(word)
+        length += len(word) + 1
+    if current:
+        windows.append(" ".join(current))
+    return windows
+
+
+@dataclass
+class RerankStats:
+    reranks: int = 0
+    skipped: int = 0
+    pairs_scored: int = 0
+    cache_hits: int = 0
+
+    def to_dict(self) -> Dict[str, int]:
+        return asdict(self)
+
+
+class ScoreCache:
+    """LRU of cross-encoder scores keyed by (query hash, node id)."""
+
+    def __init__(self, max_entries: int = 20000) -> None:
+        self.max_entries = max_entries
+        self._scores: "OrderedDict[Tuple[str, str], float]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def query_key(query: str) -> str:
+        return hashlib.sha256(normalize(query).encode()).hexdigest()
+
+    def get(self, key: Tuple[str, str]) -> Optional[float]:
+        with self._lock:
+            score = self._scores.get(key)
+            if score is not None:
+                self._scores.move_to_end(key)
+            return score
+
+    def put(self, key: Tuple[str, str], score: float) -> None:
+        with self._lock:
+            self._scores[key] = score
+            self._scores.move_to_end(key)
+            while len(self._scores) > self.max_entries:
+                self._scores.popitem(last=False)
+
+
+class AdaptiveRerank(BaseNodePostprocessor):
+    """
+    Cross-encoder reranking that does as little work as the query needs.
+
+    - Reranking is skipped when the top vector similarity beats the runner-up
+      by ``skip_margin``, and the retrieval order is kept. Similarities come
+      from HybridRetriever's ``vector_score`` metadata, else the node scores.
+    - Scores are cached per (query, node), so a repeated or regenerated
+      question only scores nodes it has not seen.
+    - All uncached (query, passage) pairs are scored in one padded batch;
+      passages longer than ``max_passage_tokens`` are split into windows and
+      score as their best window instead of being truncated.
+    - top_k: only as many candidates as fit ``latency_budget`` at the measured
+      cost per pair are scored (never fewer than ``min_top_k``).
+    - top_n: nodes scoring below ``relative_cutoff`` of the best are dropped,
+      keeping between ``min_top_n`` and ``top_n``.
+    """
+
+    top_n: int = Field(default=10, description="Most nodes to return.")
+    min_top_n: int = Field(default=3, description="Fewest nodes to return when there are that many.")
+    relative_cutoff: float = Field(default=0.1, description="Fraction of the best score below which nodes are dropped.")
+    skip_margin: float = Field(default=0.1, description="Lead in cosine similarity of the top node that skips reranking.")
+    min_top_k: int = Field(default=5, description="Fewest candidates to score, whatever the latency budget.")
+    latency_budget: float = Field(default=0.5, description="Seconds of scoring per query that top_k is fitted to.")
+    max_passage_tokens: int = Field(default=448, description="Passage window size, in estimated tokens (an overestimate for the model's tokenizer).")
+    _scorer: Scorer = PrivateAttr()
+    _cache: ScoreCache = PrivateAttr()
+    _latency: LatencyTracker = PrivateAttr()
+    _stats: RerankStats = PrivateAttr()
+    _seconds_per_pair: Optional[float] = PrivateAttr()
+    _lock: threading.Lock = PrivateAttr()
+
+    def __init__(self, scorer: Scorer, cache: Optional[ScoreCache] = None, **kwargs: Any) -> None:
+        super().__init__(**kwargs)
+        self._scorer = scorer
+        self._cache = cache or ScoreCache()
+        self._latency = LatencyTracker()
+        self._stats = RerankStats()
+        self._seconds_per_pair = None
+        self._lock = threading.Lock()
+
+    @classmethod
+    def class_name(cls) -> str:
+        return "AdaptiveRerank"
+
+    def should_skip(self, nodes: List[NodeWithScore]) -> bool:
+        scores = [n.node.metadata.get(VECTOR_SCORE_KEY, n.score) for n in nodes]
+        scores = sorted((score for score in scores if score is not None), reverse=True)
+        return len(scores) >= 2 and scores[0] - scores[1] >= self.skip_margin
+
+    def candidate_count(self, count: int) -> int:
+        """How many of ``count`` candidates to score, given the measured cost per pair."""
+        if self._seconds_per_pair is None:
+            return count
+        return max(min(self.min_top_k, count), min(count, int(self.latency_budget / self._seconds_per_pair)))
+
+    def _score(self, query: str, nodes: List[NodeWithScore]) -> List[float]:
+        query_key = ScoreCache.query_key(query)
+        scores: Dict[int, float] = {}
+        pairs, owners = [], []
+        for i, node in enumerate(nodes):
+            cached = self._cache.get((query_key, node.node.node_id))
+            if cached is not None:
+                scores[i] = cached
+                continue
+            for window in passage_windows(node.node.get_content(metadata_mode=MetadataMode.EMBED), self.max_passage_tokens):
+                pairs.append((query, window))
+                owners.append(i)
+        if pairs:
+            # A lazily loaded model is loaded first, so its load time is not taken for the cost of scoring
+            load = getattr(self._scorer, "load", None)
+            if load is not None:
+                load()
+            start = time.perf_counter()
+            pair_scores = self._scorer(pairs)
+            elapsed = time.perf_counter() - start
+            for i, score in zip(owners, pair_scores):
+                scores[i] = max(scores.get(i, float("-inf")), float(score))
+            for i in set(owners):
+                self._cache.put((query_key, nodes[i].node.node_id), scores[i])
+        tracing.set_attributes(pairs=len(pairs), cache_hits=len(nodes) - len(set(owners)))
+        with self._lock:
+            self._stats.pairs_scored += len(pairs)
+            self._stats.cache_hits += len(nodes) - len(set(owners))
+            if pairs:
+                # Smoothed so one slow batch does not collapse top_k
+                per_pair = elapsed / len(pairs)
+                self._seconds_per_pair = per_pair if self._seconds_per_pair is None else (
+                    0.8 * self._seconds_per_pair + 0.2 * per_pair)
+        return [scores[i] for i in range(len(nodes))]
+
+    @tracing.traced("rerank")
+    def _postprocess_nodes(self, nodes: List[NodeWithScore],
+                           query_bundle: Optional[QueryBundle] = None) -> List[NodeWithScore]:
+        if query_bundle is None:
+            raise ValueError("Missing query bundle in extra info.")
+        if not nodes:
+            return []
+        start = time.perf_counter()
+        tracing.set_attributes(candidates=len(nodes))
+        if self.should_skip(nodes):
+            tracing.set_attributes(skipped=True)
+            with self._lock:
+                self._stats.skipped += 1
+            result = sorted(nodes, key=lambda n: n.score if n.score is not None else float("-inf"), reverse=True)
+            self._latency.record(time.perf_counter() - start)
+            return result[:self.top_n]
+
+        candidates = nodes[:self.candidate_count(len(nodes))]
+        with self.callback_manager.event(
+            CBEventType.RERANKING,
+            payload={EventPayload.NODES: candidates, EventPayload.QUERY_STR: query_bundle.query_str,
+                     EventPayload.TOP_K: self.top_n},
+        ) as event:
+            for node, score in zip(candidates, self._score(query_bundle.query_str, candidates)):
+                node.score = score
+            ranked = sorted(candidates, key=lambda n: n.score, reverse=True)
+            floor = ranked[0].score * self.relative_cutoff if ranked[0].score > 0 else float("-inf")
+            keep = max(min(self.min_top_n, len(ranked)), sum(1 for n in ranked if n.score >= floor))
+            result = ranked[:min(keep, self.top_n)]
+            event.on_end(payload={EventPayload.NODES: result})
+        with self._lock:
+            self._stats.reranks += 1
+        self._latency.record(time.perf_counter() - start)
+        return result
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            stats = self._stats.to_dict()
+        return {**stats, "p50_latency": self._latency.quantile(0.5, min_samples=1),
+                "p95_latency": self._latency.quantile(0.95, min_samples=1)}
@@ -0,0 +1,389 @@
+import asyncio
+import random
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Any, AsyncIterator, Awaitable, Callable, Deque, Dict, Iterator, Optional, TypeVar
+
+from anthropic import APIConnectionError, APIStatusError
+
+import tracing
+
+T = TypeVar("T")
+
+# Overloaded / rate limited / transient server errors worth retrying
+RETRYABLE_STATUS_CODES = {408, 409, 429, 500, 502, 503, 504, 529}
+
+# Threads running hedged synchronous calls, losers included, per policy
+HEDGE_WORKERS = 16
+
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling the API while the circuit breaker is open."""
+
+
+class ServiceBusyError(Exception):
+    """Raised instead of queueing a request when an AdmissionLimiter is full; clients should back off."""
+
+
+def is_retryable(error: BaseException) -> bool:
+    if isinstance(error, APIStatusError):
+        return error.status_code in RETRYABLE_STATUS_CODES
+    # Also covers APITimeoutError
+    return isinstance(error, APIConnectionError)
+
+
+def retry_after(error: BaseException) -> Optional[float]:
+    """Seconds the server asked us to wait, from retry-after-ms or retry-after."""
+    response = getattr(error, "response", None)
+    if response is None:
+        return None
+    for header, scale in (("retry-after-ms", 0.001), ("retry-after", 1.0)):
+        value = response.headers.get(header)
+        if value is not None:
+            try:
+                return float(value) * scale
+            except ValueError:
+                continue
+    return None
+
+
+class CircuitBreaker:
+    """
+    Fails fast after ``failure_threshold`` consecutive retryable failures.
+
+    The circuit stays open for ``reset_timeout`` seconds, then lets a single
+    trial call through (half-open); its outcome closes or re-opens it. A trial
+    that ends without an outcome (abandoned, cancelled) must be ``release``d.
+    """
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30.0) -> None:
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at: Optional[float] = None
+        self._trial: Optional[object] = None
+        self._lock = threading.Lock()
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            if self.opened_at is None:
+                return "closed"
+            return "half-open" if time.monotonic() - self.opened_at >= self.reset_timeout else "open"
+
+    def before_call(self) -> Optional[object]:
+        """Raise CircuitOpenError if the call may not go ahead; returns a token if it is the half-open trial."""
+        with self._lock:
+            if self.opened_at is None:
+                return None
+            if time.monotonic() - self.opened_at < self.reset_timeout or self._trial is not None:
+                raise CircuitOpenError("Claude API circuit is open after repeated failures; failing fast")
+            self._trial = object()
+            return self._trial
+
+    def release(self, trial: Optional[object]) -> None:
+        """End ``trial`` without an outcome, letting the next call be the trial, unless one was recorded."""
+        with self._lock:
+            if trial is not None and self._trial is trial:
+                self._trial = None
+
+    def record_success(self) -> None:
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+            self._trial = None
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self.failures += 1
+            if self._trial is not None or self.failures >= self.failure_threshold:
+                self.opened_at = time.monotonic()
+            self._trial = None
+
+
+class LatencyTracker:
+    """Rolling window of call latencies used to decide when to hedge."""
+
+    def __init__(self, window: int = 200) -> None:
+        self._samples: Deque[float] = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def record(self, seconds: float) -> None:
+        with self._lock:
+            self._samples.append(seconds)
+
+    def quantile(self, q: float, min_samples: int = 20) -> Optional[float]:
+        with self._lock:
+            if len(self._samples) < min_samples:
+                return None
+            ordered = sorted(self._samples)
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+class AdmissionLimiter:
+    """
+    Caps the requests in flight, refusing the rest instead of queueing them without bound.
+
+    Shedding load at the door keeps latency bounded for the requests already
+    admitted; with ``max_in_flight`` at the workers that do the work plus a
+    short queue, a burst costs a few fast rejections rather than timeouts for
+    everyone. Usable from threads and coroutines alike.
+    """
+
+    def __init__(self, max_in_flight: int) -> None:
+        self.max_in_flight = max_in_flight
+        self.in_flight = 0
+        self.admitted = 0
+        self.rejected = 0
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def admit(self) -> Iterator[None]:
+        with self._lock:
+            if self.in_flight >= self.max_in_flight:
+                self.rejected += 1
+                raise ServiceBusyError(f"{self.in_flight} requests already in flight; try again shortly")
+            self.in_flight += 1
+            self.admitted += 1
+        try:
+            yield
+        finally:
+            with self._lock:
+                self.in_flight -= 1
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {"in_flight": self.in_flight, "admitted": self.admitted, "rejected": self.rejected}
+
+
+class ResiliencePolicy:
+    """
+    Retries, hedging and circuit breaking around Claude API calls.
+
+    Retryable errors (429, 529, 5xx, connection errors) are retried up to
+    ``max_retries`` times with full-jitter exponential backoff, waiting at
+    least as long as the server's ``retry-after``. With ``hedge`` enabled, a
+    duplicate request is sent when the first has not answered within the
+    ``hedge_quantile`` latency of recent calls (never sooner than
+    ``min_hedge_delay``), and whichever succeeds first wins; an attempt that
+    fails first waits for the other before the error counts.
+
+    A losing async attempt is cancelled. A losing synchronous attempt cannot
+    be interrupted: it runs to the end on the hedge pool and the tokens it
+    uses are still billed. The pool has HEDGE_WORKERS threads, so under load
+    further attempts queue behind the losers instead of multiplying.
+    """
+
+    def __init__(self, max_retries: int = 4, base_delay: float = 0.5, max_delay: float = 30.0,
+                 hedge: bool = False, hedge_quantile: float = 0.95, min_hedge_delay: float = 1.0,
+                 breaker: Optional[CircuitBreaker] = None) -> None:
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.hedge = hedge
+        self.hedge_quantile = hedge_quantile
+        self.min_hedge_delay = min_hedge_delay
+        self.breaker = breaker or CircuitBreaker()
+        self.latency = LatencyTracker()
+        self.retries = 0
+        self.hedges = 0
+        self._hedge_pool: Optional[ThreadPoolExecutor] = None
+        self._lock = threading.Lock()
+
+    def _record_final(self, error: BaseException) -> None:
+        # The API answered with a client error (400, 401...): it is up, whatever was wrong with the request
+        if isinstance(error, APIStatusError):
+            self.breaker.record_success()
+
+    def backoff(self, attempt: int, error: BaseException) -> float:
+        delay = random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+        server_delay = retry_after(error)
+        if server_delay is not None:
+            delay = max(delay, min(server_delay, self.max_delay))
+        return delay
+
+    def hedge_delay(self) -> Optional[float]:
+        if not self.hedge:
+            return None
+        observed = self.latency.quantile(self.hedge_quantile)
+        return max(self.min_hedge_delay, observed) if observed is not None else None
+
+    def _pool(self) -> ThreadPoolExecutor:
+        with self._lock:
+            if self._hedge_pool is None:
+                self._hedge_pool = ThreadPoolExecutor(max_workers=HEDGE_WORKERS, thread_name_prefix="claude-hedge")
+            return self._hedge_pool
+
+    def _attempt(self, fn: Callable[[], T], hedge: bool) -> T:
+        delay = self.hedge_delay() if hedge else None
+        start = time.perf_counter()
+        if delay is None:
+            result = fn()
+        else:
+            pool = self._pool()
+            futures = [pool.submit(fn)]
+            done, pending = wait(futures, timeout=delay)
+            if not done:
+                self.hedges += 1
+                tracing.add("hedges")
+                futures.append(pool.submit(fn))
+                pending = set(futures)
+            winner = next((f for f in done if f.exception() is None), None)
+            while winner is None and pending:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                winner = next((f for f in done if f.exception() is None), None)
+            # A loser that has not started is dropped; one that has runs to the end
+            for future in pending:
+                future.cancel()
+            # Both failed: the first attempt's error is the one retried
+            result = (winner or futures[0]).result()
+        self.latency.record(time.perf_counter() - start)
+        return result
+
+    def call(self, fn: Callable[[], T], hedge: bool = True) -> T:
+        for attempt in range(self.max_retries + 1):
+            trial = self.breaker.before_call()
+            try:
+                result = self._attempt(fn, hedge)
+            except Exception as e:
+                if not is_retryable(e):
+                    self._record_final(e)
+                    raise
+                self.breaker.record_failure()
+                if attempt == self.max_retries:
+                    raise
+                self.retries += 1
+                tracing.add("retries")
+                time.sleep(self.backoff(attempt, e))
+                continue
+            else:
+                self.breaker.record_success()
+                return result
+            finally:
+                self.breaker.release(trial)
+        raise RuntimeError("unreachable")
+
+    async def _aattempt(self, fn: Callable[[], Awaitable[T]], hedge: bool) -> T:
+        delay = self.hedge_delay() if hedge else None
+        start = time.perf_counter()
+        if delay is None:
+            result = await fn()
+        else:
+            tasks = [asyncio.ensure_future(fn())]
+            done, pending = await asyncio.wait(tasks, timeout=delay)
+            if not done:
+                self.hedges += 1
+                tracing.add("hedges")
+                tasks.append(asyncio.ensure_future(fn()))
+                pending = set(tasks)
+            winner = next((t for t in done if t.exception() is None), None)
+            while winner is None and pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                winner = next((t for t in done if t.exception() is None), None)
+            for task in pending:
+                task.cancel()
+            result = (winner or tasks[0]).result()
+        self.latency.record(time.perf_counter() - start)
+        return result
+
+    async def acall(self, fn: Callable[[], Awaitable[T]], hedge: bool = True) -> T:
+        for attempt in range(self.max_retries + 1):
+            trial = self.breaker.before_call()
+            try:
+                result = await self._aattempt(fn, hedge)
+            except Exception as e:
+                if not is_retryable(e):
+                    self._record_final(e)
+                    raise
+                self.breaker.record_failure()
+                if attempt == self.max_retries:
+                    raise
+                self.retries += 1
+                tracing.add("retries")
+                await asyncio.sleep(self.backoff(attempt, e))
+                continue
+            else:
+                self.breaker.record_success()
+                return result
+            finally:
+                self.breaker.release(trial)
+        raise RuntimeError("unreachable")
+
+    def stream(self, open_stream: Callable[[], Any],
+               on_usage: Optional[Callable[[Any], None]] = None) -> Iterator[str]:
+        """
+        Yield text deltas from ``open_stream()`` (a ``messages.stream`` manager).
+
+        Failures are retried only until the first delta arrives; after that
+        the partial answer has been shown, so the error is raised. The final
+        message's token usage is passed to ``on_usage``.
+        """
+        for attempt in range(self.max_retries + 1):
+            trial = self.breaker.before_call()
+            started = False
+            try:
+                with open_stream() as stream:
+                    for text in stream.text_stream:
+                        started = True
+                        yield text
+                    usage = stream.get_final_message().usage
+                    tracing.record_usage(usage)
+                    if on_usage is not None:
+                        on_usage(usage)
+            except Exception as e:
+                if not is_retryable(e):
+                    self._record_final(e)
+                    raise
+                self.breaker.record_failure()
+                if started or attempt == self.max_retries:
+                    raise
+                self.retries += 1
+                tracing.add("retries")
+                time.sleep(self.backoff(attempt, e))
+                continue
+            else:
+                self.breaker.record_success()
+                return
+            finally:
+                # Also ends the trial of a stream its consumer closed early
+                self.breaker.release(trial)
+
+    async def astream(self, open_stream: Callable[[], Any],
+                      on_usage: Optional[Callable[[Any], None]] = None) -> AsyncIterator[str]:
+        """Async version of stream."""
+        for attempt in range(self.max_retries + 1):
+            trial = self.breaker.before_call()
+            started = False
+            try:
+                async with open_stream() as stream:
+                    async for text in stream.text_stream:
+                        started = True
+                        yield text
+                    usage = (await stream.get_final_message()).usage
+                    tracing.record_usage(usage)
+                    if on_usage is not None:
+                        on_usage(usage)
+            except Exception as e:
+                if not is_retryable(e):
+                    self._record_final(e)
+                    raise
+                self.breaker.record_failure()
+                if started or attempt == self.max_retries:
+                    raise
+                self.retries += 1
+                tracing.add("retries")
+                await asyncio.sleep(self.backoff(attempt, e))
+                continue
+            else:
+                self.breaker.record_success()
+                return
+            finally:
+                # Also ends the trial of a stream its consumer closed early
+                self.breaker.release(trial)
+
+    def stats(self) -> Dict[str, Any]:
+        return {"retries": self.retries, "hedges": self.hedges, "circuit": self.breaker.state,
+                "p95_latency": self.latency.quantile(0.95)}
@@ -0,0 +1,235 @@
+import hashlib
+import json
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import asdict, dataclass
+from typing import Any, Callable, Dict, List, Optional, Tuple, Union
+
+import numpy as np
+
+Prompt = Union[str, List[Dict[str, Any]]]
+
+
+@dataclass
+class CacheStats:
+    exact_hits: int = 0
+    semantic_hits: int = 0
+    persistent_hits: int = 0
+    misses: int = 0
+    evictions: int = 0
+    latency_saved: float = 0.0
+
+    @property
+    def hits(self) -> int:
+        return self.exact_hits + self.semantic_hits + self.persistent_hits
+
+    @property
+    def hit_rate(self) -> float:
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+    def to_dict(self) -> Dict[str, float]:
+        return {**asdict(self), "hits": self.hits, "hit_rate": self.hit_rate}
+
+
+@dataclass
+class _Entry:
+    response: str
+    expires: float
+    latency: float
+    size: int
+
+
+@dataclass
+class _SemanticEntry:
+    key: str
+    scope: str
+    embedding: np.ndarray
+    response: str
+    expires: float
+    latency: float
+
+
+def normalize(text: str) -> str:
+    return re.sub(r"\s+", " ", text).strip().lower()
+
+
+class ResponseCache:
+    """
+    Two-tier cache of Claude responses.
+
+    The exact tier is an LRU keyed on (model, normalized prompt, request kwargs).
+    The optional semantic tier, enabled by passing ``embed_fn``, reuses the
+    response of an earlier prompt whose embedding has cosine similarity of at
+    least ``similarity_threshold`` with the new one, within the same model,
+    kwargs and (for chats) earlier turns. Both tiers expire entries after
+    ``ttl`` seconds and share the ``max_bytes`` memory budget. With ``db_path``
+    entries are also written to SQLite and survive restarts.
+    """
+
+    def __init__(self, ttl: float = 24 * 3600, max_bytes: int = 64 * 1024 * 1024,
+                 embed_fn: Optional[Callable[[str], List[float]]] = None, similarity_threshold: float = 0.95,
+                 db_path: Optional[str] = None) -> None:
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.embed_fn = embed_fn
+        self.similarity_threshold = similarity_threshold
+        self.stats = CacheStats()
+        self._lock = threading.RLock()
+        self._entries: "OrderedDict[str, _Entry]" = OrderedDict()
+        self._semantic: List[_SemanticEntry] = []
+        self._bytes = 0
+        self._semantic_bytes = 0
+        self._db: Optional[sqlite3.Connection] = None
+        if db_path:
+            self._db = sqlite3.connect(db_path, check_same_thread=False)
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS responses (key TEXT PRIMARY KEY, scope TEXT, embedding BLOB, "
+                "response TEXT NOT NULL, expires REAL NOT NULL, latency REAL NOT NULL)"
+            )
+            self._db.execute("DELETE FROM responses WHERE expires < ?", (time.time(),))
+            self._db.commit()
+            self._load_semantic()
+
+    @staticmethod
+    def _split(prompt: Prompt) -> Tuple[str, str]:
+        """
+        (earlier turns, last message) of a chat, or ("", prompt) for a completion.
+
+        A single-message chat is keyed like the equivalent completion. When the
+        last message is a list of content blocks, only its last text block (the
+        question) is the message; the blocks before it, such as retrieved
+        context, count as earlier turns, so questions over the same context are
+        told apart and the same question over other context is not a hit.
+        """
+        if isinstance(prompt, str):
+            return "", prompt
+        if not prompt:
+            return "", ""
+        earlier, content = list(prompt[:-1]), prompt[-1].get("content", "")
+        if isinstance(content, list) and content and content[-1].get("type") == "text":
+            if len(content) > 1:
+                earlier.append({"role": prompt[-1].get("role"), "content": content[:-1]})
+            content = content[-1]["text"]
+        history = [{"role": m.get("role"), "content": normalize(str(m.get("content")))} for m in earlier]
+        return (json.dumps(history) if history else ""), str(content)
+
+    def _keys(self, model: str, prompt: Prompt, kwargs: Dict[str, Any]) -> Tuple[str, str, str]:
+        history, text = self._split(prompt)
+        scope = hashlib.sha256(json.dumps([model, history, kwargs], sort_keys=True, default=str).encode()).hexdigest()
+        key = hashlib.sha256(f"{scope}:{normalize(text)}".encode()).hexdigest()
+        return key, scope, text
+
+    def _add(self, key: str, entry: _Entry) -> None:
+        old = self._entries.pop(key, None)
+        if old:
+            self._bytes -= old.size
+        self._entries[key] = entry
+        self._bytes += entry.size
+        self._evict()
+
+    @staticmethod
+    def _semantic_size(entry: _SemanticEntry) -> int:
+        return entry.embedding.nbytes + len(entry.response)
+
+    def _add_semantic(self, entry: _SemanticEntry) -> None:
+        # A prompt put again replaces its entry rather than adding a duplicate
+        for i, old in enumerate(self._semantic):
+            if old.key == entry.key:
+                self._semantic_bytes -= self._semantic_size(self._semantic.pop(i))
+                break
+        self._semantic.append(entry)
+        self._semantic_bytes += self._semantic_size(entry)
+
+    def _evict(self) -> None:
+        now = time.time()
+        if any(e.expires <= now for e in self._semantic):
+            self._semantic = [e for e in self._semantic if e.expires > now]
+            self._semantic_bytes = sum(self._semantic_size(e) for e in self._semantic)
+        while self._bytes + self._semantic_bytes > self.max_bytes and (self._entries or self._semantic):
+            if self._entries:
+                _, entry = self._entries.popitem(last=False)
+                self._bytes -= entry.size
+            else:
+                self._semantic_bytes -= self._semantic_size(self._semantic.pop(0))
+            self.stats.evictions += 1
+
+    def _load_semantic(self) -> None:
+        rows = self._db.execute(
+            "SELECT key, scope, embedding, response, expires, latency FROM responses WHERE embedding IS NOT NULL ORDER BY expires"
+        ).fetchall()
+        for key, scope, embedding, response, expires, latency in rows:
+            self._add_semantic(_SemanticEntry(key, scope, np.frombuffer(embedding, dtype=np.float32), response, expires, latency))
+        self._evict()
+
+    def _embed(self, text: str) -> np.ndarray:
+        embedding = np.asarray(self.embed_fn(text), dtype=np.float32)
+        return embedding / (np.linalg.norm(embedding) or 1.0)
+
+    def get(self, model: str, prompt: Prompt, kwargs: Optional[Dict[str, Any]] = None) -> Optional[str]:
+        key, scope, text = self._keys(model, prompt, kwargs or {})
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry and entry.expires > now:
+                self._entries.move_to_end(key)
+                self.stats.exact_hits += 1
+                self.stats.latency_saved += entry.latency
+                return entry.response
+            if entry:
+                self._bytes -= self._entries.pop(key).size
+
+            if self._db is not None:
+                row = self._db.execute("SELECT response, expires, latency FROM responses WHERE key = ? AND expires > ?",
+                                       (key, now)).fetchone()
+                if row:
+                    response, expires, latency = row
+                    self._add(key, _Entry(response, expires, latency, len(response) + len(key)))
+                    self.stats.persistent_hits += 1
+                    self.stats.latency_saved += latency
+                    return response
+
+        if self.embed_fn is not None:
+            embedding = self._embed(text)
+            with self._lock:
+                candidates = [e for e in self._semantic if e.scope == scope and e.expires > now]
+                if candidates:
+                    similarities = np.stack([e.embedding for e in candidates]) @ embedding
+                    best = int(np.argmax(similarities))
+                    if similarities[best] >= self.similarity_threshold:
+                        self.stats.semantic_hits += 1
+                        self.stats.latency_saved += candidates[best].latency
+                        return candidates[best].response
+
+        with self._lock:
+            self.stats.misses += 1
+        return None
+
+    def put(self, model: str, prompt: Prompt, kwargs: Optional[Dict[str, Any]], response: str, latency: float = 0.0) -> None:
+        key, scope, text = self._keys(model, prompt, kwargs or {})
+        expires = time.time() + self.ttl
+        embedding = self._embed(text) if self.embed_fn is not None else None
+        with self._lock:
+            self._add(key, _Entry(response, expires, latency, len(response) + len(key)))
+            if embedding is not None:
+                self._add_semantic(_SemanticEntry(key, scope, embedding, response, expires, latency))
+                self._evict()
+            if self._db is not None:
+                self._db.execute(
+                    "INSERT OR REPLACE INTO responses (key, scope, embedding, response, expires, latency) VALUES (?, ?, ?, ?, ?, ?)",
+                    (key, scope, embedding.tobytes() if embedding is not None else None, response, expires, latency),
+                )
+                self._db.commit()
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._semantic.clear()
+            self._bytes = 0
+            self._semantic_bytes = 0
+            if self._db is not None:
+                self._db.execute("DELETE FROM responses")
+                self._db.commit()
@@ -0,0 +1,184 @@
+"""
+Headless HTTP API over RAGService, for programmatic clients such as an EHR integration.
+
+Endpoints:
+  POST   /documents?source=name.pdf   PDF bytes as the body; 202 with the job status (``key`` is the document id)
+  GET    /documents                   every document with its ingestion status
+  GET    /documents/{id}              one document's ingestion status
+  DELETE /documents/{id}              drop a document from memory (its stored index is kept)
+  POST   /query                       {"question", "document_ids"?, "history"?, "analyze"?} -> answer, sources, analysis, trace_id
+  POST   /query/stream                same body; server-sent events: "sources", then "delta"s, then "done"
+                                      (or "error" with a status and message if Claude fails mid-answer)
+  GET    /health                      queue, latency, model, reranker, cache, API and token stats
+
+Queries over documents still being ingested search what is indexed so far.
+When too many queries are in flight, or Claude is unavailable (rate limited,
+overloaded, or its circuit breaker open), the server answers 503 with
+Retry-After instead of queueing them; other Claude API errors are 502. The
+Anthropic API key comes from ANTHROPIC_API_KEY.
+The embedder and reranker load in the background at start-up; requests
+that arrive first wait for them.
+
+Usage: python rag/server.py --host 0.0.0.0 --port 8080
+"""
+import argparse
+import asyncio
+import json
+from typing import Any, Dict, Tuple
+
+from aiohttp import web
+from anthropic import APIError
+
+from resilience import CircuitOpenError, ServiceBusyError, is_retryable
+from service import RAGService, UnknownDocumentError
+
+SERVICE = web.AppKey("service", RAGService)
+# Uploads are whole PDFs
+MAX_UPLOAD_BYTES = 200 * 1024 * 1024
+# Seconds clients should wait while Claude is unavailable
+CLAUDE_RETRY_AFTER = "5"
+
+
+def _claude_error(error: Exception) -> Tuple[int, str]:
+    """Status code and message for the client of a CircuitOpenError or APIError."""
+    if isinstance(error, CircuitOpenError):
+        return 503, str(error)
+    # Retries are already spent; the message may quote the prompt, so it is not passed on
+    if is_retryable(error):
+        return 503, "Claude is unavailable"
+    return 502, "Claude API error"
+
+
+@web.middleware
+async def errors(request: web.Request, handler: Any) -> web.StreamResponse:
+    try:
+        return await handler(request)
+    except ServiceBusyError as e:
+        return web.json_response({"error": str(e)}, status=503, headers={"Retry-After": "1"})
+    except (CircuitOpenError, APIError) as e:
+        status, message = _claude_error(e)
+        headers = {"Retry-After": CLAUDE_RETRY_AFTER} if status == 503 else None
+        return web.json_response({"error": message}, status=status, headers=headers)
+    except UnknownDocumentError as e:
+        return web.json_response({"error": e.args[0] if e.args else "Not found"}, status=404)
+
+
+async def _query_body(request: web.Request) -> Dict[str, Any]:
+    try:
+        body = await request.json()
+    except json.JSONDecodeError:
+        raise web.HTTPBadRequest(text="Expected a JSON body")
+    if not isinstance(body, dict) or not str(body.get("question", "")).strip():
+        raise web.HTTPBadRequest(text="Missing question")
+    return body
+
+
+async def ingest(request: web.Request) -> web.Response:
+    pdf_bytes = await request.read()
+    if not pdf_bytes:
+        raise web.HTTPBadRequest(text="Expected the PDF as the request body")
+    retry = request.query.get("retry") == "1"
+    # Hashing a large PDF for its document id is worth keeping off the loop
+    job = await asyncio.to_thread(request.app[SERVICE].ingest, pdf_bytes, request.query.get("source", "upload.pdf"),
+                                  retry=retry)
+    return web.json_response(job.snapshot(), status=202)
+
+
+# Listing and status follow newly published batches into the corpus, and removal
+# waits for the corpus lock; both stay off the event loop
+async def documents(request: web.Request) -> web.Response:
+    return web.json_response(await asyncio.to_thread(request.app[SERVICE].documents))
+
+
+async def document(request: web.Request) -> web.Response:
+    status = await asyncio.to_thread(request.app[SERVICE].status, request.match_info["id"])
+    if status is None:
+        raise UnknownDocumentError("Unknown document")
+    return web.json_response(status)
+
+
+async def remove(request: web.Request) -> web.Response:
+    if not await asyncio.to_thread(request.app[SERVICE].remove, request.match_info["id"]):
+        raise UnknownDocumentError("Unknown document")
+    return web.Response(status=204)
+
+
+async def query(request: web.Request) -> web.Response:
+    body = await _query_body(request)
+    result = await request.app[SERVICE].aquery(body["question"], history=body.get("history"),
+                                               document_ids=body.get("document_ids"),
+                                               analyze=body.get("analyze", True))
+    return web.json_response(result)
+
+
+async def stream(request: web.Request) -> web.StreamResponse:
+    body = await _query_body(request)
+    service = request.app[SERVICE]
+    response = web.StreamResponse(headers={"Content-Type": "text/event-stream", "Cache-Control": "no-cache"})
+    sources = []
+    deltas = service.astream_chat(body["question"], history=body.get("history"),
+                                  document_ids=body.get("document_ids"), on_sources=sources.extend)
+    # Pull the first delta before answering, so refusals and unknown documents still get a status code
+    try:
+        first = await deltas.__anext__()
+    except StopAsyncIteration:
+        first = None
+
+    async def send(event: str, data: Any) -> None:
+        await response.write(f"event: {event}\ndata: {json.dumps(data)}\n\n".encode())
+
+    try:
+        await response.prepare(request)
+        await send("sources", sources)
+        if first is not None:
+            await send("delta", first)
+            try:
+                async for delta in deltas:
+                    await send("delta", delta)
+            except (CircuitOpenError, APIError) as e:
+                # Too late for a status code: end the stream with an error event instead of "done"
+                status, message = _claude_error(e)
+                await send("error", {"status": status, "error": message})
+                await response.write_eof()
+                return response
+        await send("done", {})
+        await response.write_eof()
+    finally:
+        # Frees the query's admission slot even when the client disconnects mid-answer
+        await deltas.aclose()
+    return response
+
+
+async def health(request: web.Request) -> web.Response:
+    return web.json_response(request.app[SERVICE].stats())
+
+
+def make_app(service: RAGService) -> web.Application:
+    app = web.Application(middlewares=[errors], client_max_size=MAX_UPLOAD_BYTES)
+    app[SERVICE] = service
+    app.add_routes([
+        web.post("/documents", ingest),
+        web.get("/documents", documents),
+        web.get("/documents/{id}", document),
+        web.delete("/documents/{id}", remove),
+        web.post("/query", query),
+        web.post("/query/stream", stream),
+        web.get("/health", health),
+    ])
+
+    async def shutdown(app: web.Application) -> None:
+        app[SERVICE].shutdown()
+    app.on_cleanup.append(shutdown)
+    return app
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    args = parser.parse_args()
+    web.run_app(make_app(RAGService.from_env()), host=args.host, port=args.port)
+
+
+if __name__ == "__main__":
+    main()
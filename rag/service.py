@@ -0,0 +1,514 @@
+import asyncio
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import asdict, dataclass
+from typing import Any, AsyncIterator, Callable, Dict, Iterator, List, Optional, Tuple
+
+from llama_index.core.base.llms.types import ChatMessage, MessageRole
+from llama_index.core.chat_engine.context import DEFAULT_CONTEXT_TEMPLATE
+from llama_index.core.schema import MetadataMode, NodeWithScore, QueryBundle
+
+from chunker import chunking_config, make_chunker
+from claude_adapter import ClaudeLLM
+from claude_llm import CACHE_CONTROL, Claude, pool_limits
+from context_packer import (TokenBudgetPostprocessor, claude_summarizer, estimate_tokens, pack_history, pack_nodes,
+                            prompt_budgets)
+from corpus import CorpusIndex
+from document_processor import iter_healthcare_document
+from healthcare_utils import aenrich_healthcare_response
+from hybrid_retriever import HybridRetriever
+from image_captioner import ImageCaptioner
+from image_store import DEFAULT_ROOT as DEFAULT_IMAGE_ROOT, ImageStore
+from index_store import DEFAULT_MAX_BYTES, DEFAULT_ROOT, IndexStore, index_config
+from ingestion import IngestionJob, IngestionQueue, follow
+from models import registry
+from resilience import AdmissionLimiter, CircuitBreaker, LatencyTracker, ResiliencePolicy
+from response_cache import ResponseCache
+import tracing
+
+DEFAULT_MODEL = "claude-3-5-sonnet-20240620"
+
+# Context retrieved for this turn only, sent after the cached prefix in a block of its own before the question
+TURN_CONTEXT_TEMPLATE = (
+    "Context information for this question is below.\n"
+    "--------------------\n"
+    "{context_str}\n"
+    "--------------------\n"
+)
+
+
+class UnknownDocumentError(KeyError):
+    """Raised for document ids that were never ingested, or were removed or evicted."""
+
+
+def _env(name: str, default: Any) -> Any:
+    value = os.environ.get(f"HEALTHCARE_RAG_{name}")
+    if value is None:
+        return default
+    if isinstance(default, bool):
+        return value == "1"
+    return type(default)(value)
+
+
+def default_cache_dir() -> str:
+    return os.environ.get("HEALTHCARE_RAG_CACHE_DIR", os.path.join(os.path.expanduser("~"), ".cache", "healthcare-rag"))
+
+
+@dataclass
+class ServiceConfig:
+    """Tunables of the RAG pipeline; ``from_env`` reads each from its ``HEALTHCARE_RAG_*`` variable."""
+
+    model: str = DEFAULT_MODEL
+    max_tokens: int = 1000
+    max_connections: int = 32
+    chunking: str = "structure"
+    chunk_tokens: int = 256
+    # Retrieve generously and let the token budget, not a fixed count, decide how much context is sent
+    top_k: int = 10
+    # "hybrid" fuses BM25 with vector search so exact drug names, codes and doses are not missed
+    retrieval: str = "hybrid"
+    context_tokens: int = 6000
+    history_tokens: int = 2000
+    rerank_skip_margin: float = 0.1
+    rerank_budget: float = 0.5
+    ingest_workers: int = 2
+    ingest_batch: int = 64
+    # Retrieval and reranking are CPU-bound; this many run at once and up to
+    # max_pending_queries more wait, beyond which queries are refused
+    max_concurrent_queries: int = 4
+    max_pending_queries: int = 32
+    # Documents kept searchable in memory; the least recently used are dropped (they stay in the IndexStore)
+    max_documents: int = 64
+    # Prompt caching: up to pinned_tokens of a conversation's first-turn context
+    # open every later turn's prompt too, followed by the earlier turns, so
+    # Claude reads that prefix from its cache. Pinned context counts against
+    # context_tokens; max_conversations are remembered.
+    prompt_cache: bool = True
+    pinned_tokens: int = 3000
+    max_conversations: int = 256
+    # With prompt_cache, old turns leave the history this many messages at a time
+    history_align: int = 6
+
+    @classmethod
+    def from_env(cls) -> "ServiceConfig":
+        return cls(**{name: _env(name.upper(), default) for name, default in asdict(cls()).items()})
+
+
+def build_response_cache(embed_model: Any) -> ResponseCache:
+    cache_dir = default_cache_dir()
+    os.makedirs(cache_dir, exist_ok=True)
+    return ResponseCache(
+        ttl=float(os.environ.get("HEALTHCARE_RAG_RESPONSE_TTL", 24 * 3600)),
+        max_bytes=int(os.environ.get("HEALTHCARE_RAG_RESPONSE_CACHE_BYTES", 64 * 1024 * 1024)),
+        # Reuse the already-loaded BGE model for the semantic tier
+        embed_fn=embed_model.get_query_embedding,
+        similarity_threshold=float(os.environ.get("HEALTHCARE_RAG_SEMANTIC_THRESHOLD", 0.95)),
+        db_path=os.path.join(cache_dir, "responses.sqlite3"),
+    )
+
+
+def build_resilience_policy() -> ResiliencePolicy:
+    return ResiliencePolicy(
+        max_retries=int(os.environ.get("HEALTHCARE_RAG_MAX_RETRIES", 4)),
+        hedge=os.environ.get("HEALTHCARE_RAG_HEDGE", "0") == "1",
+        min_hedge_delay=float(os.environ.get("HEALTHCARE_RAG_MIN_HEDGE_DELAY", 1.0)),
+        breaker=CircuitBreaker(
+            failure_threshold=int(os.environ.get("HEALTHCARE_RAG_BREAKER_THRESHOLD", 5)),
+            reset_timeout=float(os.environ.get("HEALTHCARE_RAG_BREAKER_RESET", 30.0)),
+        ),
+    )
+
+
+def register_models() -> None:
+    """Register the embedder and the reranker's cross-encoder with the model registry; nothing is loaded yet."""
+    def embedder() -> Any:
+        from embedding_service import make_backend
+
+        threads = os.environ.get("HEALTHCARE_RAG_EMBED_THREADS")
+        return make_backend(os.environ.get("HEALTHCARE_RAG_EMBED_BACKEND", "torch"),
+                            threads=int(threads) if threads else None)
+
+    def reranker() -> Any:
+        from reranker import cross_encoder_scorer
+
+        return cross_encoder_scorer()
+
+    registry.register("embedder", embedder)
+    registry.register("reranker", reranker)
+
+
+def build_embed_model() -> Any:
+    """The embedding service over the registry's embedder, which loads on first use unless warmed up."""
+    from embedding_service import embedding_service
+
+    register_models()
+    return embedding_service(
+        backend=os.environ.get("HEALTHCARE_RAG_EMBED_BACKEND", "torch"),
+        batch_size=int(os.environ.get("HEALTHCARE_RAG_EMBED_BATCH", 32)),
+        cache_path=os.path.join(default_cache_dir(), "embeddings.sqlite3"),
+        model=registry.lazy("embedder"),
+    )
+
+
+def build_index_store() -> IndexStore:
+    return IndexStore(
+        root=os.environ.get("HEALTHCARE_RAG_INDEX_DIR", DEFAULT_ROOT),
+        max_bytes=int(os.environ.get("HEALTHCARE_RAG_INDEX_MAX_BYTES", DEFAULT_MAX_BYTES)),
+    )
+
+
+def build_image_store() -> ImageStore:
+    return ImageStore(root=os.environ.get("HEALTHCARE_RAG_IMAGE_DIR", DEFAULT_IMAGE_ROOT))
+
+
+def node_source(node: NodeWithScore) -> Dict[str, Any]:
+    metadata = node.node.metadata
+    return {"source": metadata.get("source"), "page": metadata.get("page"), "score": node.score}
+
+
+def node_context(nodes: List[NodeWithScore]) -> str:
+    return "\n\n".join(n.node.get_content(metadata_mode=MetadataMode.LLM).strip() for n in nodes)
+
+
+def conversation_key(question: str, history: Optional[List[Dict[str, Any]]],
+                     document_ids: Optional[List[str]]) -> str:
+    """Identifies a conversation from any of its turns: the documents it is over and its opening question."""
+    opening = next((m["content"] for m in history or [] if m.get("role") == "user"), question)
+    return hashlib.sha256(json.dumps([sorted(document_ids or []), str(opening)]).encode()).hexdigest()
+
+
+class RAGService:
+    """
+    The RAG pipeline behind one process-wide object, for the Streamlit app, the HTTP server and scripts alike.
+
+    Documents are ingested on the IngestionQueue's workers and followed into
+    one shared CorpusIndex as their batches are published, so every request
+    searches the same in-memory per-document indexes; a query over some of
+    them uses a CorpusView, which copies nothing. Retrieval and reranking run
+    on a pool of ``max_concurrent_queries`` threads, off the event loop, and an
+    AdmissionLimiter refuses queries with ServiceBusyError once that pool and
+    ``max_pending_queries`` waiting behind it are taken. Answers stream from
+    Claude's async client. Claude instances are made per API key by
+    ``claude_factory``; they share the response cache, resilience policy and
+    connection pool, and raise Claude API errors and CircuitOpenError rather
+    than answering with an empty string.
+    """
+
+    def __init__(self, config: Optional[ServiceConfig] = None, embed_model: Optional[Any] = None,
+                 index_store: Optional[IndexStore] = None, image_store: Optional[ImageStore] = None,
+                 rerank: Optional[Any] = None, api_key: Optional[str] = None, base_url: Optional[str] = None,
+                 response_cache: Optional[ResponseCache] = None, policy: Optional[ResiliencePolicy] = None,
+                 claude_factory: Optional[Callable[[Optional[str]], Claude]] = None) -> None:
+        self.config = config or ServiceConfig()
+        self.embed_model = embed_model if embed_model is not None else build_embed_model()
+        self.index_store = index_store
+        self.image_store = image_store or ImageStore()
+        self.rerank = rerank
+        self.api_key = api_key
+        self.base_url = base_url
+        self.response_cache = response_cache
+        self.policy = policy
+        self._claude_factory = claude_factory or self._make_claude
+        self.queue = IngestionQueue(index_store, workers=self.config.ingest_workers,
+                                    batch_size=self.config.ingest_batch, embed_model=self.embed_model)
+        self.corpus = CorpusIndex(embed_model=self.embed_model)
+        self.limiter = AdmissionLimiter(self.config.max_concurrent_queries + self.config.max_pending_queries)
+        self.latency = LatencyTracker()
+        self._executor = ThreadPoolExecutor(max_workers=self.config.max_concurrent_queries, thread_name_prefix="query")
+        # Jobs whose batches are still to be followed into the corpus, and their job ids
+        self._pending: Dict[str, IngestionJob] = {}
+        self._followed: Dict[str, str] = {}
+        self._used: "OrderedDict[str, None]" = OrderedDict()
+        # Pinned context per conversation_key, least recently used first
+        self._pinned: "OrderedDict[str, List[NodeWithScore]]" = OrderedDict()
+        self._lock = threading.Lock()
+        claude = self.claude()
+        self.context_budget, self.history_budget = prompt_budgets(
+            claude.get_context_window(), claude.get_max_tokens(),
+            context_tokens=self.config.context_tokens, history_tokens=self.config.history_tokens,
+        )
+
+    @classmethod
+    def from_env(cls, api_key: Optional[str] = None, warm_up: bool = True) -> "RAGService":
+        """
+        The service configured from the environment, over the process's model registry.
+
+        With ``warm_up`` the models start loading in the background and the
+        service is returned at once; the first query waits for what is not
+        loaded yet.
+        """
+        from reranker import AdaptiveRerank
+
+        tracing.configure_from_env()
+        config = ServiceConfig.from_env()
+        embed_model = build_embed_model()
+        rerank = AdaptiveRerank(registry.lazy("reranker"), top_n=config.top_k, skip_margin=config.rerank_skip_margin,
+                                latency_budget=config.rerank_budget)
+        service = cls(config, embed_model, index_store=build_index_store(), image_store=build_image_store(),
+                      rerank=rerank, api_key=api_key or os.environ.get("ANTHROPIC_API_KEY") or None,
+                      response_cache=build_response_cache(embed_model), policy=build_resilience_policy())
+        if warm_up:
+            registry.warm_up()
+        return service
+
+    def _make_claude(self, api_key: Optional[str]) -> Claude:
+        return Claude(model=self.config.model, api_key=api_key, base_url=self.base_url,
+                      response_cache=self.response_cache, policy=self.policy,
+                      limits=pool_limits(max_connections=self.config.max_connections),
+                      max_tokens=self.config.max_tokens, raise_errors=True)
+
+    def claude(self, api_key: Optional[str] = None) -> Claude:
+        return self._claude_factory(api_key or self.api_key)
+
+    def shutdown(self) -> None:
+        self.queue.shutdown(wait=False)
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+    # Documents
+
+    def ingest(self, pdf_bytes: bytes, source: str, api_key: Optional[str] = None,
+               retry: bool = False) -> IngestionJob:
+        """
+        Start ingesting ``pdf_bytes`` unless it is already ingested or underway; returns its job.
+
+        The job's ``key`` is the document id used by queries. Figures are
+        captioned with Claude vision when an API key is available.
+        """
+        chunker = make_chunker(self.config.chunking, self.config.chunk_tokens)
+        caption_images = bool(api_key or self.api_key)
+        images = self.image_store
+
+        def documents(progress):
+            return iter_healthcare_document(pdf_bytes, source, include_vision=True, image_store=images,
+                                            progress=progress, chunker=chunker)
+
+        def caption(image_documents, progress):
+            ImageCaptioner(self.claude(api_key), images).caption_documents(image_documents, progress=progress)
+
+        job = self.queue.submit(
+            pdf_bytes, source, documents,
+            index_config(f"local:{self.embed_model.model_name}", include_vision=True,
+                         caption_images=caption_images, **chunking_config(chunker)),
+            caption=caption if caption_images else None, retry=retry,
+        )
+        with self._lock:
+            if self._followed.get(job.key) != job.id or job.key not in self.corpus:
+                self._pending[job.key] = job
+        self.refresh([job.key])
+        return job
+
+    def refresh(self, document_ids: Optional[List[str]] = None) -> None:
+        """Follow the batches published since the last call into the corpus, for ``document_ids`` or all."""
+        with self._lock:
+            for key in list(self._pending) if document_ids is None else document_ids:
+                job = self._pending.get(key)
+                if job is not None:
+                    # Read before following, so batches published meanwhile are not missed
+                    done = job.done
+                    follow(self.corpus, key, job, self._followed)
+                    if done:
+                        del self._pending[key]
+                        if job.status == "failed":
+                            self._unpin(key)
+                            self.corpus.remove(key)
+                if key in self.corpus:
+                    self._used[key] = None
+                    self._used.move_to_end(key)
+            self._evict(keep=document_ids or [])
+
+    def _evict(self, keep: List[str]) -> None:
+        for key in list(self._used):
+            if len(self._used) <= self.config.max_documents:
+                break
+            if key not in keep and key not in self._pending:
+                del self._used[key]
+                self._followed.pop(key, None)
+                self._unpin(key)
+                self.corpus.remove(key)
+
+    def status(self, document_id: str) -> Optional[Dict[str, Any]]:
+        """Progress of the document, or None when it is unknown (never ingested, removed or evicted)."""
+        self.refresh([document_id])
+        # Read under the lock ingest and refresh change them with, as they run on other threads
+        with self._lock:
+            job = self._pending.get(document_id) or self.queue.get(document_id)
+            document = self.corpus.documents.get(document_id)
+        if job is not None:
+            return job.snapshot()
+        if document is not None:
+            return {"key": document_id, "source": document["source"], "status": "done", "progress": 1.0}
+        return None
+
+    def documents(self) -> List[Dict[str, Any]]:
+        self.refresh()
+        with self._lock:
+            keys = list(dict.fromkeys([*self.corpus.documents, *self._pending]))
+        return [status for status in map(self.status, keys) if status is not None]
+
+    def remove(self, document_id: str) -> bool:
+        with self._lock:
+            self._unpin(document_id)
+            self._pending.pop(document_id, None)
+            self._followed.pop(document_id, None)
+            self._used.pop(document_id, None)
+            return self.corpus.remove(document_id)
+
+    # Queries
+
+    def _check_documents(self, document_ids: Optional[List[str]]) -> None:
+        unknown = [key for key in document_ids or [] if key not in self.corpus and key not in self._pending]
+        if unknown:
+            raise UnknownDocumentError(f"Unknown document(s): {', '.join(unknown)}")
+
+    def retrieve(self, question: str, document_ids: Optional[List[str]] = None) -> List[NodeWithScore]:
+        """The reranked, budget-packed context nodes for ``question`` over ``document_ids`` (default all)."""
+        self.refresh(document_ids)
+        self._check_documents(document_ids)
+        corpus = self.corpus if document_ids is None else self.corpus.view(document_ids)
+        retriever = HybridRetriever(corpus, similarity_top_k=self.config.top_k, mode=self.config.retrieval,
+                                    embed_model=self.embed_model)
+        nodes = retriever.retrieve(question)
+        if self.rerank is not None:
+            nodes = self.rerank.postprocess_nodes(nodes, query_bundle=QueryBundle(question))
+        with tracing.span("pack_context", candidates=len(nodes), budget=self.context_budget) as span:
+            nodes = TokenBudgetPostprocessor(self.context_budget).postprocess_nodes(nodes, query_bundle=QueryBundle(question))
+            span.set(nodes=len(nodes))
+        return nodes
+
+    def _unpin(self, document_id: str) -> None:
+        """Forget the conversations whose pinned context has passages of the document; call under the lock."""
+        document = self.corpus.documents.get(document_id)
+        node_ids = set(document["node_ids"]) if document else set()
+        for key in [key for key, nodes in self._pinned.items() if any(n.node.node_id in node_ids for n in nodes)]:
+            del self._pinned[key]
+
+    def _pin(self, key: str, nodes: List[NodeWithScore]) -> List[NodeWithScore]:
+        """The conversation's pinned context: the best of its first turn's nodes, within ``pinned_tokens``."""
+        with self._lock:
+            pinned = self._pinned.get(key)
+            if pinned is None:
+                pinned = self._pinned[key] = pack_nodes(nodes, min(self.config.pinned_tokens, self.context_budget))
+            self._pinned.move_to_end(key)
+            while len(self._pinned) > self.config.max_conversations:
+                self._pinned.popitem(last=False)
+            return pinned
+
+    @tracing.traced("prepare")
+    def prepare(self, question: str, history: Optional[List[Dict[str, Any]]] = None,
+                document_ids: Optional[List[str]] = None,
+                api_key: Optional[str] = None) -> Tuple[List[ChatMessage], List[NodeWithScore]]:
+        """
+        The chat messages for answering ``question``, and the context nodes in them.
+
+        Stable parts come first and volatile ones last, so the prompt cache
+        can reuse the prefix from turn to turn. The system message holds the
+        conversation's pinned context. The history follows, trimmed to its
+        budget with older turns summarized. The last message is the rest of
+        this turn's retrieved context, then the question in a content block of
+        its own, which the response cache compares alone. Cache breakpoints
+        close the system message and the history. Without ``prompt_cache``
+        all the context goes in the system message, as ContextChatEngine does.
+        """
+        nodes = self.retrieve(question, document_ids)
+        pinned, fresh = nodes, []
+        if self.config.prompt_cache:
+            pinned = self._pin(conversation_key(question, history, document_ids), nodes)
+            pinned_ids = {n.node.node_id for n in pinned}
+            used = sum(estimate_tokens(n.node.get_content(metadata_mode=MetadataMode.LLM)) for n in pinned)
+            fresh = pack_nodes([n for n in nodes if n.node.node_id not in pinned_ids], self.context_budget - used)
+            tracing.set_attributes(pinned=len(pinned), fresh=len(fresh))
+        cache_control = {"cache_control": CACHE_CONTROL} if self.config.prompt_cache else {}
+        messages = [ChatMessage(role=MessageRole.SYSTEM, content="\n" + DEFAULT_CONTEXT_TEMPLATE.format(context_str=node_context(pinned)),
+                                additional_kwargs=dict(cache_control))]
+        if history:
+            with tracing.span("pack_history", turns=len(history)):
+                packed = pack_history(history, self.history_budget, summarize=claude_summarizer(self.claude(api_key)),
+                                      align=self.config.history_align if self.config.prompt_cache else 1)
+            if packed:
+                packed[-1].additional_kwargs.update(cache_control)
+            messages += packed
+        content: Any = question
+        if fresh:
+            content = [{"type": "text", "text": TURN_CONTEXT_TEMPLATE.format(context_str=node_context(fresh))},
+                       {"type": "text", "text": question}]
+        messages.append(ChatMessage(role=MessageRole.USER, content=content))
+        return messages, pinned + fresh
+
+    def stream_chat(self, question: str, history: Optional[List[Dict[str, Any]]] = None,
+                    document_ids: Optional[List[str]] = None, api_key: Optional[str] = None,
+                    on_sources: Optional[Callable[[List[Dict[str, Any]]], None]] = None) -> Iterator[str]:
+        """Blocking version of astream_chat, for callers without an event loop (the Streamlit script)."""
+        with self.limiter.admit(), tracing.span("answer", documents=len(document_ids or [])):
+            start = time.perf_counter()
+            # On the query pool like astream_chat, so at most max_concurrent_queries retrieve at once
+            messages, nodes = self._executor.submit(tracing.propagate(self.prepare), question, history,
+                                                    document_ids, api_key).result()
+            if on_sources is not None:
+                on_sources([node_source(n) for n in nodes])
+            for response in ClaudeLLM(self.claude(api_key)).stream_chat(messages):
+                yield response.delta
+            self.latency.record(time.perf_counter() - start)
+
+    async def astream_chat(self, question: str, history: Optional[List[Dict[str, Any]]] = None,
+                           document_ids: Optional[List[str]] = None, api_key: Optional[str] = None,
+                           on_sources: Optional[Callable[[List[Dict[str, Any]]], None]] = None) -> AsyncIterator[str]:
+        """
+        Stream the answer to ``question`` in text deltas.
+
+        ``on_sources`` is called with the context nodes' source, page and
+        score before the first delta. Raises ServiceBusyError when too many
+        queries are in flight and UnknownDocumentError for unknown document ids. The
+        answer is traced as an "answer" span, under the caller's current span.
+        """
+        with self.limiter.admit(), tracing.span("answer", documents=len(document_ids or [])):
+            start = time.perf_counter()
+            messages, nodes = await asyncio.get_running_loop().run_in_executor(
+                self._executor, tracing.propagate(self.prepare), question, history, document_ids, api_key)
+            if on_sources is not None:
+                on_sources([node_source(n) for n in nodes])
+            async for response in await ClaudeLLM(self.claude(api_key)).astream_chat(messages):
+                yield response.delta
+            self.latency.record(time.perf_counter() - start)
+
+    async def aanalyze(self, question: str, answer: str, api_key: Optional[str] = None) -> Dict[str, Any]:
+        """Category of ``question``, and key points and follow-up questions of its ``answer``, in one round-trip."""
+        return await aenrich_healthcare_response(question, answer, self.claude(api_key))
+
+    async def aquery(self, question: str, history: Optional[List[Dict[str, Any]]] = None,
+                     document_ids: Optional[List[str]] = None, api_key: Optional[str] = None,
+                     analyze: bool = True) -> Dict[str, Any]:
+        """
+        The whole answer to ``question`` with its sources and, if ``analyze``, its
+        analysis, and the ``trace_id`` of its spans.
+        """
+        with tracing.span("query", analyze=analyze) as span:
+            sources: List[Dict[str, Any]] = []
+            chunks = [delta async for delta in self.astream_chat(question, history, document_ids, api_key,
+                                                                 on_sources=sources.extend)]
+            result: Dict[str, Any] = {"answer": "".join(chunks), "sources": sources, "trace_id": span.trace_id}
+            if analyze:
+                analysis = await self.aanalyze(question, result["answer"], api_key)
+                result.update({key: analysis[key] for key in ("category", "key_points", "follow_up_questions")})
+        return result
+
+    def stats(self) -> Dict[str, Any]:
+        stats: Dict[str, Any] = {
+            "documents": len(self.corpus), "ingesting": len(self._pending),
+            **self.limiter.stats(),
+            "models": registry.stats(),
+            "p50_latency": self.latency.quantile(0.5, min_samples=1),
+            "p95_latency": self.latency.quantile(0.95, min_samples=1),
+        }
+        if self.rerank is not None:
+            stats["rerank"] = self.rerank.stats()
+        if self.response_cache is not None:
+            stats["response_cache"] = self.response_cache.stats.to_dict()
+        if self.policy is not None:
+            stats["api"] = self.policy.stats()
+        stats["tokens"] = self.claude().usage.to_dict()
+        return stats
@@ -0,0 +1,284 @@
+"""
+Structured tracing of the RAG pipeline: nested, timed spans with token, cache and retry counts.
+
+A span opened inside another becomes its child, across threads only when the
+work is submitted through ``propagate`` (asyncio tasks inherit it on their
+own). Finished spans are kept in memory per trace for the app's latency
+waterfall and handed to the tracer's exporters: JSONL, or OTLP/JSON lines as
+read by the OpenTelemetry Collector's ``otlpjsonfile`` receiver.
+
+Span attributes hold counts, sizes and settings only. Never put prompt,
+answer or document text in them; traces are written to disk unencrypted.
+
+Usage: HEALTHCARE_RAG_TRACE_FILE=traces.jsonl HEALTHCARE_RAG_TRACE_FORMAT=otlp python rag/server.py
+"""
+import functools
+import inspect
+import json
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from contextlib import contextmanager
+from contextvars import ContextVar, copy_context
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, Iterator, List, Optional, TypeVar
+
+T = TypeVar("T")
+
+TRACE_FORMATS = ("jsonl", "otlp")
+
+_current: ContextVar[Optional["Span"]] = ContextVar("healthcare_rag_span", default=None)
+
+
+@dataclass
+class Span:
+    name: str
+    trace_id: str
+    span_id: str
+    parent_id: Optional[str] = None
+    start: float = field(default_factory=time.time)
+    end: Optional[float] = None
+    attributes: Dict[str, Any] = field(default_factory=dict)
+    # Exception type name when the span's block raised
+    error: Optional[str] = None
+
+    @property
+    def duration(self) -> float:
+        return (self.end if self.end is not None else time.time()) - self.start
+
+    def set(self, **attributes: Any) -> None:
+        self.attributes.update(attributes)
+
+    def add(self, key: str, amount: float = 1) -> None:
+        self.attributes[key] = self.attributes.get(key, 0) + amount
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {"name": self.name, "trace_id": self.trace_id, "span_id": self.span_id, "parent_id": self.parent_id,
+                "start": self.start, "end": self.end, "duration_ms": self.duration * 1000,
+                "attributes": self.attributes, "error": self.error}
+
+    def to_otlp(self) -> Dict[str, Any]:
+        def value(v: Any) -> Dict[str, Any]:
+            if isinstance(v, bool):
+                return {"boolValue": v}
+            if isinstance(v, int):
+                return {"intValue": str(v)}
+            if isinstance(v, float):
+                return {"doubleValue": v}
+            return {"stringValue": str(v)}
+
+        span = {
+            "traceId": self.trace_id, "spanId": self.span_id, "name": self.name, "kind": 1,
+            "startTimeUnixNano": str(int(self.start * 1e9)), "endTimeUnixNano": str(int((self.end or self.start) * 1e9)),
+            "attributes": [{"key": k, "value": value(v)} for k, v in self.attributes.items()],
+            # STATUS_CODE_OK / STATUS_CODE_ERROR
+            "status": {"code": 2, "message": self.error} if self.error else {"code": 1},
+        }
+        if self.parent_id:
+            span["parentSpanId"] = self.parent_id
+        return span
+
+
+class JsonlExporter:
+    """Appends each finished span to ``path`` as one JSON object per line."""
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self._file = open(path, "a", buffering=1)
+        self._lock = threading.Lock()
+
+    def _line(self, span: Span) -> Dict[str, Any]:
+        return span.to_dict()
+
+    def export(self, span: Span) -> None:
+        line = json.dumps(self._line(span), default=str)
+        with self._lock:
+            self._file.write(line + "\n")
+
+    def close(self) -> None:
+        with self._lock:
+            self._file.close()
+
+
+class OtlpJsonExporter(JsonlExporter):
+    """Appends each finished span as an OTLP/JSON ``ExportTraceServiceRequest`` line."""
+
+    def __init__(self, path: str, service_name: str = "healthcare-rag") -> None:
+        super().__init__(path)
+        self.service_name = service_name
+
+    def _line(self, span: Span) -> Dict[str, Any]:
+        return {"resourceSpans": [{
+            "resource": {"attributes": [{"key": "service.name", "value": {"stringValue": self.service_name}}]},
+            "scopeSpans": [{"scope": {"name": "healthcare_rag"}, "spans": [span.to_otlp()]}],
+        }]}
+
+
+def make_exporter(path: str, trace_format: str = "jsonl") -> JsonlExporter:
+    if trace_format not in TRACE_FORMATS:
+        raise ValueError(f"Unknown trace format '{trace_format}', expected one of {TRACE_FORMATS}")
+    return OtlpJsonExporter(path) if trace_format == "otlp" else JsonlExporter(path)
+
+
+class Tracer:
+    """Opens spans, keeps the finished ones of the ``max_traces`` most recent traces and exports them."""
+
+    def __init__(self, exporters: Optional[List[Any]] = None, max_traces: int = 100) -> None:
+        self.exporters = list(exporters or [])
+        self.max_traces = max_traces
+        self._traces: "OrderedDict[str, List[Span]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def span(self, name: str, **attributes: Any) -> Iterator[Span]:
+        parent = _current.get()
+        span = Span(name, trace_id=parent.trace_id if parent else uuid.uuid4().hex, span_id=uuid.uuid4().hex[:16],
+                    parent_id=parent.span_id if parent else None, attributes=attributes)
+        token = _current.set(span)
+        try:
+            yield span
+        except Exception as e:
+            span.error = type(e).__name__
+            raise
+        finally:
+            span.end = time.time()
+            try:
+                _current.reset(token)
+            except ValueError:
+                # A generator closed from another context (e.g. aclose in another task)
+                pass
+            self._finish(span)
+
+    def _finish(self, span: Span) -> None:
+        with self._lock:
+            spans = self._traces.setdefault(span.trace_id, [])
+            spans.append(span)
+            self._traces.move_to_end(span.trace_id)
+            while len(self._traces) > self.max_traces:
+                self._traces.popitem(last=False)
+        for exporter in self.exporters:
+            try:
+                exporter.export(span)
+            except Exception as e:
+                print(f"Error exporting span {span.name}: {e}")
+
+    def trace(self, trace_id: str) -> List[Span]:
+        """The finished spans of ``trace_id`` by start time; empty when unknown or evicted."""
+        with self._lock:
+            return sorted(self._traces.get(trace_id, []), key=lambda span: span.start)
+
+    def trace_ids(self) -> List[str]:
+        """Trace ids held in memory, most recent last."""
+        with self._lock:
+            return list(self._traces)
+
+
+tracer = Tracer()
+
+
+def span(name: str, **attributes: Any) -> Any:
+    """Context manager timing a span of the process-wide tracer, as a child of the current span."""
+    return tracer.span(name, **attributes)
+
+
+def traced(name: str) -> Callable[[Callable[..., T]], Callable[..., T]]:
+    """Decorator running each call of a function, coroutine function or generator in a span called ``name``."""
+    def decorator(fn: Callable[..., T]) -> Callable[..., T]:
+        if inspect.isasyncgenfunction(fn):
+            @functools.wraps(fn)
+            async def async_gen_wrapper(*args: Any, **kwargs: Any) -> Any:
+                with span(name):
+                    async for item in fn(*args, **kwargs):
+                        yield item
+            return async_gen_wrapper
+        if inspect.isgeneratorfunction(fn):
+            @functools.wraps(fn)
+            def gen_wrapper(*args: Any, **kwargs: Any) -> Any:
+                with span(name):
+                    yield from fn(*args, **kwargs)
+            return gen_wrapper
+        if inspect.iscoroutinefunction(fn):
+            @functools.wraps(fn)
+            async def async_wrapper(*args: Any, **kwargs: Any) -> Any:
+                with span(name):
+                    return await fn(*args, **kwargs)
+            return async_wrapper
+
+        @functools.wraps(fn)
+        def wrapper(*args: Any, **kwargs: Any) -> Any:
+            with span(name):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def current_span() -> Optional[Span]:
+    return _current.get()
+
+
+def set_attributes(**attributes: Any) -> None:
+    """Set attributes on the current span, if any."""
+    current = _current.get()
+    if current is not None:
+        current.set(**attributes)
+
+
+def add(key: str, amount: float = 1) -> None:
+    """Add to a counter attribute of the current span, if any."""
+    current = _current.get()
+    if current is not None:
+        current.add(key, amount)
+
+
+def record_error(error: BaseException) -> None:
+    """Mark the current span failed, for errors that are handled rather than raised through it."""
+    current = _current.get()
+    if current is not None:
+        current.error = type(error).__name__
+
+
+def record_usage(usage: Any) -> None:
+    """Add an Anthropic response's token usage to the current span."""
+    for key in ("input_tokens", "output_tokens", "cache_creation_input_tokens", "cache_read_input_tokens"):
+        value = getattr(usage, key, None)
+        if value:
+            add(key, value)
+
+
+def propagate(fn: Callable[..., T]) -> Callable[..., T]:
+    """``fn`` bound to the caller's context, so spans it opens on a pool thread nest under the current one."""
+    return functools.partial(copy_context().run, fn)
+
+
+def configure_from_env() -> None:
+    """Export spans to ``HEALTHCARE_RAG_TRACE_FILE``, as ``HEALTHCARE_RAG_TRACE_FORMAT`` (jsonl or otlp), if set."""
+    path = os.environ.get("HEALTHCARE_RAG_TRACE_FILE")
+    if path and not any(getattr(exporter, "path", None) == path for exporter in tracer.exporters):
+        tracer.exporters.append(make_exporter(path, os.environ.get("HEALTHCARE_RAG_TRACE_FORMAT", "jsonl")))
+
+
+def waterfall(spans: List[Span]) -> List[Dict[str, Any]]:
+    """
+    Rows of a latency waterfall for one trace's spans: offset and duration in
+    milliseconds from the earliest start, with each span's depth in the tree.
+    """
+    if not spans:
+        return []
+    origin = min(s.start for s in spans)
+    by_id = {s.span_id: s for s in spans}
+
+    def depth(s: Span) -> int:
+        d = 0
+        while s.parent_id in by_id:
+            s = by_id[s.parent_id]
+            d += 1
+        return d
+
+    rows = []
+    for s in sorted(spans, key=lambda s: s.start):
+        rows.append({**s.attributes, "span": s.name, "depth": depth(s), "start_ms": (s.start - origin) * 1000,
+                     "end_ms": (s.start - origin + s.duration) * 1000, "duration_ms": s.duration * 1000,
+                     "error": s.error or ""})
+    return rows
@@ -0,0 +1,6 @@
+import os
+import sys
+
+# The rag modules import each other as top-level modules (the way
+# `streamlit run rag/app.py` sees them), so make that directory importable.
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "rag"))
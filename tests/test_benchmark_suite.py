@@ -0,0 +1,46 @@
+import unittest
+from benchmarks.fake_anthropic import FakeAnthropicServer
+from benchmarks.suite import Metric, compare, median_metrics
+from claude_llm import Claude
+from resilience import ResiliencePolicy
+
+def results(**metrics):
+    return {"metrics": {name: vars(metric) for name, metric in metrics.items()}}
+
+class TestRegressionCheck(unittest.TestCase):
+    def setUp(self):
+        self.baseline = results(pages_per_sec=Metric(100.0, "pages/s", "higher", 0.3), p50_ms=Metric(10.0, "ms", "lower", 0.3),
+                                recall=Metric(0.9, "fraction", "exact", 0.0), retries=Metric(3, "retries", None))
+
+    def test_within_tolerance_passes(self):
+        current = results(pages_per_sec=Metric(75.0, "pages/s", "higher"), p50_ms=Metric(12.5, "ms"),
+                          recall=Metric(0.9, "fraction", "exact", 0.0), retries=Metric(30, "retries", None))
+        self.assertEqual(compare(current, self.baseline), [])
+
+    def test_regressions_are_reported(self):
+        current = results(pages_per_sec=Metric(60.0, "pages/s", "higher"), p50_ms=Metric(14.0, "ms"),
+                          recall=Metric(0.95, "fraction", "exact", 0.0))
+        regressions = compare(current, self.baseline)
+        self.assertEqual([line.split(":")[0] for line in regressions], ["pages_per_sec", "p50_ms", "recall"])
+        # An override loosens timings but never exact metrics
+        self.assertEqual([line.split(":")[0] for line in compare(current, self.baseline, tolerance=0.5)], ["recall"])
+
+    def test_median_of_runs(self):
+        runs = [{"p50_ms": Metric(value, "ms")} for value in (5.0, 1.0, 3.0)]
+        self.assertEqual(median_metrics(runs)["p50_ms"].value, 3.0)
+
+class TestFakeAnthropicErrors(unittest.TestCase):
+    def run_requests(self, seed):
+        with FakeAnthropicServer(first_token_latency=0, token_interval=0, error_rate=0.3, seed=seed) as server:
+            claude = Claude("claude-3-5-sonnet-20240620", "mock_api_key", base_url=server.base_url,
+                            policy=ResiliencePolicy(max_retries=0))
+            return [claude.complete(f"Question {i}") != "" for i in range(20)], server.injected_errors
+
+    def test_injected_errors_repeat_with_the_seed(self):
+        outcomes, errors = self.run_requests(seed=1)
+        self.assertEqual(self.run_requests(seed=1), (outcomes, errors))
+        self.assertEqual(outcomes.count(False), errors)
+        self.assertGreater(errors, 0)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,77 @@
+import unittest
+from chunker import StructureChunker, chunking_config, is_heading, is_table_row, make_chunker
+
+PAGE_ONE = """1. Introduction
+Diabetes mellitus is a chronic disease. It affects millions of people worldwide and its
+prevalence is rising. Early diagnosis improves outcomes.
+
+2. Pharmacological Treatment
+Metformin is first-line therapy. Start at 500 mg daily.
+Drug        Start dose    Max dose
+Metformin   500 mg        2000 mg
+Gliclazide  40 mg         320 mg
+Review renal function annually."""
+
+PAGE_TWO = """Continue titration weekly. Stop if eGFR falls below 30.
+MONITORING
+HbA1c should be checked every 3 months."""
+
+class TestStructureChunker(unittest.TestCase):
+    def chunks(self, chunk_tokens=256, overlap_sentences=1):
+        chunker = StructureChunker(chunk_tokens=chunk_tokens, overlap_sentences=overlap_sentences)
+        return list(chunker.iter_chunks([(0, PAGE_ONE), (1, PAGE_TWO)], "guideline.pdf"))
+
+    def test_heading_and_table_detection(self):
+        self.assertTrue(is_heading("2. Pharmacological Treatment"))
+        self.assertTrue(is_heading("MONITORING"))
+        self.assertFalse(is_heading("Metformin is first-line therapy."))
+        self.assertFalse(is_heading("prevalence is rising in older adults"))
+        self.assertTrue(is_table_row("Metformin   500 mg        2000 mg"))
+        self.assertFalse(is_table_row("Metformin 500 mg"))
+
+    def test_chunks_follow_sections(self):
+        chunks = self.chunks()
+        self.assertEqual([c.metadata["section"] for c in chunks],
+                         ["1. Introduction", "2. Pharmacological Treatment", "2. Pharmacological Treatment",
+                          "2. Pharmacological Treatment", "MONITORING"])
+        self.assertEqual([c.metadata["chunk_type"] for c in chunks], ["text", "text", "table", "text", "text"])
+        self.assertEqual(chunks[2].text.split("\n")[0], "Drug        Start dose    Max dose")
+
+    def test_provenance_offsets(self):
+        pages = {0: PAGE_ONE, 1: PAGE_TWO}
+        for chunk in self.chunks():
+            meta = chunk.metadata
+            first_line = chunk.text.split("\n")[0]
+            self.assertTrue(pages[meta["page"]][meta["char_start"]:].startswith(first_line[:20]))
+        spanning = self.chunks()[3]
+        self.assertEqual((spanning.metadata["page"], spanning.metadata["page_end"]), (0, 1))
+        self.assertTrue(PAGE_TWO[:spanning.metadata["char_end"]].endswith("below 30."))
+
+    def test_sentence_windows_overlap(self):
+        text = " ".join(f"Sentence {i} is short." for i in range(12))
+        chunks = list(StructureChunker(chunk_tokens=20, overlap_sentences=1).iter_chunks([(0, text)], "notes.pdf"))
+        self.assertGreater(len(chunks), 1)
+        for previous, chunk in zip(chunks, chunks[1:]):
+            self.assertEqual(chunk.text.split(". ")[0], previous.text.split(". ")[-1].rstrip("."))
+        self.assertTrue(chunks[-1].text.endswith("Sentence 11 is short."))
+
+    def test_long_tables_repeat_header(self):
+        tables = [c for c in self.chunks(chunk_tokens=12) if c.metadata["chunk_type"] == "table"]
+        self.assertEqual(len(tables), 2)
+        for table in tables:
+            self.assertTrue(table.text.startswith("Drug"))
+
+    def test_provenance_hidden_from_embedding(self):
+        content = self.chunks()[0].get_content(metadata_mode="embed")
+        self.assertIn("1. Introduction", content)
+        self.assertNotIn("char_start", content)
+
+    def test_page_mode(self):
+        self.assertIsNone(make_chunker("page"))
+        self.assertEqual(chunking_config(None), {"chunking": "page"})
+        self.assertEqual(chunking_config(make_chunker("structure", 128))["chunk_tokens"], 128)
+        with self.assertRaises(ValueError):
+            make_chunker("paragraph")
+
+if __name__ == '__main__':
+    unittest.main()
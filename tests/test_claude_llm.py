@@ -0,0 +1,93 @@
+import asyncio
+import unittest
+from llama_index.core.llms import ChatMessage, MessageRole
+from claude_adapter import ClaudeLLM
+from claude_llm import CACHE_CONTROL, Claude, TokenUsage, cached_text, logger
+from benchmarks.fake_anthropic import FakeAnthropicServer
+import tracing
+
+class TestClaudeStreaming(unittest.TestCase):
+    def setUp(self):
+        self.server = FakeAnthropicServer(reply="Metformin is the usual first-line therapy.",
+                                          first_token_latency=0, token_interval=0).start()
+        self.claude_instance = Claude("claude-3-5-sonnet-20240620", "mock_api_key", base_url=self.server.base_url)
+
+    def tearDown(self):
+        self.server.stop()
+
+    def test_stream_complete(self):
+        chunks = list(self.claude_instance.stream_complete("How is diabetes treated?"))
+        self.assertGreater(len(chunks), 1)
+        self.assertEqual("".join(chunks), self.server.reply)
+        self.assertTrue(self.server.requests[-1]["stream"])
+
+    def test_astream_chat(self):
+        async def collect():
+            messages = [{"role": "user", "content": "How is diabetes treated?"}]
+            return [chunk async for chunk in self.claude_instance.astream_chat(messages, system="Be brief.")]
+        self.assertEqual("".join(asyncio.run(collect())), self.server.reply)
+        self.assertEqual(self.server.requests[-1]["system"], "Be brief.")
+
+    def test_complete_matches_stream(self):
+        self.assertEqual(self.claude_instance.complete("How is diabetes treated?"), self.server.reply)
+
+    def test_invalid_messages_are_skipped_without_their_content(self):
+        messages = ["Patient Jane Doe, DOB 1950-01-01", {"role": "user", "content": "How is diabetes treated?"}]
+        with tracing.span("turn") as span, self.assertLogs(logger, "WARNING") as logs:
+            self.assertEqual(self.claude_instance.chat(messages), self.server.reply)
+        self.assertEqual(self.server.requests[-1]["messages"], [messages[1]])
+        self.assertNotIn("Jane Doe", "\n".join(logs.output))
+        chat = next(s for s in tracing.tracer.trace(span.trace_id) if s.name == "llm.chat")
+        self.assertEqual(chat.attributes["skipped_messages"], 1)
+
+    def test_errors_are_logged_without_their_message(self):
+        self.server.fail_next(400)
+        with self.assertLogs(logger, "ERROR") as logs:
+            self.assertEqual(self.claude_instance.complete("How is diabetes treated?"), "")
+        [line] = logs.output
+        self.assertIn("BadRequestError (status 400)", line)
+        self.assertNotIn("Injected", line)
+
+    def test_chat_with_vision_detects_media_type(self):
+        png = b"\x89PNG\r\n\x1a\n" + b"\x00" * 16
+        self.claude_instance.chat_with_vision([{"role": "user", "content": "Describe the figure."}], [png])
+        image_block = self.server.requests[-1]["messages"][-1]["content"][0]
+        self.assertEqual(image_block["source"]["media_type"], "image/png")
+
+class TestPromptCache(unittest.TestCase):
+    def setUp(self):
+        self.server = FakeAnthropicServer(reply="Metformin is first-line.", first_token_latency=0, token_interval=0).start()
+        self.usage = TokenUsage()
+        self.claude_instance = Claude("claude-3-5-sonnet-20240620", "mock_api_key", base_url=self.server.base_url,
+                                      usage=self.usage)
+        self.guideline = "The maximum daily dose of metformin is 2000 mg. " * 200
+
+    def tearDown(self):
+        self.server.stop()
+
+    def test_second_call_reads_the_cached_prefix(self):
+        system = [cached_text(self.guideline)]
+        self.claude_instance.complete("What is the maximum dose?", system=system)
+        written = self.usage.cache_creation_input_tokens
+        self.assertGreaterEqual(written, 1024)
+        list(self.claude_instance.stream_complete("What are the side effects?", system=system))
+        self.assertEqual((self.usage.requests, self.usage.cache_read_input_tokens), (2, written))
+        self.assertGreater(self.usage.cache_read_rate, 0.4)
+
+    def test_short_prefixes_are_not_cached(self):
+        for _ in range(2):
+            self.claude_instance.complete("What is the maximum dose?", system=[cached_text("Be brief.")])
+        self.assertEqual((self.usage.cache_creation_input_tokens, self.usage.cache_read_input_tokens), (0, 0))
+
+    def test_adapter_passes_cache_control_through(self):
+        llm = ClaudeLLM(self.claude_instance)
+        messages = [ChatMessage(role=MessageRole.SYSTEM, content=self.guideline, additional_kwargs={"cache_control": CACHE_CONTROL}),
+                    ChatMessage(role=MessageRole.SYSTEM, content="Summary of earlier turns."),
+                    ChatMessage(role=MessageRole.USER, content="What is the maximum dose?")]
+        llm.chat(messages)
+        request = self.server.requests[-1]
+        self.assertEqual([block.get("cache_control") for block in request["system"]], [CACHE_CONTROL, None])
+        self.assertEqual(request["messages"], [{"role": "user", "content": "What is the maximum dose?"}])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,101 @@
+import unittest
+from llama_index.core.llms import MessageRole
+from llama_index.core.schema import NodeWithScore, TextNode
+from context_packer import (TokenBudgetPostprocessor, estimate_tokens, pack_history, pack_nodes,
+                                prompt_budgets)
+
+PASSAGE = ("Metformin is the usual first-line therapy for type 2 diabetes. Start at 500 mg once daily "
+           "with meals and titrate weekly. Check renal function before initiation and at least annually.")
+
+def node(text, score):
+    return NodeWithScore(node=TextNode(text=text), score=score)
+
+class TestContextPacker(unittest.TestCase):
+    def test_fills_budget_by_score(self):
+        nodes = [node("low " * 40, 0.1), node("high " * 40, 0.9), node("mid " * 40, 0.5)]
+        budget = estimate_tokens("high " * 40) * 2
+        packed = pack_nodes(nodes, budget)
+        self.assertEqual([n.score for n in packed], [0.9, 0.5])
+
+    def test_smaller_node_fills_remaining_space(self):
+        nodes = [node("a " * 100, 0.9), node("b " * 200, 0.8), node("c " * 20, 0.1)]
+        packed = pack_nodes(nodes, estimate_tokens("a " * 100) + estimate_tokens("c " * 20))
+        self.assertEqual([n.score for n in packed], [0.9, 0.1])
+
+    def test_dedupes_overlapping_chunks(self):
+        nodes = [node(PASSAGE, 0.9), node(PASSAGE + " Stop if eGFR falls below 30.", 0.8), node("Insulin dosing tables.", 0.2)]
+        packed = pack_nodes(nodes, 10_000)
+        self.assertEqual([n.score for n in packed], [0.9, 0.2])
+
+    def test_postprocessor(self):
+        postprocessor = TokenBudgetPostprocessor(budget_tokens=estimate_tokens(PASSAGE))
+        packed = postprocessor.postprocess_nodes([node(PASSAGE, 0.9), node("Other text " * 10, 0.5)])
+        self.assertEqual(len(packed), 1)
+
+    def test_budgets_scale_to_window(self):
+        self.assertEqual(prompt_budgets(200_000, 1000, 6000, 2000), (6000, 2000))
+        context, history = prompt_budgets(8_000, 1000, 9000, 3000)
+        self.assertLessEqual(context + history, 8_000 - 1000)
+        self.assertEqual(context, 3 * history)
+
+    def test_history_keeps_recent_turns(self):
+        messages = [{"role": "assistant", "content": "Welcome."}]
+        for i in range(10):
+            messages += [{"role": "user", "content": f"Question {i} " * 10},
+                         {"role": "assistant", "content": f"Answer {i} " * 10}]
+        history = pack_history(messages, budget_tokens=100)
+        self.assertEqual(history[0].role, MessageRole.USER)
+        self.assertEqual(history[-1].content, messages[-1]["content"])
+        self.assertLessEqual(sum(estimate_tokens(m.content) for m in history), 100)
+        self.assertLess(len(history), len(messages))
+
+    def test_history_summarizes_older_turns(self):
+        messages = []
+        for i in range(6):
+            messages += [{"role": "user", "content": f"Question {i} " * 10},
+                         {"role": "assistant", "content": f"Answer {i} " * 10}]
+        transcripts = []
+        def summarize(transcript, max_words):
+            transcripts.append(transcript)
+            return "The user asked about questions 0 to 3."
+        history = pack_history(messages, budget_tokens=120, summarize=summarize)
+        self.assertEqual(history[0].role, MessageRole.SYSTEM)
+        self.assertIn("questions 0 to 3", history[0].content)
+        self.assertEqual(history[1].role, MessageRole.USER)
+        self.assertIn("User: Question 0", transcripts[0])
+
+    def test_aligned_history_keeps_its_prefix_between_cuts(self):
+        messages = []
+        aligned, sliding = [], []
+        for i in range(8):
+            messages += [{"role": "user", "content": f"Question {i} " * 10},
+                         {"role": "assistant", "content": f"Answer {i} " * 10}]
+            aligned.append([m.content for m in pack_history(messages, budget_tokens=200, align=4)])
+            sliding.append([m.content for m in pack_history(messages, budget_tokens=200)])
+        # The oldest kept turn moves two turns at a time instead of every turn
+        self.assertLess(len({history[0] for history in aligned}), len({history[0] for history in sliding}))
+        self.assertEqual(aligned[4][:4], aligned[3])
+        self.assertLessEqual(sum(estimate_tokens(m) for m in aligned[-1]), 200)
+        # Never aligned down to less than a turn
+        self.assertEqual(len(pack_history(messages, budget_tokens=100, align=4)), 2)
+
+    def test_summary_request_is_stable_while_older_turns_are(self):
+        messages, requests = [], {}
+        def summarize(transcript, max_words):
+            requests.setdefault(transcript, set()).add(max_words)
+            return "Earlier questions."
+        for i in range(8):
+            messages += [{"role": "user", "content": f"Question {i} " * 10},
+                         {"role": "assistant", "content": f"Answer {i} " * 10}]
+            pack_history(messages, budget_tokens=240, summarize=summarize, align=4)
+        # Some older turns were summarized on several turns, each time with the same request
+        self.assertLess(len(requests), 7)
+        self.assertTrue(all(len(limits) == 1 for limits in requests.values()))
+
+    def test_short_history_is_unchanged(self):
+        messages = [{"role": "user", "content": "Hi"}, {"role": "assistant", "content": "Hello"}]
+        history = pack_history(messages, budget_tokens=1000, summarize=lambda t, w: self.fail("should not summarize"))
+        self.assertEqual([m.content for m in history], ["Hi", "Hello"])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,66 @@
+import unittest
+from llama_index.core import Document, Settings, VectorStoreIndex
+from llama_index.core.embeddings import MockEmbedding
+from corpus import CorpusIndex
+from hybrid_retriever import HybridRetriever
+
+class TestCorpusIndex(unittest.TestCase):
+    def setUp(self):
+        Settings.embed_model = MockEmbedding(embed_dim=8)
+        self.first = self.index("first.pdf", 3)
+        self.second = self.index("second.pdf", 2)
+
+    def index(self, source, pages):
+        return VectorStoreIndex.from_documents(
+            [Document(text=f"Page {i} of {source}.", metadata={"source": source, "page": i}) for i in range(pages)])
+
+    def retrieved_sources(self, corpus):
+        return {n.node.metadata["source"] for n in corpus.index.as_retriever(similarity_top_k=10).retrieve("dose")}
+
+    def test_add_and_remove(self):
+        corpus = CorpusIndex()
+        self.assertEqual(corpus.add("a", self.first, source="first.pdf"), 3)
+        self.assertEqual(corpus.add("b", self.second, source="second.pdf"), 2)
+        self.assertEqual(corpus.add("a", self.first), 0)
+        self.assertEqual(self.retrieved_sources(corpus), {"first.pdf", "second.pdf"})
+        self.assertTrue(corpus.remove("a"))
+        self.assertFalse(corpus.remove("a"))
+        self.assertEqual(self.retrieved_sources(corpus), {"second.pdf"})
+        self.assertEqual(len(corpus.index.index_struct.nodes_dict), 2)
+        self.assertEqual(corpus.sources(), ["second.pdf"])
+
+    def test_reuses_stored_embeddings(self):
+        corpus = CorpusIndex()
+        corpus.add("a", self.first)
+        for node_id in self.first.index_struct.nodes_dict.values():
+            self.assertEqual(corpus.index.vector_store.get(node_id), self.first.vector_store.get(node_id))
+
+    def test_extend_adds_only_new_nodes(self):
+        corpus = CorpusIndex()
+        corpus.add("a", self.first)
+        known = self.first.docstore.get_nodes(list(self.first.index_struct.nodes_dict.values()))
+        overlapping = VectorStoreIndex(known[1:] + [Document(text="Page 3 of first.pdf.")])
+        self.assertEqual(corpus.extend("a", overlapping), 1)
+        self.assertEqual(corpus.extend("a", self.first), 0)
+        self.assertEqual((corpus.parts("a"), corpus.batches("a")), (2, 3))
+        segment_ids = [node_id for segment in corpus.search_segments() for node_id in segment.node_ids]
+        self.assertEqual(sorted(segment_ids), sorted(corpus.documents["a"]["node_ids"]))
+        self.assertEqual(len(segment_ids), 4)
+
+    def test_sync(self):
+        corpus = CorpusIndex()
+        corpus.add("a", self.first)
+        self.assertEqual(corpus.sync({"b": None}), ["b"])
+        self.assertNotIn("a", corpus)
+
+    def test_view_searches_only_its_documents(self):
+        corpus = CorpusIndex()
+        corpus.add("a", self.first, source="first.pdf")
+        corpus.add("b", self.second, source="second.pdf")
+        view = corpus.view(["b", "missing"])
+        self.assertEqual(len(view), 1)
+        retrieved = HybridRetriever(view, similarity_top_k=10).retrieve("Page of second")
+        self.assertEqual({n.node.metadata["source"] for n in retrieved}, {"second.pdf"})
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,63 @@
+import os
+import tempfile
+import unittest
+import numpy as np
+from llama_index.core import Document, VectorStoreIndex
+from embedding_service import EmbeddingService, make_backend
+
+class FakeBackend:
+    """Deterministic 4-d vectors derived from the text, recording each batch it is given."""
+
+    def __init__(self):
+        self.batches = []
+
+    def __call__(self, texts):
+        self.batches.append(list(texts))
+        vectors = np.array([[len(t), t.count("a"), t.count("e"), 1.0] for t in texts], dtype=np.float32)
+        return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+class TestEmbeddingService(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.cache_path = os.path.join(self.tmp.name, "embeddings.sqlite3")
+        self.backend = FakeBackend()
+        self.service = EmbeddingService(self.backend, embed_batch_size=2, cache_path=self.cache_path)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_batches_are_length_sorted_and_deduplicated(self):
+        texts = ["a much longer chunk of text", "short", "medium chunk", "short", "tiny"]
+        vectors = self.service.get_text_embedding_batch(texts)
+        self.assertEqual(self.backend.batches, [["tiny", "short"], ["medium chunk", "a much longer chunk of text"]])
+        np.testing.assert_allclose(vectors[1], vectors[3])
+        np.testing.assert_allclose(vectors[0], self.backend(["a much longer chunk of text"])[0], rtol=1e-6)
+
+    def test_persistent_cache(self):
+        self.service.get_text_embedding_batch(["alpha", "beta"])
+        backend = FakeBackend()
+        reopened = EmbeddingService(backend, embed_batch_size=2, cache_path=self.cache_path)
+        reopened.get_text_embedding_batch(["alpha", "beta", "gamma"])
+        self.assertEqual(backend.batches, [["gamma"]])
+
+    def test_cache_is_per_model(self):
+        self.service.get_text_embedding_batch(["alpha"])
+        backend = FakeBackend()
+        EmbeddingService(backend, model_name="other-model", cache_path=self.cache_path).get_text_embedding_batch(["alpha"])
+        self.assertEqual(backend.batches, [["alpha"]])
+
+    def test_query_uses_instruction_and_skips_cache(self):
+        self.service.get_query_embedding("metformin dose")
+        self.assertTrue(self.backend.batches[-1][0].startswith("Represent this question"))
+
+    def test_builds_index(self):
+        index = VectorStoreIndex.from_documents([Document(text=f"Chunk {i} about metformin.") for i in range(5)],
+                                                embed_model=self.service)
+        self.assertEqual(len(index.as_retriever(similarity_top_k=2).retrieve("metformin")), 2)
+
+    def test_invalid_backend(self):
+        with self.assertRaises(ValueError):
+            make_backend("tensorflow")
+
+if __name__ == '__main__':
+    unittest.main()
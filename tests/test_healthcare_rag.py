@@ -1,7 +1,7 @@
 import unittest
-from rag.healthcare_utils import categorize_query, format_healthcare_response, extract_key_points, generate_follow_up_questions
-from rag.document_processor import process_healthcare_document
-from rag.claude_llm import Claude
+from healthcare_utils import categorize_query, format_healthcare_response, extract_key_points, generate_follow_up_questions
+from document_processor import process_healthcare_document
+from claude_llm import Claude
 import io
 
 class TestHealthcareRAG(unittest.TestCase):
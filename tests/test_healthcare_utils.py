@@ -0,0 +1,92 @@
+import asyncio
+import gc
+import time
+import unittest
+from healthcare_utils import (aenrich_healthcare_response, aprocess_healthcare_query, enrich_healthcare_response,
+                                  process_healthcare_query)
+from benchmarks.stubs import StubClaude
+import tracing
+
+class TestConcurrentHealthcareQuery(unittest.TestCase):
+    def setUp(self):
+        self.claude_instance = StubClaude(latency=0.1)
+
+    def test_matches_serial_result(self):
+        serial = process_healthcare_query("How is diabetes treated?", self.claude_instance)
+        concurrent = asyncio.run(aprocess_healthcare_query("How is diabetes treated?", self.claude_instance))
+        self.assertEqual(serial, concurrent)
+        self.assertEqual(concurrent["category"], "treatment")
+        self.assertEqual(len(concurrent["follow_up_questions"]), 3)
+
+    def test_critical_path_is_two_round_trips(self):
+        start = time.perf_counter()
+        asyncio.run(aprocess_healthcare_query("How is diabetes treated?", self.claude_instance))
+        elapsed = time.perf_counter() - start
+        self.assertEqual(len(self.claude_instance.calls), 5)
+        self.assertLess(elapsed, 0.35)
+
+    def test_failure_leaves_no_task_behind(self):
+        class FailingClaude(StubClaude):
+            def _pick_answer(self, prompt):
+                if "Categorize" in prompt or "Extract the key points" in prompt:
+                    raise RuntimeError("API down")
+                return super()._pick_answer(prompt)
+
+        unhandled = []
+        async def run():
+            asyncio.get_running_loop().set_exception_handler(lambda loop, context: unhandled.append(context))
+            with self.assertRaises(RuntimeError):
+                await aprocess_healthcare_query("How is diabetes treated?", FailingClaude(latency=0))
+            await asyncio.sleep(0.05)
+            self.assertEqual([task for task in asyncio.all_tasks() if task is not asyncio.current_task()], [])
+            gc.collect()
+        asyncio.run(run())
+        self.assertEqual(unhandled, [])
+
+class TestFusedHealthcareQuery(unittest.TestCase):
+    def test_fused_uses_one_enrichment_call(self):
+        claude_instance = StubClaude(latency=0)
+        result = process_healthcare_query("How is diabetes treated?", claude_instance, mode="fused")
+        self.assertEqual(len(claude_instance.calls), 2)
+        self.assertEqual(result["category"], "treatment")
+        self.assertEqual(len(result["key_points"]), 2)
+        self.assertEqual(len(result["follow_up_questions"]), 3)
+
+    def test_fused_falls_back_on_invalid_json(self):
+        claude_instance = StubClaude(latency=0, malformed_json=True)
+        with tracing.span("query") as root:
+            result = asyncio.run(aprocess_healthcare_query("How is diabetes treated?", claude_instance, mode="fused"))
+        self.assertEqual(len(claude_instance.calls), 6)
+        process = next(span for span in tracing.tracer.trace(root.trace_id) if span.name == "healthcare.process")
+        self.assertTrue(process.attributes["fused_fallback"])
+        self.assertIsNone(process.error)
+        self.assertEqual(result, process_healthcare_query("How is diabetes treated?", StubClaude(latency=0)))
+
+    def test_unknown_mode(self):
+        with self.assertRaises(ValueError):
+            process_healthcare_query("How is diabetes treated?", StubClaude(latency=0), mode="batch")
+
+class TestEnrichHealthcareResponse(unittest.TestCase):
+    answer = "Metformin is the usual first-line therapy."
+
+    def test_enriches_the_given_answer_in_one_round_trip(self):
+        claude_instance = StubClaude(latency=0.1)
+        start = time.perf_counter()
+        result = asyncio.run(aenrich_healthcare_response("How is diabetes treated?", self.answer, claude_instance))
+        self.assertLess(time.perf_counter() - start, 0.2)
+        self.assertEqual(len(claude_instance.calls), 2)
+        # No new response is generated: the answer shown is the one analysed and returned
+        self.assertNotIn("How is diabetes treated?", claude_instance.calls)
+        self.assertEqual(result["response"], self.answer)
+        self.assertEqual(result["category"], "treatment")
+        self.assertEqual(len(result["key_points"]), 2)
+        self.assertEqual(result, enrich_healthcare_response("How is diabetes treated?", self.answer, StubClaude(latency=0)))
+
+    def test_falls_back_on_invalid_json(self):
+        claude_instance = StubClaude(latency=0, malformed_json=True)
+        result = asyncio.run(aenrich_healthcare_response("How is diabetes treated?", self.answer, claude_instance))
+        self.assertEqual(len(claude_instance.calls), 4)
+        self.assertEqual(len(result["follow_up_questions"]), 3)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,113 @@
+import os
+import tempfile
+import unittest
+import numpy as np
+from llama_index.core import Document, QueryBundle, Settings, VectorStoreIndex
+from llama_index.core.schema import MetadataMode
+from benchmarks.stubs import HashingEmbedding
+from corpus import CorpusIndex
+from hybrid_retriever import HybridRetriever, SearchSegment, bm25_search, dense_search, reciprocal_rank_fusion
+from lexical_index import LexicalIndex, tokenize
+
+PAGES = [
+    "Metformin is first-line therapy for type 2 diabetes.",
+    "Type 2 diabetes (ICD-10 E11.9) is coded at every visit.",
+    "Check eGFR before starting metformin; avoid below 30 mL/min/1.73m2.",
+    "Statins lower cardiovascular risk in type 2 diabetes.",
+]
+
+class TestHybridRetriever(unittest.TestCase):
+    def setUp(self):
+        Settings.embed_model = HashingEmbedding(dim=64)
+        self.first = VectorStoreIndex.from_documents([Document(text=text, metadata={"source": "first.pdf"}) for text in PAGES])
+        self.second = VectorStoreIndex.from_documents(
+            [Document(text="Warfarin needs INR monitoring.", metadata={"source": "second.pdf"})])
+        self.corpus = CorpusIndex()
+        self.corpus.add("a", self.first, source="first.pdf")
+        self.corpus.add("b", self.second, source="second.pdf")
+
+    def texts(self, nodes):
+        return [n.node.get_content() for n in nodes]
+
+    def test_tokenize_keeps_codes_and_doses(self):
+        tokens = tokenize("What is the ICD-10 code E11.9 for HbA1c of 7.5% on co-amoxiclav?")
+        for token in ["icd-10", "icd", "10", "e11.9", "hba1c", "7.5", "co-amoxiclav", "amoxiclav"]:
+            self.assertIn(token, tokens)
+        self.assertNotIn("the", tokens)
+
+    def test_lexical_index_round_trip(self):
+        lexical = LexicalIndex.build(["n1", "n2"], ["metformin dose", "metformin metformin renal"])
+        with tempfile.TemporaryDirectory() as tmp:
+            lexical.save(os.path.join(tmp, "lexical.npz"))
+            loaded = LexicalIndex.load(os.path.join(tmp, "lexical.npz"))
+        positions, freqs = loaded.postings("metformin")
+        self.assertEqual(positions.tolist(), [0, 1])
+        self.assertEqual(freqs.tolist(), [1.0, 2.0])
+        self.assertEqual(loaded.document_frequency("renal"), 1)
+        self.assertEqual(loaded.node_ids, ["n1", "n2"])
+
+    def test_bm25_ranks_exact_code_first(self):
+        ranking = bm25_search(self.corpus.search_segments(), "diabetes code E11.9", top_k=10)
+        self.assertIn("E11.9", self.corpus.index.docstore.get_node(ranking[0][0]).get_content())
+        # Only nodes sharing a term with the query are candidates
+        self.assertEqual(len(ranking), 3)
+
+    def test_dense_search_matches_vector_store(self):
+        query = "avoid metformin below eGFR 30"
+        expected = self.corpus.index.as_retriever(similarity_top_k=5).retrieve(query)
+        ranking = dense_search(self.corpus.search_segments(), Settings.embed_model.get_query_embedding(query), 5)
+        # Ties may come back in either order, so compare the scores
+        np.testing.assert_allclose([score for _, score in ranking], [n.score for n in expected], rtol=1e-5, atol=1e-6)
+        self.assertEqual(ranking[0][0], expected[0].node.node_id)
+
+    def test_reciprocal_rank_fusion(self):
+        fused = reciprocal_rank_fusion([[("a", 0.9), ("b", 0.8)], [("b", 12.0), ("c", 3.0)]], top_k=2)
+        self.assertEqual([node_id for node_id, _ in fused], ["b", "a"])
+        self.assertAlmostEqual(fused[0][1], 1 / 62 + 1 / 61)
+
+    def test_hybrid_retriever_over_corpus(self):
+        retriever = HybridRetriever(self.corpus, similarity_top_k=2)
+        nodes = retriever.retrieve("INR monitoring for warfarin")
+        self.assertEqual(nodes[0].node.metadata["source"], "second.pdf")
+        self.corpus.remove("b")
+        self.assertNotIn("second.pdf", {n.node.metadata["source"] for n in retriever.retrieve("INR monitoring for warfarin")})
+
+    def test_vector_score_metadata(self):
+        nodes = HybridRetriever(self.corpus, similarity_top_k=2).retrieve("INR monitoring for warfarin")
+        self.assertGreater(nodes[0].node.metadata["vector_score"], 0)
+        self.assertNotIn("vector_score", nodes[0].node.get_content(metadata_mode=MetadataMode.LLM))
+        stored = self.corpus.index.docstore.get_node(nodes[0].node.node_id)
+        self.assertNotIn("vector_score", stored.metadata)
+
+    def test_modes(self):
+        bm25 = HybridRetriever(self.corpus, similarity_top_k=4, mode="bm25")
+        self.assertEqual(self.texts(bm25.retrieve(QueryBundle("E11.9"))), [PAGES[1]])
+        vector = HybridRetriever(self.corpus, similarity_top_k=4, mode="vector")
+        self.assertEqual(len(vector.retrieve("E11.9")), 4)
+        with self.assertRaises(ValueError):
+            HybridRetriever(self.corpus, mode="splade")
+
+    def test_segments_hold_normalized_embeddings(self):
+        for segment in self.corpus.search_segments():
+            np.testing.assert_allclose(np.linalg.norm(segment.embeddings, axis=1), 1.0, rtol=1e-5)
+
+    def test_merged_segment_ranks_as_its_parts(self):
+        segments = self.corpus.search_segments()
+        merged = SearchSegment.merge(segments)
+        self.assertEqual(merged.node_ids, segments[0].node_ids + segments[1].node_ids)
+        for query in ["metformin for type 2 diabetes", "warfarin INR", "E11.9"]:
+            embedding = Settings.embed_model.get_query_embedding(query)
+            self.assertEqual(bm25_search([merged], query, 5), bm25_search(segments, query, 5))
+            self.assertEqual(dense_search([merged], embedding, 5), dense_search(segments, embedding, 5))
+        self.assertEqual(merged.lexical.document_frequency("diabetes"), 3)
+
+    def test_compact_leaves_one_segment_per_document(self):
+        self.corpus.extend("b", VectorStoreIndex.from_documents([Document(text="Check INR weekly at first.")]))
+        self.assertEqual(len(self.corpus.search_segments(["b"])), 2)
+        self.corpus.compact("b")
+        self.assertEqual(len(self.corpus.search_segments(["b"])), 1)
+        ranking = bm25_search(self.corpus.search_segments(["b"]), "INR", 5)
+        self.assertEqual(len(ranking), 2)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,45 @@
+import tempfile
+import unittest
+from llama_index.core import Document
+from claude_llm import Claude
+from image_captioner import ImageCaptioner
+from image_store import ImageStore
+from resilience import ResiliencePolicy
+from benchmarks.fake_anthropic import FakeAnthropicServer
+from benchmarks.stubs import caption_responder
+from benchmarks.synthetic_pdf import _jpeg
+
+class TestImageCaptioner(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.image_store = ImageStore(self.tmp.name)
+        self.refs = [self.image_store.put(_jpeg(seed, 32), "jpeg") for seed in range(5)]
+        self.server = FakeAnthropicServer(responder=caption_responder, first_token_latency=0, token_interval=0).start()
+        self.claude_instance = Claude("claude-3-5-sonnet-20240620", "mock_api_key", base_url=self.server.base_url,
+                                      policy=ResiliencePolicy(base_delay=0.01))
+        self.captioner = ImageCaptioner(self.claude_instance, self.image_store, max_workers=2, images_per_request=2)
+
+    def tearDown(self):
+        self.server.stop()
+        self.tmp.cleanup()
+
+    def test_packs_images_and_caches(self):
+        captions = self.captioner.caption(self.refs)
+        self.assertEqual(set(captions), set(self.refs))
+        self.assertEqual(len(self.server.requests), 3)
+        self.captioner.caption(self.refs)
+        self.assertEqual(len(self.server.requests), 3)
+
+    def test_retries_rate_limits(self):
+        self.server.fail_next(429, 529)
+        captions = self.captioner.caption(self.refs[:1])
+        self.assertEqual(len(captions), 1)
+        self.assertEqual(len(self.server.requests), 3)
+
+    def test_caption_documents_replaces_placeholder(self):
+        doc = Document(text="Image 1 from test.pdf", metadata={"source": "test.pdf", "page": 2, "type": "image", "image_ref": self.refs[0]})
+        self.captioner.caption_documents([doc])
+        self.assertTrue(doc.text.startswith("Figure on page 3 of test.pdf: Bar chart of HbA1c"))
+
+if __name__ == '__main__':
+    unittest.main()
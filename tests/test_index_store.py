@@ -0,0 +1,60 @@
+import os
+import tempfile
+import unittest
+import numpy as np
+from llama_index.core import Document, Settings
+from llama_index.core.embeddings import MockEmbedding
+from index_store import LEXICAL_FILE, IndexStore, index_config
+from lexical_index import lexical_index_for
+
+class TestIndexStore(unittest.TestCase):
+    def setUp(self):
+        Settings.embed_model = MockEmbedding(embed_dim=8)
+        self.tmp = tempfile.TemporaryDirectory()
+        self.store = IndexStore(self.tmp.name)
+        self.builds = 0
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def build_documents(self):
+        self.builds += 1
+        return [Document(text=f"Page {i} about metformin dosing.", metadata={"source": "test.pdf", "page": i}) for i in range(3)]
+
+    def test_round_trip_skips_rebuild(self):
+        built = self.store.get_or_build(b"%PDF-1 one", self.build_documents, index_config())
+        loaded = self.store.get_or_build(b"%PDF-1 one", self.build_documents, index_config())
+        self.assertEqual(self.builds, 1)
+        self.assertEqual(set(loaded.docstore.docs), set(built.docstore.docs))
+        for node_id, embedding in built.vector_store.to_dict()["embedding_dict"].items():
+            np.testing.assert_allclose(loaded.vector_store.get(node_id), embedding, rtol=1e-6)
+        self.assertEqual(len(loaded.as_retriever(similarity_top_k=2).retrieve("metformin")), 2)
+        # Rows are views of the memory-mapped matrix, not lists of floats
+        self.assertTrue(all(isinstance(row, np.memmap) for row in loaded.vector_store.data.embedding_dict.values()))
+
+    def test_lexical_index_is_stored(self):
+        self.store.get_or_build(b"%PDF-1 one", self.build_documents, index_config())
+        entry = os.path.join(self.tmp.name, IndexStore.key(b"%PDF-1 one", index_config()))
+        self.assertTrue(os.path.exists(os.path.join(entry, LEXICAL_FILE)))
+        os.remove(os.path.join(entry, LEXICAL_FILE))
+        loaded = self.store.get_or_build(b"%PDF-1 one", self.build_documents, index_config())
+        self.assertEqual(self.builds, 1)
+        self.assertEqual(len(lexical_index_for(loaded)), 3)
+        self.assertTrue(os.path.exists(os.path.join(entry, LEXICAL_FILE)))
+
+    def test_key_depends_on_config(self):
+        self.assertNotEqual(IndexStore.key(b"pdf", index_config()), IndexStore.key(b"pdf", index_config(include_vision=False)))
+        self.store.get_or_build(b"pdf", self.build_documents, index_config())
+        self.store.get_or_build(b"pdf", self.build_documents, index_config(include_vision=False))
+        self.assertEqual(self.builds, 2)
+
+    def test_lru_eviction(self):
+        self.store.get_or_build(b"first", self.build_documents, index_config())
+        entry_size = self.store.total_size()
+        self.store.max_bytes = int(entry_size * 1.5)
+        self.store.get_or_build(b"second", self.build_documents, index_config())
+        keys = [entry["key"] for entry in self.store.entries()]
+        self.assertEqual(keys, [IndexStore.key(b"second", index_config())])
+
+if __name__ == '__main__':
+    unittest.main()
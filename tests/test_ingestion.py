@@ -0,0 +1,108 @@
+import tempfile
+import threading
+import unittest
+from llama_index.core import Document, Settings
+from llama_index.core.embeddings import MockEmbedding
+from corpus import CorpusIndex
+from index_store import IndexStore, index_config
+from ingestion import IngestionQueue, follow
+
+class GatedSource:
+    """Yields ``first`` text Documents, waits for ``gate``, then yields the rest and one figure."""
+
+    def __init__(self, first=2, rest=3):
+        self.first = first
+        self.rest = rest
+        self.gate = threading.Event()
+        self.calls = 0
+
+    def __call__(self, progress):
+        self.calls += 1
+        total = self.first + self.rest
+        for page in range(total):
+            if page == self.first:
+                self.gate.wait(5)
+            progress(page + 1, total)
+            yield Document(text=f"Page {page} about metformin.", metadata={"source": "test.pdf", "page": page})
+        yield Document(text="Image 1 from test.pdf", metadata={"source": "test.pdf", "page": 0, "type": "image"})
+
+class TestIngestionQueue(unittest.TestCase):
+    def setUp(self):
+        Settings.embed_model = MockEmbedding(embed_dim=8)
+        self.tmp = tempfile.TemporaryDirectory()
+        self.store = IndexStore(self.tmp.name)
+        self.queue = IngestionQueue(self.store, workers=2, batch_size=2)
+
+    def tearDown(self):
+        self.queue.shutdown()
+        self.tmp.cleanup()
+
+    def caption(self, documents, progress):
+        for i, doc in enumerate(documents):
+            doc.set_content("Figure: HbA1c by treatment arm")
+            progress(i + 1, len(documents))
+
+    def test_incremental_availability_and_persistence(self):
+        source = GatedSource()
+        job = self.queue.submit(b"%PDF one", "test.pdf", source, index_config(), caption=self.caption)
+        corpus, followed = CorpusIndex(), {}
+        for _ in range(100):
+            if job.batches():
+                break
+            job.wait(0.05)
+        self.assertEqual(job.status, "running")
+        self.assertEqual(follow(corpus, "file", job, followed), 2)
+        self.assertIn("file", corpus)
+
+        source.gate.set()
+        self.assertTrue(job.wait(5))
+        self.assertEqual(job.status, "done")
+        self.assertEqual(follow(corpus, "file", job, followed), 4)
+        self.assertEqual(follow(corpus, "file", job, followed), 0)
+        # The batches of the finished document are searched as one segment
+        self.assertEqual(len(corpus.search_segments()), 1)
+        self.assertEqual(len(corpus.search_segments()[0]), 6)
+        texts = {node.get_content() for node in corpus.index.docstore.docs.values()}
+        self.assertIn("Figure: HbA1c by treatment arm", texts)
+        self.assertEqual(job.progress(), 1.0)
+
+        # A new process finds the finished index in the store and publishes it whole
+        queue = IngestionQueue(self.store, workers=1)
+        reloaded = queue.submit(b"%PDF one", "test.pdf", GatedSource(), index_config())
+        self.assertTrue(reloaded.wait(5))
+        queue.shutdown()
+        self.assertEqual(len(reloaded.batches()), 1)
+        self.assertEqual(follow(corpus, "file", reloaded, followed), 6)
+        self.assertEqual(len(corpus.index.index_struct.nodes_dict), 6)
+
+    def test_deduplicates_by_file_and_config(self):
+        source = GatedSource()
+        source.gate.set()
+        first = self.queue.submit(b"%PDF one", "test.pdf", source, index_config())
+        second = self.queue.submit(b"%PDF one", "copy.pdf", source, index_config())
+        self.assertIs(first, second)
+        self.assertTrue(first.wait(5))
+        self.assertEqual(source.calls, 1)
+        other = self.queue.submit(b"%PDF one", "test.pdf", source, index_config(include_vision=False))
+        self.assertIsNot(other, first)
+
+    def test_failure_and_retry(self):
+        def broken(progress):
+            raise ValueError("not a PDF")
+            yield
+        job = self.queue.submit(b"bad", "bad.pdf", broken, index_config())
+        self.assertTrue(job.wait(5))
+        self.assertEqual((job.status, job.error), ("failed", "not a PDF"))
+        self.assertIs(self.queue.submit(b"bad", "bad.pdf", broken, index_config()), job)
+        self.assertIsNot(self.queue.submit(b"bad", "bad.pdf", broken, index_config(), retry=True), job)
+
+    def test_keeps_only_recent_finished_jobs(self):
+        self.queue.max_finished = 2
+        for i in range(4):
+            source = GatedSource()
+            source.gate.set()
+            self.queue.submit(f"%PDF {i}".encode(), "test.pdf", source, index_config()).wait(5)
+        self.assertEqual(len(self.queue.jobs()), 2)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,83 @@
+import threading
+import time
+import unittest
+import numpy as np
+from llama_index.core.schema import NodeWithScore, QueryBundle, TextNode
+from models import ModelRegistry
+from reranker import AdaptiveRerank
+
+class CountingFactory:
+    """Makes a scorer after ``delay`` seconds, counting how often it is called."""
+
+    def __init__(self, delay=0.0, fail=False):
+        self.delay = delay
+        self.fail = fail
+        self.calls = 0
+
+    def __call__(self):
+        self.calls += 1
+        time.sleep(self.delay)
+        if self.fail:
+            raise OSError("model download failed")
+        return lambda pairs: np.ones(len(pairs), dtype=np.float32)
+
+class TestModelRegistry(unittest.TestCase):
+    def setUp(self):
+        self.registry = ModelRegistry()
+
+    def test_concurrent_callers_share_one_load(self):
+        factory = CountingFactory(delay=0.1)
+        self.registry.register("reranker", factory)
+        models = []
+        threads = [threading.Thread(target=lambda: models.append(self.registry.get("reranker"))) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(factory.calls, 1)
+        self.assertTrue(all(model is models[0] for model in models))
+        self.assertGreaterEqual(self.registry.load_seconds["reranker"], 0.1)
+
+    def test_warm_up_loads_in_the_background(self):
+        factory = CountingFactory(delay=0.1)
+        self.registry.register("embedder", factory)
+        start = time.perf_counter()
+        thread = self.registry.warm_up()
+        self.assertLess(time.perf_counter() - start, 0.1)
+        self.assertEqual(self.registry.pending(), ["embedder"])
+        thread.join()
+        self.assertEqual(self.registry.pending(), [])
+        self.registry.get("embedder")
+        self.assertEqual(factory.calls, 1)
+
+    def test_registering_again_keeps_the_model_unless_replaced(self):
+        first, second = CountingFactory(), CountingFactory()
+        self.registry.register("embedder", first)
+        model = self.registry.get("embedder")
+        self.registry.register("embedder", second)
+        self.assertIs(self.registry.get("embedder"), model)
+        self.registry.register("embedder", second, replace=True)
+        self.assertIsNot(self.registry.get("embedder"), model)
+        self.assertEqual((first.calls, second.calls), (1, 1))
+
+    def test_failed_loads_are_retried(self):
+        factory = CountingFactory(fail=True)
+        self.registry.register("reranker", factory)
+        self.registry.warm_up().join()
+        self.assertIn("download failed", self.registry.stats()["errors"]["reranker"])
+        with self.assertRaises(OSError):
+            self.registry.get("reranker")
+        self.assertEqual(factory.calls, 2)
+        with self.assertRaises(KeyError):
+            self.registry.get("unknown")
+
+    def test_lazy_scorer_load_is_not_taken_for_scoring_cost(self):
+        self.registry.register("reranker", CountingFactory(delay=0.2))
+        rerank = AdaptiveRerank(self.registry.lazy("reranker"), top_n=3, latency_budget=0.05)
+        candidates = [NodeWithScore(node=TextNode(text=f"passage {i}", id_=f"n{i}"), score=0.5) for i in range(8)]
+        rerank.postprocess_nodes(candidates, QueryBundle("passage"))
+        # Had the load counted, the budget would only fit the minimum number of candidates
+        self.assertEqual(rerank.candidate_count(8), 8)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,54 @@
+import os
+import tempfile
+import threading
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+from image_store import ImageStore
+from pdf_extraction import iter_pdf_pages
+from benchmarks.synthetic_pdf import make_pdf
+
+class TestPdfExtraction(unittest.TestCase):
+    def setUp(self):
+        self.pdf_bytes = make_pdf(10, images_per_page=1, distinct_images=3)
+        self.tmp = tempfile.TemporaryDirectory()
+        self.image_store = ImageStore(self.tmp.name)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_single_process(self):
+        progress = []
+        pages = list(iter_pdf_pages(self.pdf_bytes, self.image_store, workers=1, pages_per_shard=4, progress=lambda done, total: progress.append((done, total))))
+        self.assertEqual([page for page, _, _ in pages], list(range(10)))
+        self.assertIn("metformin", pages[0][1])
+        self.assertTrue(all(len(images) == 1 for _, _, images in pages))
+        self.assertEqual(progress, [(4, 10), (8, 10), (10, 10)])
+
+    def test_images_stored_once_in_original_encoding(self):
+        refs = {ref for _, _, images in iter_pdf_pages(self.pdf_bytes, self.image_store, workers=1) for ref in images}
+        self.assertEqual(len(refs), 3)
+        for ref in refs:
+            self.assertTrue(ref.endswith(".jpeg"))
+            self.assertTrue(self.image_store.get(ref).startswith(b"\xff\xd8\xff"))
+
+    def test_sharded_matches_single_process(self):
+        single = list(iter_pdf_pages(self.pdf_bytes, self.image_store, workers=1))
+        sharded = list(iter_pdf_pages(self.pdf_bytes, self.image_store, workers=2, pages_per_shard=3))
+        self.assertEqual(sharded, single)
+
+    def test_concurrent_puts_of_one_image(self):
+        # Large enough that the writers overlap, as ingestion workers extracting a shared figure do
+        image = b"\xff\xd8\xff" + os.urandom(8 * 1024 * 1024)
+        barrier = threading.Barrier(8)
+        def put(_):
+            barrier.wait()
+            return self.image_store.put(image, "jpeg")
+        with ThreadPoolExecutor(max_workers=8) as pool:
+            refs = set(pool.map(put, range(8)))
+        self.assertEqual(len(refs), 1)
+        self.assertEqual(self.image_store.get(refs.pop()), image)
+        self.assertEqual([name for _, _, names in os.walk(self.image_store.root) for name in names
+                          if name.endswith(".tmp")], [])
+
+if __name__ == '__main__':
+    unittest.main()
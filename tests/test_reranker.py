@@ -0,0 +1,79 @@
+import unittest
+import numpy as np
+from llama_index.core.schema import NodeWithScore, QueryBundle, TextNode
+from reranker import AdaptiveRerank, passage_windows
+
+class FakeScorer:
+    """Scores a pair by how many query words the passage contains, recording every batch."""
+
+    def __init__(self):
+        self.batches = []
+
+    def __call__(self, pairs):
+        self.batches.append(list(pairs))
+        return np.array([sum(w in passage.lower() for w in query.lower().split()) / 10 for query, passage in pairs],
+                        dtype=np.float32)
+
+def nodes(texts, scores=None):
+    scores = scores or [0.5] * len(texts)
+    return [NodeWithScore(node=TextNode(text=text, id_=f"n{i}"), score=score) for i, (text, score) in enumerate(zip(texts, scores))]
+
+TEXTS = ["metformin dose is 500 mg", "warfarin needs INR checks", "metformin renal dose", "statins and lipids"]
+
+class TestAdaptiveRerank(unittest.TestCase):
+    def setUp(self):
+        self.scorer = FakeScorer()
+        self.rerank = AdaptiveRerank(self.scorer, top_n=3, min_top_n=1, relative_cutoff=0.5)
+
+    def rerank_texts(self, query, candidates):
+        return [n.node.get_content() for n in self.rerank.postprocess_nodes(candidates, QueryBundle(query))]
+
+    def test_single_batch_and_dynamic_top_n(self):
+        self.assertEqual(self.rerank_texts("metformin dose", nodes(TEXTS)), ["metformin dose is 500 mg", "metformin renal dose"])
+        self.assertEqual(len(self.scorer.batches), 1)
+        self.assertEqual(len(self.scorer.batches[0]), 4)
+
+    def test_scores_are_cached_per_query_and_node(self):
+        self.rerank_texts("metformin dose", nodes(TEXTS))
+        self.rerank_texts("Metformin  dose", nodes(TEXTS + ["metformin dose for children"]))
+        self.assertEqual(len(self.scorer.batches), 2)
+        self.assertEqual([passage for _, passage in self.scorer.batches[1]], ["metformin dose for children"])
+        self.assertEqual(self.rerank.stats()["cache_hits"], 4)
+
+    def test_clear_margin_skips_reranking(self):
+        result = self.rerank_texts("metformin dose", nodes(TEXTS, [0.2, 0.9, 0.3, 0.1]))
+        self.assertEqual(self.scorer.batches, [])
+        self.assertEqual(result, ["warfarin needs INR checks", "metformin renal dose", "metformin dose is 500 mg"])
+        self.assertEqual(self.rerank.stats()["skipped"], 1)
+
+    def test_skip_uses_vector_similarity_over_fused_scores(self):
+        candidates = nodes(TEXTS, [0.9, 0.2, 0.1, 0.1])
+        for node, similarity in zip(candidates, [0.82, 0.80, 0.5, 0.4]):
+            node.node.metadata["vector_score"] = similarity
+        self.rerank_texts("metformin dose", candidates)
+        self.assertEqual(len(self.scorer.batches), 1)
+
+    def test_long_passages_score_as_best_window(self):
+        long_text = " ".join(["unrelated filler text"] * 300 + ["metformin dose"])
+        windows = passage_windows(long_text, 128)
+        self.assertGreater(len(windows), 1)
+        self.assertIn("metformin dose", windows[-1])
+        result = self.rerank.postprocess_nodes(nodes([long_text, "statins"]), QueryBundle("metformin dose"))
+        self.assertEqual(result[0].node.node_id, "n0")
+        self.assertAlmostEqual(result[0].score, 0.2)
+
+    def test_top_k_fits_latency_budget(self):
+        self.rerank._seconds_per_pair = 0.1
+        self.rerank.latency_budget = 0.2
+        self.rerank.min_top_k = 1
+        self.rerank_texts("metformin dose", nodes(TEXTS))
+        self.assertEqual(len(self.scorer.batches[0]), 2)
+
+    def test_latency_metric(self):
+        self.rerank_texts("metformin dose", nodes(TEXTS))
+        stats = self.rerank.stats()
+        self.assertEqual(stats["reranks"], 1)
+        self.assertIsNotNone(stats["p95_latency"])
+
+if __name__ == '__main__':
+    unittest.main()
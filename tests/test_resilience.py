@@ -0,0 +1,167 @@
+import asyncio
+import time
+import unittest
+from claude_llm import Claude, _async_clients, run_async, shared_client
+from resilience import AdmissionLimiter, CircuitBreaker, CircuitOpenError, ResiliencePolicy, ServiceBusyError
+from benchmarks.fake_anthropic import FakeAnthropicServer
+
+MODEL = "claude-3-5-sonnet-20240620"
+
+class TestResilience(unittest.TestCase):
+    def setUp(self):
+        self.server = FakeAnthropicServer(reply="Metformin is the usual first-line therapy.",
+                                          first_token_latency=0, token_interval=0).start()
+
+    def tearDown(self):
+        self.server.stop()
+
+    def claude(self, **policy_kwargs):
+        policy = ResiliencePolicy(base_delay=0.01, **policy_kwargs)
+        return Claude(MODEL, "mock_api_key", base_url=self.server.base_url, policy=policy)
+
+    def test_instances_share_pooled_client(self):
+        first, second = self.claude(), self.claude()
+        self.assertIs(first.client, second.client)
+        self.assertIs(first.client, shared_client("mock_api_key", self.server.base_url))
+
+    def test_retries_rate_limit_and_overload(self):
+        claude_instance = self.claude()
+        self.server.fail_next(429, 529)
+        self.assertEqual(claude_instance.complete("How is diabetes treated?"), self.server.reply)
+        self.assertEqual(len(self.server.requests), 3)
+        self.assertEqual(claude_instance.policy.retries, 2)
+
+    def test_honours_retry_after(self):
+        self.server.retry_after = 0.3
+        self.server.fail_next(429)
+        start = time.perf_counter()
+        self.claude().complete("How is diabetes treated?")
+        self.assertGreaterEqual(time.perf_counter() - start, 0.3)
+
+    def test_stream_retries_before_first_token(self):
+        self.server.fail_next(529)
+        chunks = list(self.claude().stream_complete("How is diabetes treated?"))
+        self.assertEqual("".join(chunks), self.server.reply)
+
+    def test_circuit_breaker_fails_fast(self):
+        claude_instance = self.claude(max_retries=1, breaker=CircuitBreaker(failure_threshold=2, reset_timeout=0.2))
+        self.server.fail_next(529, 529)
+        self.assertEqual(claude_instance.complete("How is diabetes treated?"), "")
+        self.assertEqual(claude_instance.policy.breaker.state, "open")
+        self.assertEqual(claude_instance.complete("How is diabetes treated?"), "")
+        self.assertEqual(len(self.server.requests), 2)
+        time.sleep(0.2)
+        self.assertEqual(claude_instance.complete("How is diabetes treated?"), self.server.reply)
+        self.assertEqual(claude_instance.policy.breaker.state, "closed")
+
+    def test_breaker_reopens_after_failed_trial(self):
+        breaker = CircuitBreaker(failure_threshold=1, reset_timeout=0.05)
+        breaker.record_failure()
+        time.sleep(0.05)
+        breaker.before_call()
+        with self.assertRaises(CircuitOpenError):
+            breaker.before_call()
+        breaker.record_failure()
+        self.assertEqual(breaker.state, "open")
+
+    def open_circuit(self):
+        claude_instance = self.claude(max_retries=0, breaker=CircuitBreaker(failure_threshold=1, reset_timeout=0.05))
+        self.server.fail_next(429)
+        self.assertEqual(claude_instance.complete("How is diabetes treated?"), "")
+        time.sleep(0.05)
+        self.assertEqual(claude_instance.policy.breaker.state, "half-open")
+        return claude_instance
+
+    def test_half_open_trial_with_client_error_closes_the_circuit(self):
+        claude_instance = self.open_circuit()
+        self.server.fail_next(400)
+        self.assertEqual(claude_instance.complete("How is diabetes treated?"), "")
+        self.assertEqual(claude_instance.policy.breaker.state, "closed")
+        self.assertEqual(claude_instance.complete("How is diabetes treated?"), self.server.reply)
+
+    def test_abandoned_half_open_stream_releases_the_trial(self):
+        claude_instance = self.open_circuit()
+        stream = claude_instance.stream_complete("How is diabetes treated?")
+        next(stream)
+        stream.close()
+        self.assertEqual(claude_instance.policy.breaker.state, "half-open")
+        self.assertEqual(claude_instance.complete("How is diabetes treated?"), self.server.reply)
+        self.assertEqual(claude_instance.policy.breaker.state, "closed")
+
+    def _warm(self, policy, seconds=0.01, count=20):
+        for _ in range(count):
+            policy.latency.record(seconds)
+
+    def test_hedges_slow_request(self):
+        claude_instance = self.claude(hedge=True, min_hedge_delay=0.05)
+        self._warm(claude_instance.policy)
+        self.server.delay_next(2.0)
+        start = time.perf_counter()
+        self.assertEqual(claude_instance.complete("How is diabetes treated?"), self.server.reply)
+        self.assertLess(time.perf_counter() - start, 1.0)
+        self.assertEqual(claude_instance.policy.hedges, 1)
+        self.assertEqual(len(self.server.requests), 2)
+
+    def test_async_hedges_slow_request(self):
+        claude_instance = self.claude(hedge=True, min_hedge_delay=0.05)
+        self._warm(claude_instance.policy)
+        self.server.delay_next(2.0)
+        start = time.perf_counter()
+        self.assertEqual(asyncio.run(claude_instance.acomplete("How is diabetes treated?")), self.server.reply)
+        self.assertLess(time.perf_counter() - start, 1.0)
+        self.assertEqual(claude_instance.policy.hedges, 1)
+
+    def failing_first(self):
+        calls = []
+        def attempt():
+            calls.append(None)
+            if len(calls) == 1:
+                time.sleep(0.1)
+                raise ValueError("first attempt failed")
+            time.sleep(0.2)
+            return "hedged"
+        return attempt
+
+    def test_hedge_outlives_a_failed_first_attempt(self):
+        policy = ResiliencePolicy(hedge=True, min_hedge_delay=0.05, max_retries=0)
+        self._warm(policy)
+        self.assertEqual(policy.call(self.failing_first()), "hedged")
+
+    def test_async_hedge_outlives_a_failed_first_attempt(self):
+        policy = ResiliencePolicy(hedge=True, min_hedge_delay=0.05, max_retries=0)
+        self._warm(policy)
+        attempt = self.failing_first()
+        async def fn():
+            return await asyncio.to_thread(attempt)
+        self.assertEqual(asyncio.run(policy.acall(fn)), "hedged")
+
+    def test_async_client_survives_new_event_loops(self):
+        claude_instance = self.claude()
+        for _ in range(2):
+            self.assertEqual(asyncio.run(claude_instance.acomplete("How is diabetes treated?")), self.server.reply)
+
+    def test_run_async_closes_the_clients_of_its_loop(self):
+        claude_instance = self.claude()
+        loops, clients = [], []
+        async def ask():
+            loops.append(asyncio.get_running_loop())
+            clients.append(claude_instance.async_client)
+            return await claude_instance.acomplete("How is diabetes treated?")
+        for _ in range(3):
+            self.assertEqual(run_async(ask()), self.server.reply)
+        self.assertFalse(any(loop in _async_clients for loop in loops))
+        self.assertTrue(all(client.is_closed() for client in clients))
+
+class TestAdmissionLimiter(unittest.TestCase):
+    def test_rejects_beyond_limit_and_frees_slots(self):
+        limiter = AdmissionLimiter(max_in_flight=2)
+        with limiter.admit(), limiter.admit():
+            with self.assertRaises(ServiceBusyError):
+                with limiter.admit():
+                    pass
+        with limiter.admit():
+            pass
+        self.assertEqual(limiter.stats(), {"in_flight": 0, "admitted": 3, "rejected": 1})
+
+if __name__ == '__main__':
+    unittest.main()
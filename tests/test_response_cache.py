@@ -0,0 +1,94 @@
+import tempfile
+import time
+import unittest
+import os
+from claude_llm import Claude
+from response_cache import ResponseCache
+from benchmarks.fake_anthropic import FakeAnthropicServer
+from benchmarks.stubs import HashingEmbedding
+
+GUIDELINE = " ".join(
+    ["Metformin is first-line therapy for type 2 diabetes. The maximum daily dose is 2550 mg per day in divided doses.",
+     "Avoid metformin if eGFR is below 30. Metformin may be continued in pregnancy under specialist care."] * 10)
+
+def bag_of_words(text):
+    # Toy embedding where synonyms share a dimension
+    concepts = {"metformin": 0, "dose": 1, "dosage": 1, "starting": 2, "initial": 2, "side": 3, "effects": 3}
+    vector = [0.0] * 4
+    for word in text.lower().replace("?", "").split():
+        if word in concepts:
+            vector[concepts[word]] += 1
+    return vector
+
+class TestResponseCache(unittest.TestCase):
+    def test_exact_hit_ignores_whitespace_and_case(self):
+        cache = ResponseCache()
+        cache.put("model", "What is the  metformin dose?", {}, "500 mg", latency=1.5)
+        self.assertEqual(cache.get("model", "what is the metformin dose? ", {}), "500 mg")
+        self.assertIsNone(cache.get("model", "What is the metformin dose?", {"temperature": 0}))
+        self.assertIsNone(cache.get("other-model", "What is the metformin dose?", {}))
+        self.assertEqual(cache.stats.exact_hits, 1)
+        self.assertEqual(cache.stats.misses, 2)
+        self.assertEqual(cache.stats.latency_saved, 1.5)
+
+    def test_ttl_and_memory_cap(self):
+        cache = ResponseCache(ttl=0.05, max_bytes=300)
+        cache.put("model", "first", {}, "x" * 100)
+        cache.put("model", "second", {}, "y" * 100)
+        cache.put("model", "third", {}, "z" * 100)
+        self.assertIsNone(cache.get("model", "first", {}))
+        self.assertIsNotNone(cache.get("model", "third", {}))
+        time.sleep(0.06)
+        self.assertIsNone(cache.get("model", "third", {}))
+
+    def test_semantic_hit_within_scope(self):
+        cache = ResponseCache(embed_fn=bag_of_words, similarity_threshold=0.9)
+        cache.put("model", [{"role": "user", "content": "metformin starting dose"}], {}, "500 mg")
+        self.assertEqual(cache.get("model", [{"role": "user", "content": "initial metformin dosage?"}], {}), "500 mg")
+        self.assertIsNone(cache.get("model", [{"role": "user", "content": "metformin side effects"}], {}))
+        earlier = [{"role": "user", "content": "hi"}, {"role": "assistant", "content": "hello"}]
+        self.assertIsNone(cache.get("model", earlier + [{"role": "user", "content": "metformin starting dose"}], {}))
+        self.assertEqual(cache.stats.semantic_hits, 1)
+
+    def test_putting_a_prompt_again_replaces_its_semantic_entry(self):
+        cache = ResponseCache(embed_fn=bag_of_words, similarity_threshold=0.9)
+        for response in ["500 mg", "500 mg once daily"]:
+            cache.put("model", "metformin starting dose", {}, response)
+        self.assertEqual(len(cache._semantic), 1)
+        self.assertEqual(cache.get("model", "initial metformin dosage", {}), "500 mg once daily")
+
+    def test_questions_over_the_same_context_are_told_apart(self):
+        # The shape of a RAG turn: this turn's retrieved context, then the question, as separate blocks
+        context = {"type": "text", "text": "Context information for this question is below.\n" + GUIDELINE}
+        def turn(question, context=context):
+            return [{"role": "user", "content": [context, {"type": "text", "text": question}]}]
+        cache = ResponseCache(embed_fn=HashingEmbedding().get_query_embedding, similarity_threshold=0.95)
+        cache.put("model", turn("What is the maximum daily dose of metformin?"), {}, "2550 mg per day")
+        self.assertIsNone(cache.get("model", turn("Is it safe in pregnancy?"), {}))
+        self.assertEqual(cache.get("model", turn("what is the maximum daily dose of metformin"), {}), "2550 mg per day")
+        other = {"type": "text", "text": "Context information for this question is below.\nWarfarin needs INR checks."}
+        self.assertIsNone(cache.get("model", turn("What is the maximum daily dose of metformin?", other), {}))
+
+    def test_persistent_layer(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            db_path = os.path.join(tmp, "responses.sqlite3")
+            ResponseCache(db_path=db_path, embed_fn=bag_of_words).put("model", "metformin starting dose", {}, "500 mg")
+            reopened = ResponseCache(db_path=db_path, embed_fn=bag_of_words)
+            self.assertEqual(reopened.get("model", "metformin starting dose", {}), "500 mg")
+            self.assertEqual(reopened.get("model", "initial metformin dosage", {}), "500 mg")
+            self.assertEqual(reopened.stats.persistent_hits, 1)
+            self.assertEqual(reopened.stats.semantic_hits, 1)
+
+    def test_claude_skips_api_on_hit(self):
+        with FakeAnthropicServer(reply="500 mg once daily.", first_token_latency=0, token_interval=0) as server:
+            claude_instance = Claude("claude-3-5-sonnet-20240620", "mock_api_key", base_url=server.base_url,
+                                     response_cache=ResponseCache())
+            self.assertEqual(claude_instance.complete("Metformin dose?"), "500 mg once daily.")
+            self.assertEqual("".join(claude_instance.stream_complete("Metformin dose?")), "500 mg once daily.")
+            self.assertEqual(len(server.requests), 1)
+            "".join(claude_instance.stream_chat([{"role": "user", "content": "Side effects?"}]))
+            self.assertEqual(claude_instance.chat([{"role": "user", "content": "side effects?"}]), "500 mg once daily.")
+            self.assertEqual(len(server.requests), 2)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,220 @@
+import asyncio
+import json
+import tempfile
+import threading
+import unittest
+from aiohttp.test_utils import TestClient, TestServer
+from benchmarks.fake_anthropic import FakeAnthropicServer
+from benchmarks.stubs import HashingEmbedding, block_text, healthcare_responder
+from benchmarks.synthetic_pdf import make_guideline_pdf, make_pdf
+from image_store import ImageStore
+from resilience import CircuitOpenError, ServiceBusyError
+from server import make_app
+from service import RAGService, ServiceConfig, UnknownDocumentError
+import tracing
+
+REPLY = "The maximum daily dose of metformin is in the guideline."
+
+class ServiceTestCase(unittest.IsolatedAsyncioTestCase):
+    config = ServiceConfig(ingest_batch=2)
+
+    def setUp(self):
+        self.anthropic = FakeAnthropicServer(reply=REPLY, first_token_latency=0, token_interval=0).start()
+        self.tmp = tempfile.TemporaryDirectory()
+        self.service = RAGService(self.config, HashingEmbedding(), image_store=ImageStore(self.tmp.name),
+                                  api_key="mock_api_key", base_url=self.anthropic.base_url)
+        self.guideline, self.qa = make_guideline_pdf(drugs=6)
+
+    def tearDown(self):
+        self.service.shutdown()
+        self.anthropic.stop()
+        self.tmp.cleanup()
+
+    def ingest(self, pdf_bytes, source):
+        job = self.service.ingest(pdf_bytes, source)
+        self.assertTrue(job.wait(10))
+        self.assertEqual(job.status, "done")
+        return job.key
+
+class TestRAGService(ServiceTestCase):
+    async def test_query_answers_from_retrieved_context(self):
+        self.ingest(self.guideline, "guideline.pdf")
+        question, answer = self.qa[0]
+        result = await self.service.aquery(question, analyze=False)
+        self.assertEqual(result["answer"], REPLY)
+        self.assertEqual({source["source"] for source in result["sources"]}, {"guideline.pdf"})
+        system = " ".join(block["text"] for block in self.anthropic.requests[-1]["system"])
+        self.assertIn(answer, system)
+        self.assertTrue(block_text(self.anthropic.requests[-1]["messages"][-1]["content"]).endswith(question))
+
+    async def test_later_turns_read_the_stable_prefix_from_the_cache(self):
+        self.ingest(self.guideline, "guideline.pdf")
+        history = []
+        for question, _ in self.qa[:3]:
+            result = await self.service.aquery(question, history=history, analyze=False)
+            history += [{"role": "user", "content": question}, {"role": "assistant", "content": result["answer"]}]
+        first, *later = self.anthropic.requests
+        # The pinned context stays first; each turn's own context and question come last
+        self.assertTrue(all(request["system"] == first["system"] for request in later))
+        self.assertTrue(block_text(later[-1]["messages"][-1]["content"]).endswith(self.qa[2][0]))
+        tokens = self.service.stats()["tokens"]
+        self.assertGreater(tokens["cache_creation_input_tokens"], 0)
+        self.assertGreater(tokens["cache_read_input_tokens"], tokens["input_tokens"])
+
+    async def test_turn_context_and_question_are_separate_blocks(self):
+        self.service.config = ServiceConfig(ingest_batch=2, pinned_tokens=50)
+        self.ingest(self.guideline, "guideline.pdf")
+        question = self.qa[0][0]
+        await self.service.aquery(question, analyze=False)
+        context, last = self.anthropic.requests[-1]["messages"][-1]["content"]
+        self.assertIn("Context information", context["text"])
+        # The response cache compares the question alone, not the context around it
+        self.assertEqual(last["text"], question)
+
+    async def test_prompt_cache_can_be_disabled(self):
+        self.service.config = ServiceConfig(ingest_batch=2, prompt_cache=False)
+        self.ingest(self.guideline, "guideline.pdf")
+        question, answer = self.qa[0]
+        await self.service.aquery(question, analyze=False)
+        request = self.anthropic.requests[-1]
+        self.assertIsInstance(request["system"], str)
+        self.assertIn(answer, request["system"])
+        self.assertEqual(request["messages"][-1], {"role": "user", "content": question})
+
+    async def test_analysis_describes_the_answer_given(self):
+        self.anthropic.responder = healthcare_responder
+        self.ingest(self.guideline, "guideline.pdf")
+        question = self.qa[0][0]
+        result = await self.service.aquery(question)
+        self.assertEqual(result["category"], "treatment")
+        self.assertEqual(len(result["key_points"]), 2)
+        # The streamed answer, then the category and one structured request about that answer
+        self.assertEqual(len(self.anthropic.requests), 3)
+        analysed = [request for request in self.anthropic.requests if "system" in request
+                    and result["answer"] in " ".join(block["text"] for block in request["system"])]
+        self.assertEqual(len(analysed), 1)
+
+    async def test_query_is_traced_end_to_end(self):
+        self.ingest(self.guideline, "guideline.pdf")
+        result = await self.service.aquery(self.qa[0][0], analyze=False)
+        spans = {span.name: span for span in tracing.tracer.trace(result["trace_id"])}
+        for name in ("query", "answer", "prepare", "retrieve", "pack_context", "llm.stream_chat"):
+            self.assertIn(name, spans)
+        # Retrieval runs on the query pool but stays in the query's trace
+        self.assertEqual(spans["prepare"].parent_id, spans["answer"].span_id)
+        self.assertGreater(spans["llm.stream_chat"].attributes["output_tokens"], 0)
+
+    async def test_blocking_stream_retrieves_on_the_query_pool(self):
+        self.ingest(self.guideline, "guideline.pdf")
+        threads = []
+        retrieve = self.service.retrieve
+        def recording_retrieve(*args):
+            threads.append(threading.current_thread().name)
+            return retrieve(*args)
+        self.service.retrieve = recording_retrieve
+        answer = await asyncio.to_thread(lambda: "".join(self.service.stream_chat(self.qa[0][0])))
+        self.assertEqual(answer, REPLY)
+        self.assertTrue(threads[0].startswith("query"))
+
+    async def test_query_searches_only_named_documents(self):
+        self.ingest(self.guideline, "guideline.pdf")
+        other = self.ingest(make_pdf(2), "other.pdf")
+        result = await self.service.aquery(self.qa[0][0], document_ids=[other], analyze=False)
+        self.assertEqual({source["source"] for source in result["sources"]}, {"other.pdf"})
+        with self.assertRaises(UnknownDocumentError):
+            await self.service.aquery(self.qa[0][0], document_ids=["missing"], analyze=False)
+
+    async def test_same_upload_is_one_document(self):
+        first = self.ingest(self.guideline, "guideline.pdf")
+        self.assertEqual(self.ingest(self.guideline, "copy.pdf"), first)
+        self.assertEqual([document["key"] for document in self.service.documents()], [first])
+        self.assertTrue(self.service.remove(first))
+        self.assertEqual(self.service.documents(), [])
+
+    async def test_removing_a_document_unpins_only_its_conversations(self):
+        guideline = self.ingest(self.guideline, "guideline.pdf")
+        other = self.ingest(make_pdf(2), "other.pdf")
+        await self.service.aquery(self.qa[0][0], document_ids=[guideline], analyze=False)
+        await self.service.aquery(self.qa[1][0], document_ids=[other], analyze=False)
+        self.assertEqual(len(self.service._pinned), 2)
+        self.assertTrue(self.service.remove(other))
+        [pinned] = self.service._pinned.values()
+        self.assertEqual({node.node.metadata["source"] for node in pinned}, {"guideline.pdf"})
+
+    async def test_refuses_queries_beyond_the_limit(self):
+        self.service.limiter.max_in_flight = 1
+        self.anthropic.first_token_latency = 0.5
+        self.ingest(self.guideline, "guideline.pdf")
+        running = asyncio.create_task(self.service.aquery(self.qa[0][0], analyze=False))
+        while not self.service.limiter.in_flight:
+            await asyncio.sleep(0.01)
+        with self.assertRaises(ServiceBusyError):
+            await self.service.aquery(self.qa[1][0], analyze=False)
+        self.assertEqual((await running)["answer"], REPLY)
+        self.assertEqual(self.service.stats()["rejected"], 1)
+
+class TestHTTPServer(ServiceTestCase):
+    async def asyncSetUp(self):
+        self.client = TestClient(TestServer(make_app(self.service)))
+        await self.client.start_server()
+
+    async def asyncTearDown(self):
+        await self.client.close()
+
+    async def test_ingest_then_stream_an_answer(self):
+        response = await self.client.post("/documents?source=guideline.pdf", data=self.guideline)
+        self.assertEqual(response.status, 202)
+        key = (await response.json())["key"]
+        while (await (await self.client.get(f"/documents/{key}")).json())["status"] != "done":
+            await asyncio.sleep(0.05)
+
+        response = await self.client.post("/query/stream", json={"question": self.qa[0][0], "document_ids": [key]})
+        self.assertEqual(response.status, 200)
+        events = [block.split("\n") for block in (await response.text()).strip().split("\n\n")]
+        names = [event[0].removeprefix("event: ") for event in events]
+        self.assertEqual((names[0], names[-1]), ("sources", "done"))
+        self.assertEqual("".join(json.loads(event[1].removeprefix("data: ")) for event in events if event[0] == "event: delta"), REPLY)
+
+    async def test_errors_map_to_status_codes(self):
+        response = await self.client.post("/query", json={"question": "dose?", "document_ids": ["missing"]})
+        self.assertEqual(response.status, 404)
+        self.assertEqual((await self.client.post("/query", json={})).status, 400)
+        self.assertEqual((await self.client.get("/documents/missing")).status, 404)
+        self.service.limiter.max_in_flight = 0
+        response = await self.client.post("/query", json={"question": "dose?"})
+        self.assertEqual(response.status, 503)
+        self.assertEqual(response.headers["Retry-After"], "1")
+
+    async def test_failure_mid_answer_ends_the_stream_with_an_error_event(self):
+        async def failing_stream(question, **kwargs):
+            yield "Metformin "
+            raise CircuitOpenError("Claude API circuit is open")
+        self.service.astream_chat = failing_stream
+        response = await self.client.post("/query/stream", json={"question": "dose?"})
+        self.assertEqual(response.status, 200)
+        events = [block.split("\n") for block in (await response.text()).strip().split("\n\n")]
+        self.assertEqual([event[0] for event in events], ["event: sources", "event: delta", "event: error"])
+        self.assertEqual(json.loads(events[-1][1].removeprefix("data: "))["status"], 503)
+
+    async def test_other_key_errors_are_server_errors(self):
+        def broken_retrieve(*args):
+            raise KeyError("page")
+        self.service.retrieve = broken_retrieve
+        response = await self.client.post("/query", json={"question": "dose?", "analyze": False})
+        self.assertEqual(response.status, 500)
+
+    async def test_claude_failures_map_to_status_codes(self):
+        self.ingest(self.guideline, "guideline.pdf")
+        self.anthropic.fail_next(400)
+        response = await self.client.post("/query", json={"question": self.qa[0][0], "analyze": False})
+        self.assertEqual(response.status, 502)
+        breaker = self.service.claude().policy.breaker
+        for _ in range(breaker.failure_threshold):
+            breaker.record_failure()
+        for path in ("/query", "/query/stream"):
+            response = await self.client.post(path, json={"question": self.qa[0][0]})
+            self.assertEqual(response.status, 503)
+            self.assertEqual(response.headers["Retry-After"], "5")
+
+if __name__ == '__main__':
+    unittest.main()
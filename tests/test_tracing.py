@@ -0,0 +1,122 @@
+import asyncio
+import json
+import os
+import tempfile
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+from claude_llm import Claude
+from healthcare_utils import aprocess_healthcare_query
+from resilience import ResiliencePolicy
+from benchmarks.fake_anthropic import FakeAnthropicServer
+# The tracer the pipeline records to: rag modules import each other as top-level modules
+import tracing
+
+MODEL = "claude-3-5-sonnet-20240620"
+
+class TestSpans(unittest.TestCase):
+    def test_spans_nest_and_record_errors(self):
+        with tracing.span("turn") as turn:
+            with tracing.span("retrieve", top_k=5) as retrieve:
+                tracing.add("cache_hits", 2)
+                tracing.add("cache_hits")
+            with self.assertRaises(ValueError):
+                with tracing.span("rerank"):
+                    raise ValueError("boom")
+        self.assertIsNone(tracing.current_span())
+        spans = {span.name: span for span in tracing.tracer.trace(turn.trace_id)}
+        self.assertEqual(set(spans), {"turn", "retrieve", "rerank"})
+        self.assertEqual(retrieve.parent_id, turn.span_id)
+        self.assertEqual(retrieve.attributes, {"top_k": 5, "cache_hits": 3})
+        self.assertEqual(spans["rerank"].error, "ValueError")
+        self.assertGreaterEqual(turn.duration, retrieve.duration)
+
+    def test_propagate_carries_the_parent_into_threads(self):
+        with ThreadPoolExecutor(max_workers=1) as pool, tracing.span("ingest") as root:
+            def work():
+                with tracing.span("caption") as span:
+                    return span
+            inherited = pool.submit(tracing.propagate(work)).result()
+            detached = pool.submit(work).result()
+        self.assertEqual(inherited.parent_id, root.span_id)
+        self.assertIsNone(detached.parent_id)
+
+    def test_waterfall_offsets_and_depths(self):
+        with tracing.span("turn") as turn:
+            with tracing.span("retrieve"):
+                pass
+        rows = tracing.waterfall(tracing.tracer.trace(turn.trace_id))
+        self.assertEqual([(row["span"], row["depth"]) for row in rows], [("turn", 0), ("retrieve", 1)])
+        self.assertEqual(rows[0]["start_ms"], 0)
+        self.assertLessEqual(rows[1]["end_ms"], rows[0]["end_ms"])
+
+    def test_exporters_write_one_line_per_span(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            paths = {fmt: os.path.join(tmp, f"traces.{fmt}") for fmt in tracing.TRACE_FORMATS}
+            tracer = tracing.Tracer([tracing.make_exporter(path, fmt) for fmt, path in paths.items()])
+            with tracer.span("query") as query:
+                with tracer.span("llm.complete", input_tokens=12):
+                    pass
+            for exporter in tracer.exporters:
+                exporter.close()
+            with open(paths["jsonl"]) as f:
+                lines = [json.loads(line) for line in f]
+            self.assertEqual([line["name"] for line in lines], ["llm.complete", "query"])
+            self.assertEqual(lines[0]["parent_id"], query.span_id)
+            self.assertEqual(lines[0]["attributes"], {"input_tokens": 12})
+            with open(paths["otlp"]) as f:
+                otlp = [json.loads(line)["resourceSpans"][0]["scopeSpans"][0]["spans"][0] for line in f]
+            self.assertEqual(otlp[0]["parentSpanId"], query.span_id)
+            self.assertEqual(otlp[0]["attributes"], [{"key": "input_tokens", "value": {"intValue": "12"}}])
+            self.assertEqual(otlp[1]["traceId"], query.trace_id)
+
+class TestClaudeSpans(unittest.TestCase):
+    def setUp(self):
+        self.server = FakeAnthropicServer(reply="Metformin is the usual first-line therapy.",
+                                          first_token_latency=0, token_interval=0).start()
+        self.claude = Claude(MODEL, "mock_api_key", base_url=self.server.base_url,
+                             policy=ResiliencePolicy(base_delay=0.01))
+
+    def tearDown(self):
+        self.server.stop()
+
+    def llm_spans(self, root):
+        return [span for span in tracing.tracer.trace(root.trace_id) if span.name.startswith("llm.")]
+
+    def test_calls_record_tokens_and_retries(self):
+        self.server.fail_next(529)
+        with tracing.span("turn") as turn:
+            self.claude.complete("How is diabetes treated?")
+            "".join(self.claude.stream_chat([{"role": "user", "content": "And in pregnancy?"}]))
+        complete, stream = self.llm_spans(turn)
+        self.assertEqual((complete.name, stream.name), ("llm.complete", "llm.stream_chat"))
+        self.assertEqual(complete.attributes["retries"], 1)
+        self.assertEqual(complete.attributes["model"], MODEL)
+        for span in (complete, stream):
+            self.assertGreater(span.attributes["input_tokens"], 0)
+            self.assertGreater(span.attributes["output_tokens"], 0)
+        self.assertIn("first_token_ms", stream.attributes)
+
+    def test_handled_errors_mark_the_span(self):
+        self.server.fail_next(400)
+        with tracing.span("turn") as turn:
+            self.assertEqual(self.claude.complete("How is diabetes treated?"), "")
+        self.assertEqual(self.llm_spans(turn)[0].error, "BadRequestError")
+
+    def test_concurrent_analysis_steps_share_the_trace(self):
+        async def analyze():
+            with tracing.span("turn") as turn:
+                await aprocess_healthcare_query("How is diabetes treated?", self.claude)
+            return turn
+        turn = asyncio.run(analyze())
+        spans = tracing.tracer.trace(turn.trace_id)
+        names = [span.name for span in spans]
+        for step in ("healthcare.process", "healthcare.categorize", "healthcare.key_points",
+                     "healthcare.format", "healthcare.follow_up"):
+            self.assertIn(step, names)
+        self.assertEqual(names.count("llm.complete"), 5)
+        self.assertTrue(all(span.trace_id == turn.trace_id for span in spans))
+        # Steps do not leak into the caller's context
+        self.assertIsNone(tracing.current_span())
+
+if __name__ == '__main__':
+    unittest.main()